@@ -0,0 +1,118 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+from threading import Lock
+
+class Histogram :
+    """Counts of values falling into power of two buckets, in milliseconds."""
+    BUCKETS = [2 ** power for power in range(17)]
+
+    def __init__(self) :
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value) :
+        index = 0
+        while index < len(self.BUCKETS) and value > self.BUCKETS[index] :
+            index += 1
+
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def percentile(self, fraction) :
+        target = fraction * self.count
+        seen = 0
+
+        for index, count in enumerate(self.counts) :
+            seen += count
+            if count and seen >= target :
+                return self.BUCKETS[index] if index < len(self.BUCKETS) else float('inf')
+
+        return 0
+
+    def snapshot(self) :
+        buckets = dict(('<=%d' % bound, count) for bound, count in zip(self.BUCKETS, self.counts) if count)
+        if self.counts[-1] :
+            buckets['>%d' % self.BUCKETS[-1]] = self.counts[-1]
+
+        return { 'count' : self.count,
+                 'mean' : self.total / self.count if self.count else 0.0,
+                 'p50' : self.percentile(0.5),
+                 'p95' : self.percentile(0.95),
+                 'buckets' : buckets }
+
+class EndpointStats :
+    def __init__(self) :
+        self.calls = 0
+        self.pages = 0
+        self.bytes = 0
+        self.quota = 0
+        self.errors = dict()
+        self.latency = Histogram()
+
+    def snapshot(self) :
+        return { 'calls' : self.calls, 'pages' : self.pages, 'bytes' : self.bytes,
+                 'quota' : self.quota, 'errors' : dict(self.errors),
+                 'latency' : self.latency.snapshot() }
+
+class ApiStats :
+    """Per endpoint registry of API call counts, sizes, latencies, quota use and errors."""
+
+    # Estimated quota units charged for each call, by method name
+    QUOTA_COSTS = { 'list' : 1, 'insert' : 50, 'update' : 50, 'delete' : 50 }
+
+    def __init__(self) :
+        self.lock = Lock()
+        self.endpoints = dict()
+
+    @classmethod
+    def cost(cls, endpoint, pages=1) :
+        return cls.QUOTA_COSTS.get(endpoint.split('.')[-1], 1) * pages
+
+    # sent is False for a call refused before it reached the API, which costs nothing
+    def record(self, endpoint, pages, size, seconds, error=None, sent=True) :
+        with self.lock :
+            stats = self.endpoints.get(endpoint)
+            if not stats :
+                stats = self.endpoints[endpoint] = EndpointStats()
+
+            stats.calls += 1
+            stats.pages += pages
+            stats.bytes += size
+            if sent :
+                stats.quota += self.cost(endpoint, max(pages, 1))
+                stats.latency.add(seconds * 1000.0)
+
+            if error :
+                stats.errors[error] = stats.errors.get(error, 0) + 1
+
+    def snapshot(self) :
+        with self.lock :
+            return dict((endpoint, stats.snapshot()) for endpoint, stats in self.endpoints.items())
+
+    def quotaUsed(self) :
+        with self.lock :
+            return sum([stats.quota for stats in self.endpoints.values()])
+
+    def dump(self, path) :
+        statsFile = open(path, 'w')
+        json.dump(self.snapshot(), statsFile, indent=2, sort_keys=True)
+        statsFile.close()
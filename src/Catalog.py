@@ -0,0 +1,269 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import sqlite3
+import time
+from threading import RLock
+
+class Catalog :
+    """SQLite store of videos, channels, playlists and cached responses, written as data arrives."""
+    SCHEMA_VERSION = 5
+    MAX_VARIABLES = 500
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS videos (id TEXT PRIMARY KEY, channelId TEXT,
+                                           uploadTime TEXT, data TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS videosByChannel ON videos (channelId, uploadTime);
+        CREATE INDEX IF NOT EXISTS videosByUploadTime ON videos (uploadTime);
+        CREATE TABLE IF NOT EXISTS channels (id TEXT PRIMARY KEY, fetched INTEGER, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS playlists (id TEXT PRIMARY KEY, data TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS playlistItems (playlistId TEXT, itemId TEXT, videoId TEXT,
+                                                  position INTEGER, PRIMARY KEY (playlistId, itemId));
+        CREATE INDEX IF NOT EXISTS playlistItemsByPosition ON playlistItems (playlistId, position);
+        CREATE INDEX IF NOT EXISTS playlistItemsByVideo ON playlistItems (videoId);
+        CREATE TABLE IF NOT EXISTS responses (signature TEXT PRIMARY KEY, etag TEXT,
+                                              body TEXT, used INTEGER);
+        CREATE INDEX IF NOT EXISTS responsesByUse ON responses (used);
+        CREATE TABLE IF NOT EXISTS feedResponses (url TEXT PRIMARY KEY, etag TEXT, body TEXT);
+        CREATE TABLE IF NOT EXISTS mutations (id INTEGER PRIMARY KEY AUTOINCREMENT, playlistId TEXT,
+                                              videoId TEXT, include INTEGER, attempts INTEGER, due REAL);
+        CREATE TABLE IF NOT EXISTS tombstones (id TEXT PRIMARY KEY, recorded INTEGER);
+        CREATE TABLE IF NOT EXISTS positions (videoId TEXT PRIMARY KEY, position REAL);
+    '''
+
+    def __init__(self, path) :
+        self.lock = RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.SCHEMA_VERSION :
+            self.db.executescript(self.SCHEMA)
+            self.db.execute('PRAGMA user_version=%d' % self.SCHEMA_VERSION)
+            self.db.commit()
+
+    def close(self) :
+        with self.lock :
+            self.db.close()
+
+    def __select(self, query, ids) :
+        rows = []
+
+        with self.lock :
+            for offset in range(0, len(ids), self.MAX_VARIABLES) :
+                chunk = ids[offset:offset + self.MAX_VARIABLES]
+                rows += self.db.execute(query % ','.join('?' * len(chunk)), chunk).fetchall()
+
+        return rows
+
+    def __write(self, query, rows) :
+        with self.lock :
+            with self.db :
+                self.db.executemany(query, rows)
+
+    def videos(self, ids) :
+        rows = self.__select('SELECT id, data FROM videos WHERE id IN (%s)', list(ids))
+        return { id : json.loads(data) for id, data in rows }
+
+    def storeVideos(self, items) :
+        self.__write('INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?)',
+                     [(item['id'], item['snippet']['channelId'], item['snippet']['publishedAt'],
+                       json.dumps(item)) for item in items])
+
+    def removeVideos(self, ids) :
+        self.__write('DELETE FROM videos WHERE id = ?', [(id,) for id in ids])
+
+    def videoCount(self) :
+        with self.lock :
+            return self.db.execute('SELECT COUNT(*) FROM videos').fetchone()[0]
+
+    def channels(self, ids, since=0) :
+        """(fetched, details) of each channel fetched at or after since, keyed by id."""
+        rows = self.__select('SELECT id, fetched, data FROM channels WHERE id IN (%s)', list(ids))
+        return { id : (fetched, json.loads(data)) for id, fetched, data in rows if fetched >= since }
+
+    def storeChannels(self, items) :
+        now = int(time.time())
+        self.__write('INSERT OR REPLACE INTO channels VALUES (?, ?, ?)',
+                     [(item['id'], now, json.dumps(item)) for item in items])
+
+    def tombstones(self, ids) :
+        """When each of the ids was last found to be unavailable, keyed by id."""
+        return dict(self.__select('SELECT id, recorded FROM tombstones WHERE id IN (%s)', list(ids)))
+
+    def storeTombstones(self, ids) :
+        now = int(time.time())
+        self.__write('INSERT OR REPLACE INTO tombstones VALUES (?, ?)', [(id, now) for id in ids])
+
+    def removeTombstones(self, ids) :
+        self.__write('DELETE FROM tombstones WHERE id = ?', [(id,) for id in ids])
+
+    def position(self, videoId) :
+        with self.lock :
+            row = self.db.execute('SELECT position FROM positions WHERE videoId = ?', (videoId,)).fetchone()
+
+        return row[0] if row else None
+
+    def storePosition(self, videoId, position) :
+        if position is None :
+            self.__write('DELETE FROM positions WHERE videoId = ?', [(videoId,)])
+        else :
+            self.__write('INSERT OR REPLACE INTO positions VALUES (?, ?)', [(videoId, position)])
+
+    def playlist(self, id) :
+        with self.lock :
+            row = self.db.execute('SELECT data FROM playlists WHERE id = ?', (id,)).fetchone()
+            if not row :
+                return None
+
+            items = self.db.execute('SELECT itemId, videoId FROM playlistItems WHERE playlistId = ? '
+                                    'ORDER BY position', (id,)).fetchall()
+
+        return json.loads(row[0]), items
+
+    def storePlaylist(self, id, details, items) :
+        """Record a playlist's new item order, writing only the items that changed.
+
+        items is an ordered list of (itemId, videoId) pairs."""
+        ids = [itemId for itemId, videoId in items]
+        kept = set(ids)
+
+        with self.lock :
+            with self.db :
+                self.db.execute('INSERT OR REPLACE INTO playlists VALUES (?, ?)', (id, json.dumps(details)))
+
+                #Compare with what is stored rather than what the caller last saw
+                previousIds = [row[0] for row in self.db.execute('SELECT itemId FROM playlistItems '
+                                                                 'WHERE playlistId = ? ORDER BY position', (id,))]
+                known = set(previousIds)
+                fresh = [item for item in items if not item[0] in known]
+
+                remaining = [itemId for itemId in previousIds if itemId in kept]
+                prepended = ids[len(fresh):] == remaining
+                appended = ids[:len(ids) - len(fresh)] == remaining
+
+                if prepended or appended :
+                    # Existing positions still hold, so only the changed rows are written
+                    first, last = self.db.execute('SELECT MIN(position), MAX(position) FROM playlistItems '
+                                                  'WHERE playlistId = ?', (id,)).fetchone()
+                    start = (first or 0) - len(fresh) if prepended else (last or 0) + 1
+                    self.db.executemany('DELETE FROM playlistItems WHERE playlistId = ? AND itemId = ?',
+                                        [(id, itemId) for itemId in previousIds if not itemId in kept])
+                    self.db.executemany('INSERT INTO playlistItems VALUES (?, ?, ?, ?)',
+                                        [(id, itemId, videoId, start + position)
+                                         for position, (itemId, videoId) in enumerate(fresh)])
+                else :
+                    self.db.execute('DELETE FROM playlistItems WHERE playlistId = ?', (id,))
+                    self.db.executemany('INSERT INTO playlistItems VALUES (?, ?, ?, ?)',
+                                        [(id, itemId, videoId, position)
+                                         for position, (itemId, videoId) in enumerate(items)])
+
+    def mutations(self) :
+        with self.lock :
+            return self.db.execute('SELECT id, playlistId, videoId, include, attempts, due FROM mutations '
+                                   'ORDER BY id').fetchall()
+
+    def storeMutation(self, playlistId, videoId, include, due) :
+        with self.lock :
+            with self.db :
+                return self.db.execute('INSERT INTO mutations (playlistId, videoId, include, attempts, due) '
+                                       'VALUES (?, ?, ?, 0, ?)', (playlistId, videoId, int(include), due)).lastrowid
+
+    def retryMutation(self, id, attempts, due) :
+        self.__write('UPDATE mutations SET attempts = ?, due = ? WHERE id = ?', [(attempts, due, id)])
+
+    def removeMutations(self, ids) :
+        self.__write('DELETE FROM mutations WHERE id = ?', [(id,) for id in ids])
+
+    def response(self, signature) :
+        with self.lock :
+            row = self.db.execute('SELECT etag, body FROM responses WHERE signature = ?',
+                                  (signature,)).fetchone()
+
+        return (row[0], json.loads(row[1])) if row else None
+
+    def storeResponse(self, signature, etag, body) :
+        self.__write('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                     [(signature, etag, json.dumps(body), int(time.time()))])
+
+    def touchResponse(self, signature) :
+        self.__write('UPDATE responses SET used = ? WHERE signature = ?', [(int(time.time()), signature)])
+
+    def trimResponses(self, maxEntries) :
+        self.__write('DELETE FROM responses WHERE signature NOT IN '
+                     '(SELECT signature FROM responses ORDER BY used DESC LIMIT ?)', [(maxEntries,)])
+
+    def feedResponse(self, url) :
+        """(etag, body) last stored for a feed, kept apart from the trimmed API responses."""
+        with self.lock :
+            row = self.db.execute('SELECT etag, body FROM feedResponses WHERE url = ?', (url,)).fetchone()
+
+        return (row[0], json.loads(row[1])) if row else None
+
+    def storeFeedResponse(self, url, etag, body) :
+        self.__write('INSERT OR REPLACE INTO feedResponses VALUES (?, ?, ?)', [(url, etag, json.dumps(body))])
+
+class CatalogMapping :
+    """Dict-like view over catalog rows that only builds objects for the ids asked for."""
+
+    def __init__(self, load, create) :
+        self.load = load
+        self.create = create
+        self.lock = RLock()
+        self.cache = dict()
+
+    def fetch(self, ids) :
+        with self.lock :
+            missing = [id for id in ids if not id in self.cache]
+
+            if missing :
+                for id, row in self.load(missing).items() :
+                    self.cache[id] = self.create(row)
+
+            return { id : self.cache[id] for id in ids if id in self.cache }
+
+    def get(self, id, default=None) :
+        return self.fetch([id]).get(id, default)
+
+    def __contains__(self, id) :
+        return self.get(id) is not None
+
+    def __getitem__(self, id) :
+        value = self.get(id)
+
+        if value is None :
+            raise KeyError(id)
+
+        return value
+
+    def __setitem__(self, id, value) :
+        with self.lock :
+            self.cache[id] = value
+
+    def update(self, values) :
+        with self.lock :
+            self.cache.update(values)
+
+    def discard(self, ids) :
+        with self.lock :
+            for id in ids :
+                self.cache.pop(id, None)
+
+    def values(self) :
+        return self.cache.values()
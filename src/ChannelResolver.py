@@ -0,0 +1,101 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from threading import RLock
+
+class ChannelResolver :
+    """Channel details by id from memory, then the catalog, then the API for whatever is left.
+
+    Entries older than ttl seconds are fetched again. fetch is given every missing id at
+    once and is expected to split them into calls of at most 50."""
+
+    def __init__(self, catalog, fetch, ttl) :
+        self.catalog = catalog
+        self.fetch = fetch
+        self.ttl = ttl
+        self.lock = RLock()
+        self.entries = dict()
+        self.counts = { 'memory' : 0, 'disk' : 0, 'fetched' : 0, 'fetches' : 0 }
+
+    def get(self, id) :
+        return self.resolve([id]).get(id)
+
+    def __contains__(self, id) :
+        return self.get(id) is not None
+
+    def __getitem__(self, id) :
+        item = self.get(id)
+
+        if item is None :
+            raise KeyError(id)
+
+        return item
+
+    def resolve(self, ids) :
+        """Details of each id that exists, keyed by id."""
+        with self.lock :
+            expiry = time.time() - self.ttl
+            result = dict()
+            missing = []
+
+            for id in ids :
+                entry = self.entries.get(id)
+                if entry and entry[0] >= expiry :
+                    result[id] = entry[1]
+                elif not id in missing :
+                    missing.append(id)
+
+            self.counts['memory'] += len(result)
+
+            if missing :
+                stored = self.catalog.channels(missing, expiry)
+                self.entries.update(stored)
+                self.counts['disk'] += len(stored)
+
+                for id, (fetched, item) in stored.items() :
+                    result[id] = item
+
+                missing = [id for id in missing if not id in stored]
+
+            if missing :
+                result.update(self.refresh(missing))
+
+            return result
+
+    def refresh(self, ids) :
+        """Fetch the ids from the API whether or not they are cached."""
+        with self.lock :
+            items = self.fetch(ids) if ids else []
+            self.counts['fetches'] += 1
+            self.counts['fetched'] += len(items)
+            self.store(items)
+
+            return dict((item['id'], item) for item in items)
+
+    def store(self, items) :
+        with self.lock :
+            now = time.time()
+            self.catalog.storeChannels(items)
+
+            for item in items :
+                self.entries[item['id']] = (now, item)
+
+    def stats(self) :
+        with self.lock :
+            return dict(self.counts)
@@ -0,0 +1,146 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import httplib
+import socket
+import urlparse
+import xml.etree.ElementTree as ET
+from threading import Lock, local
+
+from WorkerPool import WorkerPool
+
+class FeedError(Exception) :
+    pass
+
+class FeedFetcher :
+    """Conditional GETs of YouTube's public Atom feeds over a fixed number of keep-alive connections.
+
+    Each worker keeps one connection per host. The ETag and Last-Modified of every feed are
+    kept in the catalog with the video ids it listed, so an unchanged feed costs one 304."""
+    ENTRY_TAG = '{http://www.w3.org/2005/Atom}entry'
+    VIDEO_ID_TAG = '{http://www.youtube.com/xml/schemas/2015}videoId'
+
+    def __init__(self, connections, catalog=None, timeout=30) :
+        self.pool = WorkerPool(connections, timeout)
+        self.catalog = catalog
+        self.timeout = timeout
+        self.local = local()
+        self.lock = Lock()
+        self.open = set()
+        self.counts = { 'fetched' : 0, 'notModified' : 0, 'failed' : 0, 'connections' : 0 }
+
+    def fetchAll(self, urls) :
+        """Futures of the video ids in each feed, in the same order as urls."""
+        return self.pool.map(self.fetch, urls)
+
+    def fetch(self, url) :
+        """Video ids listed by the feed at url, newest first."""
+        stored = self.catalog.feedResponse(url) if self.catalog else None
+        headers = dict()
+
+        if stored :
+            etag, body = stored
+            if etag :
+                headers['If-None-Match'] = etag
+            if body.get('modified') :
+                headers['If-Modified-Since'] = body['modified']
+
+        try :
+            status, response, content = self.request(url, headers)
+        except (httplib.HTTPException, socket.error), e :
+            self.count('failed')
+            raise FeedError('Unable to fetch %s: %s' % (url, repr(e)))
+
+        if status == 304 and stored :
+            self.count('notModified')
+            return stored[1]['ids']
+
+        if status != 200 :
+            self.count('failed')
+            raise FeedError('Unable to fetch %s (status %d)' % (url, status))
+
+        ids = self.parse(content)
+        self.count('fetched')
+
+        if self.catalog :
+            self.catalog.storeFeedResponse(url, response.getheader('etag'),
+                                           { 'modified' : response.getheader('last-modified'), 'ids' : ids })
+
+        return ids
+
+    def parse(self, content) :
+        try :
+            root = ET.fromstring(content)
+        except ET.ParseError, e :
+            raise FeedError('Invalid feed: %s' % e)
+
+        return [entry.findtext(self.VIDEO_ID_TAG) for entry in root.iter(self.ENTRY_TAG)
+                if entry.findtext(self.VIDEO_ID_TAG)]
+
+    def request(self, url, headers) :
+        parts = urlparse.urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+
+        #A kept alive connection may have been closed by the server since, so try a fresh one once
+        for attempt in range(2) :
+            connection = self.connection(parts.scheme, parts.netloc, attempt > 0)
+            try :
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                return response.status, response, response.read()
+            except (httplib.HTTPException, socket.error) :
+                connection.close()
+                if attempt :
+                    raise
+
+    def connection(self, scheme, host, fresh=False) :
+        if not hasattr(self.local, 'connections') :
+            self.local.connections = dict()
+
+        key = (scheme, host)
+        if fresh or not key in self.local.connections :
+            create = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+            connection = create(host, timeout=self.timeout)
+
+            with self.lock :
+                self.open.discard(self.local.connections.get(key))
+                self.open.add(connection)
+
+            self.local.connections[key] = connection
+            self.count('connections')
+
+        return self.local.connections[key]
+
+    def close(self) :
+        """Stop the workers and close the connections they kept alive."""
+        self.pool.shutdown()
+
+        with self.lock :
+            connections, self.open = self.open, set()
+
+        for connection in connections :
+            connection.close()
+
+    def count(self, name) :
+        with self.lock :
+            self.counts[name] += 1
+
+    def stats(self) :
+        with self.lock :
+            return dict(self.counts)
@@ -0,0 +1,36 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+
+class FeedMerge :
+    """Merges newest first streams of videos into one newest first feed."""
+
+    def __init__(self, time=lambda video : video.uploadEpoch()) :
+        self.time = time
+        self.streams = []
+
+    def add(self, videos) :
+        """Add a stream's videos, newest first."""
+        #The stream and position keep equal times stable and avoid comparing videos
+        stream = len(self.streams)
+        self.streams.append([(-self.time(video), stream, position, video)
+                             for position, video in enumerate(videos)])
+
+    def take(self) :
+        return [entry[-1] for entry in heapq.merge(*self.streams)]
@@ -0,0 +1,180 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from threading import Condition, Thread
+
+class Mutation :
+    def __init__(self, id, playlistId, videoId, include, attempts=0, due=0.0) :
+        self.id = id
+        self.playlistId = playlistId
+        self.videoId = videoId
+        self.include = bool(include)
+        self.attempts = attempts
+        self.due = due
+
+    def key(self) :
+        return (self.playlistId, self.videoId)
+
+class MutationQueue :
+    """Playlist inserts and deletes applied one at a time on a background thread.
+
+    Mutations are kept in the catalog until they succeed or fail for good, so they survive
+    a restart. Adding and then removing the same video before either reaches the API
+    cancels both, and transient failures are retried with exponential backoff."""
+    BACKOFF = 2.0
+    MAX_BACKOFF = 300.0
+    MAX_ATTEMPTS = 8
+
+    def __init__(self, catalog, execute, listener=None, transient=lambda error : True) :
+        self.catalog = catalog
+        self.execute = execute
+        self.listener = listener
+        self.transient = transient
+        self.condition = Condition()
+        self.pending = [Mutation(*row) for row in catalog.mutations()]
+        self.running = None
+        self.thread = None
+        self.stopped = False
+        self.counts = { 'queued' : 0, 'cancelled' : 0, 'retried' : 0, 'failed' : 0, 'applied' : 0 }
+
+    def start(self) :
+        with self.condition :
+            if not self.thread :
+                self.stopped = False
+                self.thread = Thread(target=self.__run)
+                self.thread.daemon = True
+                self.thread.start()
+
+    def stop(self, timeout=None) :
+        """Stop the thread, waiting up to timeout for a mutation that is being sent."""
+        with self.condition :
+            self.stopped = True
+            self.condition.notify_all()
+            thread = self.thread
+
+        if thread :
+            thread.join(timeout)
+
+    def add(self, playlistId, videoId, include) :
+        """Queue a change, returning the mutation that will carry it or None if it cancelled one out."""
+        with self.condition :
+            self.counts['queued'] += 1
+            mutation = Mutation(None, playlistId, videoId, include)
+            queued = self.__cancel(mutation)
+
+            if queued is mutation :
+                mutation.due = time.time()
+                mutation.id = self.catalog.storeMutation(playlistId, videoId, include, mutation.due)
+                self.pending.append(mutation)
+                self.condition.notify_all()
+
+            return queued
+
+    def __cancel(self, mutation) :
+        for other in self.pending :
+            if other.key() == mutation.key() :
+                if other.include == mutation.include :
+                    return other
+
+                #Neither has reached the API so both can be dropped
+                self.pending.remove(other)
+                self.catalog.removeMutations([other.id])
+                self.counts['cancelled'] += 2
+                return None
+
+        return mutation
+
+    def size(self) :
+        with self.condition :
+            return len(self.pending) + (1 if self.running else 0)
+
+    def flush(self, timeout=None) :
+        """Wait until the queue is empty, including retries, returning False at the timeout."""
+        deadline = time.time() + timeout if timeout != None else None
+
+        with self.condition :
+            while self.running or self.pending :
+                remaining = deadline - time.time() if deadline != None else None
+                if remaining != None and remaining <= 0 :
+                    return False
+
+                self.condition.wait(remaining)
+
+        return True
+
+    def stats(self) :
+        with self.condition :
+            return dict(self.counts, pending=len(self.pending))
+
+    def __next(self) :
+        now = time.time()
+        due = [mutation for mutation in self.pending if mutation.due <= now]
+        return due[0] if due else None
+
+    def __wait(self) :
+        if not self.pending :
+            return None
+
+        return max(0.0, min([mutation.due for mutation in self.pending]) - time.time())
+
+    def __run(self) :
+        while True :
+            with self.condition :
+                mutation = self.__next()
+                while mutation is None and not self.stopped :
+                    self.condition.wait(self.__wait())
+                    mutation = self.__next()
+
+                if self.stopped :
+                    self.thread = None
+                    return
+
+                self.pending.remove(mutation)
+                self.running = mutation
+
+            result = error = None
+            try :
+                result = self.execute(mutation)
+            except Exception, e :
+                error = e
+
+            with self.condition :
+                retry = error and self.transient(error) and mutation.attempts + 1 < self.MAX_ATTEMPTS
+
+                if retry :
+                    mutation.attempts += 1
+                    mutation.due = time.time() + min(self.MAX_BACKOFF, self.BACKOFF * 2 ** (mutation.attempts - 1))
+                    self.counts['retried'] += 1
+                    self.catalog.retryMutation(mutation.id, mutation.attempts, mutation.due)
+
+                    #A change queued while this one was running may now cancel or repeat it
+                    if self.__cancel(mutation) is mutation :
+                        self.pending.insert(0, mutation)
+                    else :
+                        self.catalog.removeMutations([mutation.id])
+                else :
+                    self.counts['failed' if error else 'applied'] += 1
+                    self.catalog.removeMutations([mutation.id])
+
+            if self.listener and not retry :
+                self.listener(mutation, result, error)
+
+            with self.condition :
+                self.running = None
+                self.condition.notify_all()
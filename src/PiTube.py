@@ -42,10 +42,15 @@ from gettext import gettext as _
 #import compiler
             
 class VideoListFrame(QWidget):
+    videoUpdated = Signal(object, bool)
+    staleChanged = Signal(bool)
+    
     def __init__(self, parent, playlist, videoManager):
         QWidget.__init__(self, parent)
         self.playlist = playlist
-        playlist.setUpdateListener(self.refresh)
+        self.stale = False
+        self.videoUpdated.connect(self.updateVideo, Qt.QueuedConnection)
+        playlist.setUpdateListener(self.videoUpdated.emit)
         
         self.refresh()
         self.more = None
@@ -68,32 +73,120 @@ class VideoListFrame(QWidget):
         self.startRow = 0
         self.row = 0
         self.loader = PlaylistLoader(self, self.playlist)
-        self.loader.playlistLoaded.connect(self.loadVideos, Qt.QueuedConnection)
-        pass
+        self.loader.playlistStale.connect(self.showStale, Qt.QueuedConnection)
+        self.loader.playlistLoaded.connect(self.loaded, Qt.QueuedConnection)
+        self.loader.start()
     
     def addVideo(self, video) :
         frame = VideoFrame(self, self.row, video)
         self.frames.append(frame)
         self.row += 3
         
-    def loadVideos(self) :
+    def loadVideos(self, count=10) :
         if self.more :
             self.more.setVisible(False)
+            self.more = None
             
         if self.row == 0 :
             self.progressWidget.setVisible(False)
             
         playlistLen = len(self.playlist.result())
-        endRow = min(self.startRow + 10, playlistLen)
-        for video in self.playlist.result()[self.startRow:self.startRow + 10] :
+        endRow = min(self.startRow + count, playlistLen)
+        for video in self.playlist.result()[self.startRow:endRow] :
             self.addVideo(video)
             
-        if endRow < playlistLen :
+        self.startRow = endRow
+        self.showMoreButton()
+        
+    def showStale(self) :
+        #Show what was saved last time while the playlist is fetched again
+        self.stale = True
+        self.staleChanged.emit(True)
+        self.loadVideos()
+        
+    def loaded(self) :
+        if not self.stale :
+            self.loadFirst()
+            return
+        
+        #Keep the rows that are still right and only replace those after the first change
+        self.stale = False
+        self.staleChanged.emit(False)
+        videos = self.playlist.result()
+        shownCount = len(self.frames)
+        same = 0
+        while same < min(shownCount, len(videos)) and self.frames[same].videoHandler() is videos[same] :
+            same += 1
+            
+        if same == shownCount == len(videos) :
+            return
+        
+        for frame in self.frames[same:] :
+            frame.setVisible(False)
+            
+        self.frames = self.frames[:same]
+        self.startRow = same
+        self.loadVideos(max(shownCount, 10) - same)
+        
+    def loadFirst(self) :
+        #Only the first page is shown, anything after that waits for Load more
+        if self.startRow < 10 :
+            self.loadVideos(10 - self.startRow)
+        else :
+            self.showMoreButton()
+            
+    def showMoreButton(self) :
+        if not self.more and (self.startRow < len(self.playlist.result()) or self.playlist.hasMore()) :
             self.more = QPushButton('Load more')
-            self.more.clicked.connect(self.loadVideos)
+            self.more.clicked.connect(self.loadMore)
             self.layout().addWidget(self.more, self.row, 1, 1, 1, Qt.AlignCenter)
+        
+    def updateVideo(self, video, include) :
+        #Keep the rows already shown in step with the playlist without loading it again
+        if include :
+            try :
+                position = self.playlist.result().index(video)
+            except ValueError :
+                return
             
-        self.startRow = endRow
+            if position < self.startRow :
+                #A grid can't open a gap so the rows from the new video down are laid out again
+                shownCount = len(self.frames)
+                for frame in self.frames[position:] :
+                    frame.setVisible(False)
+
+                self.frames = self.frames[:position]
+                self.startRow = position
+                self.loadVideos(shownCount + 1 - position)
+                return
+        else :
+            for frame in [frame for frame in self.frames if frame.videoHandler() is video] :
+                frame.setVisible(False)
+                self.frames.remove(frame)
+                self.startRow -= 1
+                
+        if self.more :
+            self.more.setVisible(False)
+            self.more = None
+            
+        self.showMoreButton()
+            
+    def loadMore(self) :
+        if not self.more or not self.more.isEnabled() :
+            return
+        
+        if self.startRow < len(self.playlist.result()) :
+            self.loadVideos()
+        else :
+            #Everything fetched so far is shown so ask the playlist for its next page
+            self.more.setEnabled(False)
+            self.pageLoader = PageLoader(self, self.playlist)
+            self.pageLoader.playlistLoaded.connect(self.loadVideos, Qt.QueuedConnection)
+            self.pageLoader.start()
+            
+    def scrolled(self, value) :
+        if value == self.sender().maximum() :
+            self.loadMore()
         
 '''        
     def contextMenuEvent(self, event) :
@@ -106,15 +199,28 @@ class VideoListFrame(QWidget):
 
 class PlaylistLoader(QThread) :
     playlistLoaded = Signal()
+    playlistStale = Signal()
     
     def __init__(self, parent, playlist) :
         QThread.__init__(self, parent)
         self.parent = parent
         self.playlist = playlist
-        self.start()
         
     def run(self) :
-        self.playlist.execute()
+        if self.playlist.cached() :
+            self.playlistStale.emit()
+            
+            #The saved copy is on screen so checking it can wait behind requests the user is waiting on
+            with self.playlist.background() :
+                self.playlist.execute()
+        else :
+            self.playlist.execute()
+            
+        self.playlistLoaded.emit()
+    
+class PageLoader(PlaylistLoader) :
+    def run(self) :
+        self.playlist.fetchMore()
         self.playlistLoaded.emit()
     
 class ThumbnailLoader(QThread) :
@@ -130,6 +236,20 @@ class ThumbnailLoader(QThread) :
         self.parent.videoHandler().downloadThumbnail()
         self.finished.emit()
         
+class DescriptionLoader(QThread) :
+    finished = Signal()
+        
+    def __init__(self, parent) :
+        QThread.__init__(self, parent)
+        self.parent = parent
+        self.finished.connect(parent.displayDescription, Qt.QueuedConnection)
+        self.start()
+        
+    def run(self) :
+        #Fetching the description may need a round-trip so keep it off the GUI thread
+        self.parent.videoHandler().description()
+        self.finished.emit()
+        
 class AddToCommand(QObject) :
     def __init__(self, videoFrame, playlist) :
         self.videoFrame = videoFrame
@@ -242,6 +362,7 @@ class VideoFrame(QObject) :
         self.thumbnailCanvas.setScaledContents(True)
         self.thumbnailCanvas.setStyleSheet('margin : 20px')
         layout.addWidget(self.thumbnailCanvas, row, 0, 3, 1, Qt.AlignCenter)
+        self.widgets = [self.thumbnailCanvas]
         ThumbnailLoader(self)
         
         infoTop = QHBoxLayout()
@@ -258,14 +379,11 @@ class VideoFrame(QObject) :
         channel.clicked.connect(self.emitChannelClicked)
         channel.setStyleSheet(settings.get("channel-style", "text-align : left"))
         infoTop.addWidget(channel)       
+        self.widgets += [title, channel]
         
         parent.layout().addLayout(infoTop, row, 1)
         
-        description = "No description"
-        if videoHandler.description() :
-            description = videoHandler.description()
-            
-        descriptionText = QLabel(description)
+        descriptionText = QLabel()
         descriptionText.setAlignment(Qt.AlignTop)
         descriptionText.setWordWrap(True)
         descriptionText.setFixedHeight(100)
@@ -274,10 +392,13 @@ class VideoFrame(QObject) :
                                                   QSizePolicy.Fixed))
         descriptionText.setMinimumWidth(600)
         parent.layout().addWidget(descriptionText, row + 1, 1, 2, 1)
+        self.descriptionText = descriptionText
+        DescriptionLoader(self)
         
-        uploadTime = QLabel(self.getTimeSince(videoHandler.uploadTime()))
+        uploadTime = QLabel(self.getTimeSince(videoHandler.uploadTime()) if videoHandler.available() else '')
         uploadTime.setStyleSheet(settings.get("uploadtime-style", "text-align : right; vertical-align : center"))
         layout.addWidget(uploadTime, row, 2)
+        self.widgets += [descriptionText, uploadTime]
        
         self.optionsBar = QHBoxLayout()
         
@@ -292,6 +413,7 @@ class VideoFrame(QObject) :
         self.preload.setStatePixmap(self.pixmaps['preloadDisabled'], False)
         self.preload.setState(videoHandler.finishedDownload())
         self.preload.toggled.connect(self.__togglePreload)
+        self.preload.setEnabled(videoHandler.available())
         self.optionsBar.addWidget(self.preload)
 
         self.favourite = ToggleLabel()
@@ -309,6 +431,7 @@ class VideoFrame(QObject) :
         self.watchlater.setState(self.watchlaterPlaylist.contains(videoHandler))
         self.watchlater.toggled.connect(self.__toggleWatchlater)
         self.optionsBar.addWidget(self.watchlater)
+        frame.updateRejected.connect(self.updateRejected, Qt.QueuedConnection)
         
         layout.addLayout(self.optionsBar, row + 1, 2)
         
@@ -316,11 +439,19 @@ class VideoFrame(QObject) :
         self.progressBar.setMaximumWidth(150)
         self.progressBar.setVisible(False)
         layout.addWidget(self.progressBar, row + 2, 2)
+        self.widgets += [self.preload, self.favourite, self.watchlater]
         
         #self.createContextMenu()
         
     def videoHandler(self) :
         return self.__videoHandler
+    
+    def setVisible(self, visible) :
+        for widget in self.widgets :
+            widget.setVisible(visible)
+            
+        if not visible :
+            self.progressBar.setVisible(False)
        
     def createContextMenu(self) :
         #self.setContextMenuPolicy(Qt.ActionsContextMenu)
@@ -351,6 +482,11 @@ class VideoFrame(QObject) :
         playlist.update(self.videoHandler(), include)
     
     def __play(self) :
+        if not self.videoHandler().available() :
+            return
+        
+        self.videoHandler().manager.played(self.videoHandler(), self.parent().playlist)
+        
         if not self.videoHandler().startedDownload() :
             self.__togglePreload(True)
             
@@ -362,6 +498,7 @@ class VideoFrame(QObject) :
         OMXPlayer(frame, self.videoHandler())
     
     def __togglePreload(self, state) :
+        self.videoHandler().service().manager().prefetcher.claim(self.videoHandler())
         if state :
             self.videoHandler().startDownload()
             monitor = frame.downloadProgressMonitor.add(self.videoHandler())
@@ -370,6 +507,16 @@ class VideoFrame(QObject) :
             self.videoHandler().stopDownload()
             self.videoHandler().removeFile()
                         
+    def updateRejected(self, video, playlist, include) :
+        if video.id() != self.videoHandler().id() :
+            return
+        
+        #The toggle changed before the update was sent, put it back
+        if playlist.id() == self.favouritePlaylist.id() :
+            self.favourite.setState(not include)
+        elif playlist.id() == self.watchlaterPlaylist.id() :
+            self.watchlater.setState(not include)
+                        
     def __toggleFavourite(self, state) :
         self.updatePlaylist(self.favouritePlaylist, state)
         
@@ -401,6 +548,13 @@ class VideoFrame(QObject) :
 	painter.end()
         self.thumbnailCanvas.setPixmap(thumbnail)
             
+    def displayDescription(self) :
+        description = "No description"
+        if self.videoHandler().description() :
+            description = self.videoHandler().description()
+            
+        self.descriptionText.setText(description)
+            
     def getTimeSince(self, uploadTime) :
         diff = datetime.now() - uploadTime
         
@@ -434,6 +588,8 @@ class PlaylistViewHandler(QObject) :
             
 
 class PiTube(QMainWindow) :
+    updateRejected = Signal(object, object, bool)
+    
     def __init__(self, parent=None) :
         QMainWindow.__init__(self, parent)
         self.setWindowTitle(APPLICATION_NAME)
@@ -445,6 +601,7 @@ class PiTube(QMainWindow) :
         self.videoManager = VideoManager()
         self.youtubeservice = YouTubeService(self.videoManager)
         self.videoManager.addService('YouTube', self.youtubeservice)
+        self.videoManager.setRejectListener(self.updateRejected.emit)
         self.downloadProgressMonitor = DownloadProgressThread(self)
         
         self.tabs = QTabWidget(self)
@@ -461,6 +618,7 @@ class PiTube(QMainWindow) :
         
         try :
             self.youtubeservice.postAuthentication()
+            self.videoManager.prefetcher.start()
             self.createViewMenu()
             self.parseArgs()
         except ServerNotFoundError, exp :
@@ -499,6 +657,7 @@ class PiTube(QMainWindow) :
             id = match.lastmatch.group(1)
             vidid = lambda val : val
             video = self.youtubeservice.fetchVideos([id], vidid, vidid)[id]
+            self.videoManager.played(video)
             video.startDownload()
             OMXPlayer(self, video)
             
@@ -574,6 +733,10 @@ class PiTube(QMainWindow) :
         #scrollArea.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         scrollArea.setWidgetResizable(True)
         scrollArea.setWidget(frame)
+        scrollArea.verticalScrollBar().valueChanged.connect(frame.scrolled)
+        staleIcon = self.style().standardIcon(QStyle.SP_BrowserReload)
+        frame.staleChanged.connect(lambda stale : self.tabs.setTabIcon(self.tabs.indexOf(scrollArea), 
+                                                                       staleIcon if stale else QIcon()))
         
         if self.actions[title].name :
             self.viewSettings.set(self.actions[title].name, True)
@@ -0,0 +1,165 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import random
+import time
+from threading import Condition, local
+
+class QuotaExceededError(Exception) :
+    pass
+
+class RateLimiter :
+    """Token bucket of API quota units with a daily budget on top.
+
+    Tokens come back at rate units a second up to burst. Callers inside background() leave
+    the last reserve fraction of the bucket and of the day's budget to interactive callers,
+    and wait while any interactive caller is waiting. A throttled response pauses everyone
+    for an exponentially growing, jittered delay."""
+    BACKOFF = 1.0
+    MAX_BACKOFF = 64.0
+    MAX_RETRIES = 5
+    #The API's quota day starts at midnight Pacific time
+    DAY_OFFSET = -8 * 3600
+
+    def __init__(self, rate, burst, dailyQuota, reserve=0.2, used=0, day=None) :
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.dailyQuota = dailyQuota
+        self.reserve = reserve
+        self.condition = Condition()
+        self.local = local()
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.day = day if day != None else self.today()
+        self.used = used if self.day == self.today() else 0
+        self.pausedUntil = 0.0
+        self.interactive = 0
+        self.counts = { 'requests' : 0, 'background' : 0, 'waited' : 0, 'backoffs' : 0, 'refused' : 0 }
+
+    def today(self) :
+        return int((time.time() + self.DAY_OFFSET) // 86400)
+
+    def background(self) :
+        """Context manager marking the requests made by this thread inside it as background work."""
+        return BackgroundPriority(self.local)
+
+    def isBackground(self) :
+        return getattr(self.local, 'depth', 0) > 0
+
+    def acquire(self, cost) :
+        """Block until cost units may be spent, raising QuotaExceededError if the day's budget can't cover them."""
+        background = self.isBackground()
+
+        with self.condition :
+            self.counts['requests'] += 1
+            if background :
+                self.counts['background'] += 1
+            else :
+                self.interactive += 1
+
+            try :
+                waited = False
+                while True :
+                    self.__refill()
+
+                    if self.used + cost > self.budget(background) :
+                        self.counts['refused'] += 1
+                        raise QuotaExceededError('%d of %d quota units used today' % (self.used, self.dailyQuota))
+
+                    delay = self.__delay(cost, background)
+                    if delay == 0 :
+                        break
+
+                    waited = True
+                    self.condition.wait(delay)
+
+                if waited :
+                    self.counts['waited'] += 1
+
+                self.tokens -= cost
+                self.used += cost
+            finally :
+                if not background :
+                    self.interactive -= 1
+                    self.condition.notify_all()
+
+    def budget(self, background=False) :
+        return self.dailyQuota * (1 - self.reserve) if background else self.dailyQuota
+
+    def backoff(self, attempt) :
+        """Hold every caller back after the attempt'th throttled response, returning the delay."""
+        delay = min(self.MAX_BACKOFF, self.BACKOFF * 2 ** (attempt - 1))
+        delay = random.uniform(delay / 2, delay)
+
+        with self.condition :
+            self.counts['backoffs'] += 1
+            self.pausedUntil = max(self.pausedUntil, time.time() + delay)
+            self.condition.notify_all()
+
+        return delay
+
+    def exhaust(self) :
+        """The API says today's quota is spent whatever we counted."""
+        with self.condition :
+            self.used = max(self.used, self.dailyQuota)
+            self.condition.notify_all()
+
+    def state(self) :
+        with self.condition :
+            return self.used, self.day
+
+    def stats(self) :
+        with self.condition :
+            self.__refill()
+            return dict(self.counts, used=self.used, remaining=max(0, self.dailyQuota - self.used),
+                        tokens=int(self.tokens))
+
+    def __refill(self) :
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.today() != self.day :
+            self.day = self.today()
+            self.used = 0
+
+    def __delay(self, cost, background) :
+        """Seconds until the request could go, 0 if it can go now or None to wait for an interactive caller."""
+        now = time.time()
+        if now < self.pausedUntil :
+            return self.pausedUntil - now
+
+        if background and self.interactive :
+            return None
+
+        #A request bigger than the bucket only needs it full, the tokens go negative to pay it off
+        floor = self.burst * self.reserve if background else 0.0
+        needed = min(cost + floor, self.burst) - self.tokens
+
+        return needed / self.rate if needed > 0 else 0
+
+class BackgroundPriority :
+    def __init__(self, local) :
+        self.local = local
+
+    def __enter__(self) :
+        self.local.depth = getattr(self.local, 'depth', 0) + 1
+
+    def __exit__(self, type, value, traceback) :
+        self.local.depth -= 1
@@ -0,0 +1,87 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from collections import OrderedDict
+from threading import Lock
+
+class ResponseCache :
+    """Last response body and ETag for each request URI, evicted least recently used first.
+
+    Entries are written through to the catalog when one is given and read back on demand."""
+
+    def __init__(self, maxEntries, catalog=None) :
+        self.maxEntries = maxEntries
+        self.catalog = catalog
+        self.lock = Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        if catalog :
+            catalog.trimResponses(maxEntries)
+
+    def etag(self, signature) :
+        with self.lock :
+            entry = self.entries.get(signature)
+
+            if not entry and self.catalog :
+                entry = self.catalog.response(signature)
+                if entry :
+                    self.entries[signature] = entry
+
+            return entry[0] if entry else None
+
+    def hit(self, signature) :
+        """Body of a response the server said is unchanged, None if it has been evicted since."""
+        with self.lock :
+            entry = self.entries.pop(signature, None)
+
+            if not entry and self.catalog :
+                entry = self.catalog.response(signature)
+
+            if not entry :
+                return None
+
+            etag, body = entry
+            self.entries[signature] = (etag, body)
+            self.hits += 1
+
+            if self.catalog :
+                #Trimming keeps the most recently used, not the most recently written
+                self.catalog.touchResponse(signature)
+
+            return body
+
+    def store(self, signature, body) :
+        with self.lock :
+            self.misses += 1
+            self.entries.pop(signature, None)
+
+            if 'etag' in body :
+                self.entries[signature] = (body['etag'], body)
+
+                if self.catalog :
+                    self.catalog.storeResponse(signature, body['etag'], body)
+
+            while len(self.entries) > self.maxEntries :
+                self.entries.popitem(False)
+
+    def stats(self) :
+        with self.lock :
+            return { 'hits' : self.hits, 'misses' : self.misses, 'entries' : len(self.entries) }
@@ -0,0 +1,59 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from threading import Lock
+from WorkerPool import Future
+
+class SingleFlight :
+    """Lets callers asking for the same key at the same time share one piece of work.
+
+    The first caller for a key leads and does the work. Anyone who joins before it
+    finishes follows and is handed the leader's result or error."""
+
+    def __init__(self) :
+        self.lock = Lock()
+        self.flights = dict()
+        self.counts = { 'led' : 0, 'shared' : 0 }
+
+    def join(self, key) :
+        """The key's future and whether this caller leads it and must finish it."""
+        with self.lock :
+            future = self.flights.get(key)
+
+            if future :
+                self.counts['shared'] += 1
+                return future, False
+
+            future = self.flights[key] = Future()
+            self.counts['led'] += 1
+            return future, True
+
+    def finish(self, key, future, value=None, error=None) :
+        with self.lock :
+            if self.flights.get(key) is future :
+                del self.flights[key]
+
+        if error :
+            future.setError(error)
+        else :
+            future.setResult(value)
+
+    def stats(self) :
+        with self.lock :
+            return dict(self.counts, inflight=len(self.flights))
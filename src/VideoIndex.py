@@ -0,0 +1,112 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_left, bisect_right, insort
+from threading import RLock
+
+class VideoIndex :
+    """Lookups by channel, upload time and playlist over the videos held in memory.
+
+    Videos need id(), channelId() and uploadEpoch(). Time ordered results are newest first."""
+
+    def __init__(self) :
+        self.lock = RLock()
+        self.videos = dict()
+        self.uploads = []
+        self.channels = dict()
+        self.playlists = dict()
+        self.items = dict()
+
+    def __len__(self) :
+        return len(self.videos)
+
+    def __contains__(self, id) :
+        return id in self.videos
+
+    def add(self, video) :
+        self.addVideos([video])
+
+    def addVideos(self, videos) :
+        with self.lock :
+            for video in videos :
+                id = video.id()
+                if id in self.videos :
+                    self.remove(id)
+
+                key = (video.uploadEpoch(), id)
+                self.videos[id] = video
+                insort(self.uploads, key)
+                insort(self.channels.setdefault(video.channelId(), []), key)
+
+    def remove(self, id) :
+        with self.lock :
+            video = self.videos.pop(id, None)
+            if not video :
+                return
+
+            key = (video.uploadEpoch(), id)
+            for keys in [self.uploads, self.channels[video.channelId()]] :
+                del keys[bisect_left(keys, key)]
+
+    def newest(self, count=None) :
+        with self.lock :
+            return self.__videos(self.uploads, 0, len(self.uploads), count)
+
+    def between(self, start, end, count=None) :
+        """Videos uploaded from start up to but not including end, in seconds since the epoch."""
+        with self.lock :
+            return self.__videos(self.uploads, bisect_left(self.uploads, (start,)),
+                                 bisect_left(self.uploads, (end,)), count)
+
+    def channel(self, channelId, count=None, before=None) :
+        with self.lock :
+            keys = self.channels.get(channelId, [])
+            end = bisect_left(keys, (before,)) if before != None else len(keys)
+            return self.__videos(keys, 0, end, count)
+
+    def __videos(self, keys, start, end, count) :
+        if count != None :
+            start = max(start, end - count)
+
+        return [self.videos[id] for epoch, id in reversed(keys[start:end])]
+
+    def setPlaylist(self, playlistId, pairs) :
+        """Replace the (itemId, videoId) pairs recorded for a playlist."""
+        with self.lock :
+            for videoId in self.playlists.pop(playlistId, {}) :
+                entries = self.items[videoId]
+                del entries[playlistId]
+                if not entries :
+                    del self.items[videoId]
+
+            videos = dict()
+            for itemId, videoId in pairs :
+                videos.setdefault(videoId, []).append(itemId)
+                self.items.setdefault(videoId, {})[playlistId] = videos[videoId]
+
+            self.playlists[playlistId] = videos
+
+    def playlistItems(self, videoId, playlistId=None) :
+        """Playlist item ids of a video, for one playlist or keyed by playlist."""
+        with self.lock :
+            entries = self.items.get(videoId, {})
+
+            if playlistId != None :
+                return list(entries.get(playlistId, []))
+
+            return dict((id, list(itemIds)) for id, itemIds in entries.items())
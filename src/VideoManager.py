@@ -27,12 +27,32 @@ from Settings import Settings
 from datetime import datetime
 from multire import multire
 import os
+from weakref import WeakValueDictionary
+from contextlib import contextmanager, nested
 import pdb
 
 class PlaylistNotFoundError(Exception) :
     pass
 
-class VideoHandler :
+#Channel names and ids repeat across thousands of videos, keep one copy of each
+SHARED_STRINGS = dict()
+
+def shared(value) :
+    return SHARED_STRINGS.setdefault(value, value)
+
+#Marks a resume position that hasn't been asked of the service yet
+UNLOADED = object()
+
+def compactTime(seconds) :
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    
+    if hours == 0 :
+        return '%d:%02d' % (minutes, seconds)
+    else :
+        return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+class VideoHandler(object) :
     YOUTUBE_DL_CMD = 'youtube-dl'
     YOUTUBE_DL_ARGS = '--no-part --newline -no-mtime -o %s %s'
     DECIMAL_MATCH = '\d*?\.?\d*?'
@@ -41,23 +61,34 @@ class VideoHandler :
     
     YOUTUBE_DL_REGEX = [
        re.compile('.*?({dec})%\sof\s({dec})(\w\w\w)\sat\s({dec})(\w\w\w/s)\sETA\s(\d\d:\d\d).*'.format(dec=DECIMAL_MATCH)),
-       re.compile('.*?{dec}%\sof\s({dec})\sin\s(\d\d:\d\d)'),
+       re.compile('.*?{dec}%\sof\s({dec})\sin\s(\d\d:\d\d)'.format(dec=DECIMAL_MATCH)),
        re.compile('.*has already been downloaded'),
     ]
-    YOUTUBE_MATCHES = multire(YOUTUBE_DL_REGEX)
     YOUTUBE_DL_FIELDS = [DOWNLOAD_INFO_FIELDS, COMPLETION_INFO_FIELDS, []]
     DEFAULT_DL_INFO = { 'percent' : 0.0 }
     
-    def __init__(self, service, details) :
-        self.details = details
-        self.details['downloadInfo'] = self.DEFAULT_DL_INFO
+    #Videos are kept in memory by the thousand so only slots, no per instance dict
+    __slots__ = ('_url', '_title', '_description', '_duration', '_uploaded', '_channel', '_channelId', 
+                 '_thumbnailUrl', '_service', '_thumbnail', '_downloadInfo', 'manager', 'downloadProcess', 
+                 '_lastPosition', '__weakref__')
+    
+    def __init__(self, service, url, title, description, duration, uploaded, channel, channelId, thumbnailUrl) :
+        self._url = url
+        self._title = title
+        self._description = description
+        self._duration = duration
+        self._uploaded = uploaded
+        self._channel = shared(channel)
+        self._channelId = shared(channelId)
+        self._thumbnailUrl = thumbnailUrl
         self.init(service)
         
     def init(self, service) :
-        self.__service = service
-        self.__service = service
+        self._service = service
         self.manager = service.manager()
-        self.__thumbnail = None
+        self._thumbnail = None
+        self._downloadInfo = None
+        self._lastPosition = UNLOADED
         self.manager.addVideo(self)
         self.downloadProcess = None
         
@@ -69,87 +100,118 @@ class VideoHandler :
             thumbnailFile.write(urllib.urlopen(self.thumbnailUrl()).read())
             thumbnailFile.close()
             
-        self.__thumbnail = filename
+        self._thumbnail = filename
         
     def thumbnailUrl(self) :
-        return self.details['thumbnail']
+        return self._thumbnailUrl
          
     def url(self) :
-        return self.details['url']
+        return self._url
     
     def title(self) :
-        return self.details['title']
+        return self._title
     
     def description(self) :
-        return self.details['description']
+        return self._description
     
     def durationText(self) :
-        return self.details['durationText']
+        return compactTime(self._duration)
     
     def duration(self) :
-        return self.details['duration']
+        return self._duration
     
     def uploadTime(self) :
-        return self.details['uploadTime']
+        return datetime.utcfromtimestamp(self._uploaded)
+    
+    # Seconds since the epoch, cheaper than uploadTime() for sorting
+    def uploadEpoch(self) :
+        return self._uploaded
 
+    # False for a placeholder standing in for a deleted or private video
+    def available(self) :
+        return True
+    
     def channel(self) :
-        return self.details['channel']
+        return self._channel
     
     def channelId(self) :
-        return self.details['channelId']
+        return self._channelId
     
     def service(self) :
-        return self.__service
+        return self._service
     
     def thumbnail(self) :
-        return self.__thumbnail
+        return self._thumbnail
     
-    def startDownload(self) :
+    # Seconds into the video where playback stopped, kept by the service between runs
+    def getLastPosition(self) :
+        if self._lastPosition is UNLOADED :
+            self._lastPosition = self._service.lastPosition(self)
+            
+        return self._lastPosition
+    
+    def setLastPosition(self, position) :
+        previous = self.getLastPosition()
+        self._lastPosition = position
+        
+        #The player reports its position many times a second
+        if previous is None or position is None or int(previous) != int(position) :
+            self._service.storeLastPosition(self, position)
+            
+    lastPosition = property(getLastPosition, setLastPosition)
+    
+    # rateLimit is in bytes per second
+    def startDownload(self, rateLimit=None) :
         if not self.downloadProcess :
             args = self.YOUTUBE_DL_ARGS % (self.filename(), self.url())
+            if rateLimit :
+                args = '--rate-limit %dk ' % max(1, rateLimit / 1024) + args
             self.downloadProcess = subprocess.Popen([self.YOUTUBE_DL_CMD] +
                                                  args.split(), 0, None, subprocess.PIPE, subprocess.PIPE)
-            Timer(0.5, self.__updateDownloadInfo, ()).start()
+            reader = Thread(target=self.__readProgress, args=(self.downloadProcess,))
+            reader.daemon = True
+            reader.start()
             
 	    
     def stopDownload(self) :
         if self.downloadProcess :
             self.downloadProcess.terminate()
+            self.downloadProcess = None
     
     def removeFile(self) :
         try :
             if os.path.exists(self.filename()) :
                 os.remove(self.filename())
                 
-            self.details['downloadInfo'] = self.DEFAULT_DL_INFO
+            self._downloadInfo = None
         except Exception, e :
             print e
             
     def filename(self) :
         return self.manager.videoDir() + self.url().replace('/', '_')
     
-    def __updateDownloadInfo(self) :
-        if self.downloadProcess == None :
-            return
-
-        try :
-            line = self.downloadProcess.stdout.readline()
-            index = self.YOUTUBE_MATCHES.match(line)
+    def __readProgress(self, process) :
+        #youtube-dl blocks once its output pipe is full, so every line is read as it comes
+        for line in iter(process.stdout.readline, '') :
+            for index in range(len(self.YOUTUBE_DL_REGEX)) :
+                match = self.YOUTUBE_DL_REGEX[index].match(line)
+                if match :
+                    break
+            else :
+                continue
             
-            if index in (0, 1) :
-                self.details['downloadInfo'] = dict(zip(self.YOUTUBE_DL_FIELDS[index], self.YOUTUBE_MATCHES.lastmatch.groups()))
+            if index < 2 :
+                self._downloadInfo = dict(zip(self.YOUTUBE_DL_FIELDS[index], match.groups()))
             
             if index >= 1 :
-                self.details['downloadInfo']['percent'] = 100.0
-                return
-        except EOFError :
-            return
-                        
+                self._downloadInfo = dict(self._downloadInfo or {}, percent=100.0)
+                
+        if process.wait() == 0 :
+            self._downloadInfo = dict(self._downloadInfo or {}, percent=100.0)
         
     # Produces an dict object with download info
     def downloadInfo(self) :   
-        self.__updateDownloadInfo()
-        return self.details['downloadInfo'] if 'downloadInfo' in self.details.keys() else self.DEFAULT_DL_INFO
+        return self._downloadInfo or self.DEFAULT_DL_INFO
     
     def durationDownloaded(self) :
         if not self.startedDownload() :
@@ -182,12 +244,186 @@ class VideoHandler :
         value += 'Thumbnail URL: ' + self.thumbnailUrl() + '\n'
         return value
         
+class Prefetcher :
+    """Downloads the videos most likely to be played next within disk, bandwidth and concurrency budgets.
+
+    Candidates are ranked from the next item of the playlist being played, the head of watch
+    later and the newest uploads of the most watched channels. Prefetches that drop out of
+    the ranking are cancelled and their files removed."""
+    
+    def __init__(self, manager) :
+        self.manager = manager
+        self.settings = Settings('prefetch')
+        self.lock = RLock()
+        self.wake = Event()
+        self.thread = None
+        self.active = dict()
+        self.prefetched = set()
+        self.current = None
+        self.counts = { 'started' : 0, 'cancelled' : 0, 'plays' : 0, 'hits' : 0, 'partialHits' : 0 }
+        
+    def start(self) :
+        with self.lock :
+            if self.settings.get('enabled', True) and not self.thread :
+                self.wake.clear()
+                self.thread = Thread(target=self.__run)
+                self.thread.daemon = True
+                self.thread.start()
+            
+    def stop(self) :
+        with self.lock :
+            thread, self.thread = self.thread, None
+            
+        if thread :
+            self.wake.set()
+            thread.join()
+            
+        for video in self.active.values() :
+            self.cancel(video)
+    
+    def played(self, video, playlist=None) :
+        with self.lock :
+            self.counts['plays'] += 1
+            
+            if video.url() in self.prefetched :
+                self.counts['hits' if video.finishedDownload() else 'partialHits'] += 1
+                
+            self.claim(video)
+            self.current = (playlist, video) if playlist else None
+            
+    def claim(self, video) :
+        #The user owns the download from now on so it is never cancelled
+        with self.lock :
+            self.active.pop(video.url(), None)
+            
+    def stats(self) :
+        with self.lock :
+            counts = dict(self.counts)
+            
+        counts['hitRate'] = float(counts['hits'] + counts['partialHits']) / counts['plays'] if counts['plays'] else 0.0
+        return counts
+    
+    def candidates(self) :
+        """Videos ranked by how likely they are to be played next."""
+        sources = [(self.nextInPlaylist, 3.0), (self.watchLater, 2.0), (self.favouriteChannels, 1.0)]
+        scores = dict()
+        videos = dict()
+        
+        for source, weight in sources :
+            try :
+                ranked = source()
+            except Exception, e :
+                print 'Unable to rank prefetch candidates: %s' % repr(e)
+                continue
+            
+            #threading's enumerate shadows the builtin here
+            for position in range(len(ranked)) :
+                video = ranked[position]
+                if not video.available() :
+                    continue
+                
+                scores[video.url()] = scores.get(video.url(), 0.0) + weight / (position + 1)
+                videos[video.url()] = video
+                
+        return [videos[url] for url in sorted(scores.keys(), key=lambda url : -scores[url])]
+    
+    def nextInPlaylist(self) :
+        if not self.current :
+            return []
+        
+        playlist, video = self.current
+        videos = playlist.result()
+        
+        if not video in videos :
+            return []
+        
+        return videos[videos.index(video) + 1:][:1]
+    
+    def watchLater(self) :
+        return sum([service.userPlaylist('watchLater').result()[:3] for service in self.manager.services.values()], [])
+    
+    def favouriteChannels(self) :
+        videos = []
+        
+        for service in self.manager.services.values() :
+            watched = dict()
+            for video in service.userPlaylist('watchHistory').result() :
+                watched[video.channelId()] = watched.get(video.channelId(), 0) + 1
+                
+            for channelId in sorted(watched.keys(), key=lambda id : -watched[id])[:3] :
+                videos += service.channelVideos(channelId, 1)
+                
+        return videos
+    
+    def diskUsed(self) :
+        directory = self.manager.videoDir()
+        if not os.path.exists(directory) :
+            return 0
+        
+        return sum([os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)])
+    
+    def update(self) :
+        """Start the best candidates that fit the budgets and cancel prefetches no longer wanted."""
+        concurrency = self.settings.get('concurrency', 1)
+        diskBudget = self.settings.get('diskmb', 2048) * 1024 * 1024
+        bandwidth = self.settings.get('bandwidthkb', 512) * 1024
+        bytesPerSecond = self.settings.get('bytespersecond', 250000)
+        
+        local = lambda video : video.startedDownload() or os.path.exists(video.filename())
+        wanted = [video for video in self.candidates() if video.url() in self.active or not local(video)][:concurrency]
+        wantedUrls = set([video.url() for video in wanted])
+        
+        with self.lock :
+            for url, video in self.active.items() :
+                if not url in wantedUrls :
+                    self.cancel(video)
+                    
+            used = self.diskUsed()
+            for video in wanted :
+                if video.url() in self.active :
+                    continue
+                
+                #Reserve room for the whole video before starting it
+                estimate = video.duration() * bytesPerSecond
+                if used + estimate > diskBudget :
+                    break
+                
+                used += estimate
+                video.startDownload(bandwidth / concurrency)
+                self.active[video.url()] = video
+                self.prefetched.add(video.url())
+                self.counts['started'] += 1
+                
+            for url, video in self.active.items() :
+                if video.finishedDownload() :
+                    del self.active[url]
+                    
+    def cancel(self, video) :
+        with self.lock :
+            if self.active.pop(video.url(), None) :
+                video.stopDownload()
+                video.removeFile()
+                self.prefetched.discard(video.url())
+                self.counts['cancelled'] += 1
+                
+    def __run(self) :
+        while not self.wake.is_set() :
+            try :
+                self.update()
+            except Exception, e :
+                print 'Prefetch failed: %s' % repr(e)
+                
+            self.wake.wait(self.settings.get('interval', 5))
+    
 class VideoManager :
     def __init__(self) :
-        self.videos = dict()
+        #Services own their videos, this is only an index by url
+        self.videos = WeakValueDictionary()
         self.services = dict()
         self.locSettings = Settings('location')
         self.storageSettings = Settings('storage')
+        self.prefetcher = Prefetcher(self)
+        self.rejectListener = None
         
         if not os.path.exists(self.thumbnailDir()) :
             os.mkdir(self.thumbnailDir())
@@ -196,6 +432,7 @@ class VideoManager :
             os.mkdir(self.videoDir())
     
     def cleanup(self) :
+        self.prefetcher.stop()
         videotimelimit = self.storageSettings.get('videotimelimit', 7)
         for video in self.videos.values() :
             filepath = video.filename()
@@ -228,6 +465,18 @@ class VideoManager :
     def addVideo(self, video) :
         self.videos[video.url()] = video
         
+    # playlist is the one the video was played from, if any
+    def played(self, video, playlist=None) :
+        self.prefetcher.played(video, playlist)
+        
+    # Called by a service, possibly from another thread, when it gave up on a playlist update
+    def rejected(self, video, playlist, include) :
+        if self.rejectListener :
+            self.rejectListener(video, playlist, include)
+            
+    def setRejectListener(self, listener) :
+        self.rejectListener = listener
+        
     def userPlaylist(self, name) :
         playlist = CompositeVideoPlaylist()
         
@@ -252,6 +501,7 @@ class VideoPlaylist :
     def __init__(self, service, details) :
         self.__service = service
         self.details = details
+        self.listener = None
         
     def add(self, video) :
         self.service().addToPlaylist(video, self)
@@ -260,12 +510,19 @@ class VideoPlaylist :
         self.service().removeFromPlaylist(video, self)
         
     def update(self, video, include) :
-        if include :
-            self.service().addToPlaylist(video, self)
-        else :
-            self.service().removeFromPlaylist(video, self)
+        self.service().updatePlaylist(self, video, include)
+        
+    # Called by the service once an update has gone through, possibly from another thread
+    def updated(self, video, include, result) :
+        #Apply the change here rather than fetching the playlist again
+        self.applyUpdate(video, include, result)
         
-        self.listener()
+        if self.listener :
+            self.listener(video, include)
+            
+    # result is what the service returned for the add or remove
+    def applyUpdate(self, video, include, result) :
+        pass
             
     def setUpdateListener(self, listener) :
         self.listener = listener
@@ -279,12 +536,25 @@ class VideoPlaylist :
     def service(self) :
         return self.__service
     
+    def background(self) :
+        return self.service().background()
+    
     def execute(self) :
         raise NotImplementedError
     
     def result(self) :
         raise NotImplementedError
     
+    # The result of the last run saved locally, available before execute, which also becomes result()
+    def cached(self) :
+        return []
+    
+    def hasMore(self) :
+        return False
+    
+    def fetchMore(self) :
+        return []
+    
     
 class CompositeVideoPlaylist :
     def __init__(self) :
@@ -294,19 +564,40 @@ class CompositeVideoPlaylist :
         self.playlists += [playlist]
         
     def execute(self) :
+        self.videos = sum([playlist.execute() for playlist in self.playlists], [])
+        return self.videos
+    
+    def result(self) :
+        return self.videos
+    
+    def cached(self) :
+        self.videos = sum([playlist.cached() for playlist in self.playlists], [])
+        return self.videos
+    
+    def hasMore(self) :
+        return any([playlist.hasMore() for playlist in self.playlists])
+    
+    def fetchMore(self) :
         videos = []
         for playlist in self.playlists :
-            videos += playlist.execute()
-        
-        self.videos = videos
+            videos += playlist.fetchMore()
+            
+        self.videos += videos
         return videos
     
-    def result(self) :
-        return self.videos
+    def background(self) :
+        return nested(*[playlist.background() for playlist in self.playlists])
     
     def setUpdateListener(self, listener) :
         for playlist in self.playlists :
-            playlist.listener = listener
+            playlist.setUpdateListener(lambda video, include : self.__updated(listener, video, include))
+            
+    def __updated(self, listener, video, include) :
+        self.videos = sum([playlist.result() for playlist in self.playlists], [])
+        listener(video, include)
+        
+    def contains(self, video) :
+        return any([playlist.contains(video) for playlist in self.playlists])
  
 class VideoService :
     def url(self) :
@@ -327,5 +618,28 @@ class VideoService :
     def channelUploads(id) :
         raise NotImplementedError
     
+    # Uploads of a channel already known locally, newest first
+    def channelVideos(self, id, count=None, before=None) :
+        return []
+    
+    def lastPosition(self, video) :
+        return None
+    
+    def storeLastPosition(self, video, position) :
+        pass
+    
+    # Requests made inside this nobody is waiting on, so they may be held back
+    @contextmanager
+    def background(self) :
+        yield
+    
+    def updatePlaylist(self, playlist, video, include) :
+        if include :
+            result = self.addToPlaylist(video, playlist)
+        else :
+            result = self.removeFromPlaylist(video, playlist)
+            
+        playlist.updated(video, include, result)
+    
     
         
\ No newline at end of file
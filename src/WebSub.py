@@ -0,0 +1,211 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import hashlib
+import hmac
+import time
+import urllib
+import urllib2
+import urlparse
+import xml.etree.ElementTree as ET
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from threading import Condition, Thread
+
+class WebSubError(Exception) :
+    pass
+
+class CallbackServer(ThreadingMixIn, HTTPServer) :
+    daemon_threads = True
+    allow_reuse_address = True
+
+class CallbackHandler(BaseHTTPRequestHandler) :
+    def do_GET(self) :
+        query = dict(urlparse.parse_qsl(urlparse.urlsplit(self.path).query))
+        challenge = self.server.receiver.verify(query.get('hub.mode'), query.get('hub.topic'),
+                                                query.get('hub.challenge'), query.get('hub.lease_seconds'))
+        self.reply(200 if challenge != None else 404, challenge or '')
+
+    def do_POST(self) :
+        body = self.rfile.read(int(self.headers.getheader('Content-Length') or 0))
+        receiver = self.server.receiver
+        authentic = receiver.authentic(body, self.headers.getheader('X-Hub-Signature'))
+
+        #The hub only needs to know it was received, a bad signature is ignored silently
+        self.reply(204, '')
+
+        if authentic :
+            receiver.submit(receiver.notify, body)
+
+    def reply(self, status, body) :
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) :
+        pass
+
+class WebSubReceiver :
+    """Subscribes feeds to a WebSub hub and receives what the hub pushes for them.
+
+    The hub has to be able to reach callbackUrl, which should lead to port. Every
+    notification is checked against secret before listener is given the (videoId,
+    channelId) pairs it lists and the ids of any deleted videos. The hub is answered
+    before that, the notification being handed to submit, which runs it in the
+    callback thread by default. Subscriptions are renewed before their lease runs out."""
+    ENTRY_TAG = '{http://www.w3.org/2005/Atom}entry'
+    VIDEO_ID_TAG = '{http://www.youtube.com/xml/schemas/2015}videoId'
+    CHANNEL_ID_TAG = '{http://www.youtube.com/xml/schemas/2015}channelId'
+    DELETED_TAG = '{http://purl.org/atompub/tombstones/1.0}deleted-entry'
+    RENEW_MARGIN = 3600
+
+    def __init__(self, hubUrl, callbackUrl, port, listener, secret, leaseSeconds=86400, submit=None) :
+        self.hubUrl = hubUrl
+        self.callbackUrl = callbackUrl
+        self.listener = listener
+        self.submit = submit or (lambda function, *args : function(*args))
+        self.secret = secret
+        self.leaseSeconds = leaseSeconds
+        self.condition = Condition()
+        self.pending = dict()
+        self.expiries = dict()
+        self.stopped = False
+        self.counts = { 'subscribed' : 0, 'verified' : 0, 'notified' : 0, 'rejected' : 0 }
+        self.server = CallbackServer(('', port), CallbackHandler)
+        self.server.receiver = self
+
+    def start(self) :
+        for target in (self.server.serve_forever, self.__renew) :
+            thread = Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self) :
+        with self.condition :
+            self.stopped = True
+            self.condition.notify_all()
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def port(self) :
+        return self.server.server_address[1]
+
+    def subscribed(self, topic) :
+        with self.condition :
+            return topic in self.pending or self.expiries.get(topic, 0) > time.time()
+
+    def subscribe(self, topic, mode='subscribe') :
+        """Ask the hub for topic, which it confirms later through the callback."""
+        with self.condition :
+            self.pending[topic] = mode
+
+        form = { 'hub.mode' : mode, 'hub.topic' : topic, 'hub.callback' : self.callbackUrl,
+                 'hub.verify' : 'async', 'hub.secret' : self.secret, 'hub.lease_seconds' : self.leaseSeconds }
+        try :
+            response = urllib2.urlopen(self.hubUrl, urllib.urlencode(form))
+            response.read()
+            response.close()
+        except (urllib2.URLError, IOError), e :
+            with self.condition :
+                self.pending.pop(topic, None)
+            raise WebSubError('Unable to %s to %s: %s' % (mode, topic, repr(e)))
+
+        with self.condition :
+            self.counts['subscribed'] += 1
+
+    def unsubscribe(self, topic) :
+        self.subscribe(topic, 'unsubscribe')
+
+    def verify(self, mode, topic, challenge, leaseSeconds) :
+        """The challenge to echo if we asked for this, otherwise None."""
+        with self.condition :
+            if challenge is None or self.pending.get(topic) != mode :
+                return None
+
+            del self.pending[topic]
+            self.counts['verified'] += 1
+
+            if mode == 'subscribe' :
+                self.expiries[topic] = time.time() + int(leaseSeconds or self.leaseSeconds)
+                self.condition.notify_all()
+            else :
+                self.expiries.pop(topic, None)
+
+            return challenge
+
+    def authentic(self, body, signature) :
+        expected = 'sha1=' + hmac.new(self.secret, body, hashlib.sha1).hexdigest()
+
+        if not signature or not hmac.compare_digest(expected, signature) :
+            with self.condition :
+                self.counts['rejected'] += 1
+            return False
+
+        return True
+
+    def notify(self, body) :
+        """Pass on what a signed notification lists."""
+        try :
+            videos, deleted = self.parse(body)
+        except ET.ParseError :
+            with self.condition :
+                self.counts['rejected'] += 1
+            return False
+
+        with self.condition :
+            self.counts['notified'] += 1
+
+        self.listener(videos, deleted)
+        return True
+
+    def parse(self, body) :
+        root = ET.fromstring(body)
+        videos = [(entry.findtext(self.VIDEO_ID_TAG), entry.findtext(self.CHANNEL_ID_TAG))
+                  for entry in root.iter(self.ENTRY_TAG) if entry.findtext(self.VIDEO_ID_TAG)]
+        deleted = [entry.get('ref', '').split(':')[-1] for entry in root.iter(self.DELETED_TAG)]
+
+        return videos, [id for id in deleted if id]
+
+    def stats(self) :
+        with self.condition :
+            return dict(self.counts, active=len(self.expiries), pending=len(self.pending))
+
+    def __renew(self) :
+        while True :
+            with self.condition :
+                now = time.time()
+                due = [topic for topic, expiry in self.expiries.items() if expiry - self.RENEW_MARGIN <= now]
+
+                if not due :
+                    wait = min(self.expiries.values()) - self.RENEW_MARGIN - now if self.expiries else None
+                    self.condition.wait(wait)
+
+                if self.stopped :
+                    return
+
+                for topic in due :
+                    del self.expiries[topic]
+
+            for topic in due :
+                try :
+                    self.subscribe(topic)
+                except WebSubError, e :
+                    print e
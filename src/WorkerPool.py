@@ -0,0 +1,198 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from Queue import Queue, Empty
+from threading import Condition, Thread, Timer
+
+class TaskTimeoutError(Exception) :
+    pass
+
+class TaskCancelledError(Exception) :
+    pass
+
+class Future :
+    PENDING, RUNNING, FINISHED, CANCELLED = range(4)
+
+    def __init__(self) :
+        self.condition = Condition()
+        self.state = self.PENDING
+        self.value = None
+        self.error = None
+        self.callbacks = []
+
+    def start(self) :
+        with self.condition :
+            if self.state != self.PENDING :
+                return False
+
+            self.state = self.RUNNING
+            return True
+
+    def cancel(self) :
+        with self.condition :
+            if self.state != self.PENDING :
+                return False
+
+            self.state = self.CANCELLED
+            self.error = TaskCancelledError()
+            self.condition.notify_all()
+
+        self.__runCallbacks()
+        return True
+
+    def setResult(self, value) :
+        self.__finish(value, None)
+
+    def setError(self, error) :
+        self.__finish(None, error)
+
+    def __finish(self, value, error) :
+        with self.condition :
+            # A task abandoned after timing out may still finish later
+            if self.done() :
+                return
+
+            self.value = value
+            self.error = error
+            self.state = self.FINISHED
+            self.condition.notify_all()
+
+        self.__runCallbacks()
+
+    def __runCallbacks(self) :
+        for callback in self.callbacks :
+            callback(self)
+
+    def addDoneCallback(self, callback) :
+        with self.condition :
+            if not self.done() :
+                self.callbacks.append(callback)
+                return
+
+        callback(self)
+
+    def done(self) :
+        return self.state in (self.FINISHED, self.CANCELLED)
+
+    def wait(self, timeout=None) :
+        with self.condition :
+            if timeout is None :
+                while not self.done() :
+                    self.condition.wait()
+            else :
+                deadline = time.time() + timeout
+                while not self.done() and time.time() < deadline :
+                    self.condition.wait(deadline - time.time())
+
+            return self.done()
+
+    def result(self, timeout=None) :
+        if not self.wait(timeout) :
+            raise TaskTimeoutError()
+
+        if self.error :
+            raise self.error
+
+        return self.value
+
+class WorkerPool :
+    """Fixed number of daemon threads running submitted tasks in order."""
+
+    def __init__(self, workers, taskTimeout=None) :
+        self.taskTimeout = taskTimeout
+        self.tasks = Queue()
+        self.threads = []
+
+        for i in range(max(1, workers)) :
+            thread = Thread(target=self.__work)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, function, *args) :
+        future = Future()
+        self.tasks.put((future, function, args))
+        return future
+
+    def map(self, function, values) :
+        return [self.submit(function, value) for value in values]
+
+    def shutdown(self) :
+        for thread in self.threads :
+            self.tasks.put(None)
+
+    def __work(self) :
+        while True :
+            task = self.tasks.get()
+
+            if task is None :
+                return
+
+            future, function, args = task
+            if not future.start() :
+                continue
+
+            timer = None
+            if self.taskTimeout :
+                timer = Timer(self.taskTimeout, future.setError, (TaskTimeoutError(),))
+                timer.daemon = True
+                timer.start()
+
+            try :
+                future.setResult(function(*args))
+            except Exception, e :
+                # Keep the worker alive; the error belongs to the caller
+                future.setError(e)
+            finally :
+                if timer :
+                    timer.cancel()
+
+    @staticmethod
+    def asCompleted(futures, timeout=None) :
+        """Yield futures as they finish, cancelling or abandoning any still running at the timeout."""
+        finished = Queue()
+        for future in futures :
+            future.addDoneCallback(finished.put)
+
+        deadline = time.time() + timeout if timeout is not None else None
+        remaining = len(futures)
+        yielded = set()
+
+        while remaining :
+            try :
+                if deadline is None :
+                    future = finished.get()
+                else :
+                    future = finished.get(True, max(0, deadline - time.time()))
+            except Empty :
+                break
+
+            remaining -= 1
+            yielded.add(id(future))
+            yield future
+
+        if remaining :
+            for future in futures :
+                if id(future) in yielded :
+                    continue
+
+                if not future.done() and not future.cancel() :
+                    future.setError(TaskTimeoutError())
+
+                yield future
@@ -17,14 +17,15 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import httplib2
+import socket
 import urllib2
 import sys
 import os
 import re
 from datetime import *
-import cPickle
+import time as clock
 
-from apiclient.discovery import build
+from apiclient.errors import HttpError
 from oauth2client.file import Storage
 from oauth2client.client import AccessTokenRefreshError
 from oauth2client.client import OAuth2WebServerFlow
@@ -33,118 +34,247 @@ from oauth2client.client import flow_from_clientsecrets
 
 import argparse
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from weakref import WeakSet
 
 from constants import *
 from VideoManager import *
+from YouTubeClient import BatchExecutor, ClientPool, DiscoveryCache, ListCall, throttled
+from ResponseCache import ResponseCache
+from WorkerPool import WorkerPool
+from Catalog import Catalog, CatalogMapping
+from ApiStats import ApiStats
+from VideoIndex import VideoIndex
+from FeedMerge import FeedMerge
+from MutationQueue import MutationQueue
+from ChannelResolver import ChannelResolver
+from RateLimiter import RateLimiter, QuotaExceededError
+from SingleFlight import SingleFlight
+from FeedFetcher import FeedFetcher
+from WebSub import WebSubReceiver, WebSubError
+import isotime
 
 import pdb
 
 class NotAuthenticatedError(Exception) :
     pass
 
-class tzoffset(tzinfo):
-    """Fixed offset in minutes east from UTC."""
-
-    def __init__(self, offset) :
-        self.__offset = timedelta(hours = offset)
-
-    def utcoffset(self, dt):
-        return self.__offset
-
-    def tzname(self, dt):
-        return ''
-
-    def dst(self, dt):
-        return ZERO
+class PlaylistItemNotFoundError(Exception) :
+    pass
 
 class YouTubeVideoHandler(VideoHandler) :
     YOUTUBE_VIDEO_URL = "http://www.youtube.com/watch?v=%s"
-    DURATION_REGEX = re.compile('PT(\d{0,2}(?=H))?H?(\d{0,2}(?=M))?M?(\d{0,2}(?=S))?S?')
-    DATETIME_REGEX = re.compile('(\d\d\d\d)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d).(\d\d\d)([-+]\d\d)?:?(\d\d)?')
+    YOUTUBE_THUMBNAIL_URL = "https://i.ytimg.com/vi/%s/mqdefault.jpg"
+    
+    __slots__ = ('_id',)
     
     def __init__(self, parent, entry) :
-        #self.entry = entry
-        self.parent = parent
-
-        details = dict()
-        details['id'] = entry['id']
-        details['url'] = self.YOUTUBE_VIDEO_URL % entry['id']
-        details['title'] = entry['snippet']['title']
-        details['description'] = entry['snippet']['description']
-        details['duration'] = self.parseDuration(entry['contentDetails']['duration'])
-        details['durationText'] = self.parseDuration(entry['contentDetails']['duration'], True)
-        details['uploadTime'] = self.parseTimestamp(entry['snippet']['publishedAt'])
-        details['channel'] = entry['snippet']['channelTitle']
-        details['channelId'] = entry['snippet']['channelId']
-        details['thumbnail'] = entry['snippet']['thumbnails']['medium']['url']
-        
-        VideoHandler.__init__(self, parent, details)
+        snippet = entry['snippet']
+        self._id = entry['id']
+        
+        #The url and usual thumbnail follow from the id so are not stored
+        thumbnail = snippet['thumbnails']['medium']['url']
+        if thumbnail == self.YOUTUBE_THUMBNAIL_URL % self._id :
+            thumbnail = None
+        
+        VideoHandler.__init__(self, parent, None, snippet['title'], snippet.get('description'),
+                              isotime.parseDuration(entry['contentDetails']['duration']),
+                              isotime.parseTimestamp(snippet['publishedAt']),
+                              snippet['channelTitle'], snippet['channelId'], thumbnail)
                             
     def id(self) :
-        return self.details['id']
+        return self._id
     
-    def __getstate__(self) :
-        return self.details
+    def url(self) :
+        return self.YOUTUBE_VIDEO_URL % self._id
     
-    def __setstate__(self, state) :
-        self.details = state
-        
-    def channelUploads() :
-        self.service().channelUploads(self.details['channelId'])
+    def thumbnailUrl(self) :
+        return self._thumbnailUrl or self.YOUTUBE_THUMBNAIL_URL % self._id
+    
+    def description(self) :
+        if not self.hydrated() :
+            self.service().hydrate(self)
+            
+        return self._description
+    
+    def hydrated(self) :
+        return self._description != None
+    
+    def setDescription(self, description) :
+        self._description = description
+    
+    def channelUploads(self) :
+        self.service().channelUploads(self.channelId())
         
     @staticmethod
-    def parseDuration(duration, text=False) :
-        match = YouTubeVideoHandler.DURATION_REGEX.match(duration)
-        
-        if match :
-            values = list(match.groups())
-            duration = time(*[int(value) if value != None else 0 for value in values])
-            if text :      
-                return YouTubeVideoHandler.toCompactTime(duration)
-            else :
-                return duration.hour * 3600 + duration.minute * 60 + duration.second
-
-        raise ValueError
+    def ingest(parent, items) :
+        """Records for a whole page of videos.list items, keyed by id."""
+        create = YouTubeVideoHandler
+        return dict((item['id'], create(parent, item)) for item in items)
 
-    @staticmethod
-    def toCompactTime(duration) :
-        if duration.hour == 0 :
-            return '{t.minute}:{t.second:02}'.format(t=duration)
-        else :
-            return '{t.hour}:{t.minute:02}:{t.second:02}'.format(t=duration)
+class UnavailableVideoHandler(YouTubeVideoHandler) :
+    """Stands in for a playlist entry whose video has been deleted or made private."""
+    __slots__ = ()
+    
+    def __init__(self, parent, id) :
+        self._id = id
+        VideoHandler.__init__(self, parent, None, 'Unavailable video', '', 0, 0, '', '', None)
         
-    @staticmethod
-    def parseTimestamp(dtstring) :
-        match = YouTubeVideoHandler.DATETIME_REGEX.match(dtstring)
-
-        if match :
-            values = match.groups()
-            dt = datetime(*[int(value) for value in values if value])
-            if values[7] :
-                 dt.tzinfo = tzoffset(int(values[7]))
-                 
-            return dt
-
-        raise ValueError
+    def available(self) :
+        return False
+    
+    def startDownload(self, rateLimit=None) :
+        pass
 
+class YouTubePlaylistResult :
+    def __init__(self, call, items, incremental) :
+        self.order = [item['id'] for item in call.items]
+        self.items = items
+        self.total = call.total
+        self.pageToken = call.pageToken
+        self.incremental = incremental
+        
 class YouTubeVideoPlaylist(VideoPlaylist) :
-    def __init__(self, parent, playlistId, maxResults) :
+    def __init__(self, parent, playlistId, maxResults, paged=True) :
         details = dict()
         details['id'] = playlistId
         details['maxResults'] = maxResults
+        details['paged'] = paged
         VideoPlaylist.__init__(self, parent, details)
         
     def execute(self) :
-        self.details['items'] = self.service().executePlaylistRequest(self.details['id'], min(50, self.details['maxResults']))
-        self.details['videos'] = self.details['items'].values()
+        videos = self.apply(self.service().executePlaylistRequest(*self.request()))
+        return videos if self.details['paged'] else self.loadAll()
+    
+    def setPaged(self, paged) :
+        self.details['paged'] = paged
+        
+    def loadAll(self) :
+        """Fetch every page not loaded yet, for lookups that need the whole playlist."""
+        if not self.executed() :
+            self.execute()
+            
+        while self.hasMore() :
+            self.fetchMore()
+            
+        return self.result()
+    
+    def request(self) :
+        #A partly loaded playlist syncs its first page afresh, removals would shift the saved page token
+        incremental = self.complete() and self.service().settings.get('incrementalsync', True)
+        return (self.details['id'], self.maxResults(), self.details['items'] if incremental else None)
+    
+    def apply(self, result) :
+        items = dict(self.details.get('items', {}))
+        items.update(result.items)
+        total = self.details.get('total')
+        self.details['total'] = result.total
+        
+        if not result.incremental and self.hasMore() and total != None and result.total == total and \
+           result.order == self.details['order'][:len(result.order)] :
+            #The first page is as it was, so the later pages loaded and the page token still hold
+            return self.setItems(self.details['order'], items)
+        
+        #New items always appear ahead of the ones we already know about
+        fresh = []
+        for itemId in result.order :
+            if itemId in self.details.get('items', {}) :
+                break
+            fresh.append(itemId)
+        
+        if not result.incremental or len(fresh) == len(result.order) :
+            #A fresh listing only holds the first page, the rest is fetched on demand
+            self.details['pageToken'] = result.pageToken
+            return self.setItems(result.order, items)
+        
+        order = fresh + self.details['order']
+        
+        if self.complete() and result.total != None and len(order) != result.total :
+            #Items were removed or moved elsewhere, so list just the ids to find out which
+            listing = self.service().playlistListing(self.details['id'])
+            unknown = [pair for pair in listing if not pair[0] in items]
+            items.update(self.service().fetchVideos(unknown, lambda pair : pair[1], lambda pair : pair[0]))
+            order = [itemId for itemId, videoId in listing]
+        
+        return self.setItems(order, items)
+    
+    def hasMore(self) :
+        return bool(self.details.get('pageToken'))
+    
+    def complete(self) :
+        return 'order' in self.details and not self.hasMore()
+    
+    def fetchMore(self) :
+        if not self.hasMore() :
+            return []
+        
+        result = self.service().executePlaylistRequest(self.details['id'], self.maxResults(), 
+                                                       None, self.details['pageToken'])
+        added = [itemId for itemId in result.order if not itemId in self.details['items']]
+        items = dict(self.details['items'])
+        items.update(result.items)
+        
+        self.details['pageToken'] = result.pageToken
+        self.details['total'] = result.total
+        self.setItems(self.details['order'] + added, items)
+        return [items[itemId] for itemId in added]
+    
+    def setItems(self, order, items) :
+        self.details['order'] = order
+        self.details['items'] = {itemId : items[itemId] for itemId in order}
+        self.details['videos'] = [items[itemId] for itemId in order]
+        
+        pairs = self.pairs()
+        self.service().catalog.storePlaylist(self.id(), { 'pageToken' : self.details['pageToken'] }, pairs)
+        self.service().index.setPlaylist(self.id(), pairs)
         return self.details['videos']
     
+    def restore(self, state, pairs) :
+        videos = self.service().videos.fetch([videoId for itemId, videoId in pairs])
+        
+        #Keep the place of videos gone since they were saved so the stored order still matches
+        for itemId, videoId in pairs :
+            if not videoId in videos :
+                videos[videoId] = UnavailableVideoHandler(self.service(), videoId)
+                
+        self.details['pageToken'] = state.get('pageToken')
+        self.details['order'] = [itemId for itemId, videoId in pairs]
+        self.details['items'] = {itemId : videos[videoId] for itemId, videoId in pairs}
+        self.details['videos'] = [videos[videoId] for itemId, videoId in pairs]
+        self.service().index.setPlaylist(self.id(), pairs)
+        
+    def pairs(self) :
+        items = self.details.get('items', {})
+        return [(itemId, items[itemId].id()) for itemId in self.details.get('order', [])]
+
+    def maxResults(self) :
+        return min(50, self.details['maxResults'])
+    
     def playlistId(self, videoId) :
-        for id in self.details['items'].keys() :
-            if self.details['items'][id].id() == videoId :
-                return id
+        itemIds = self.service().index.playlistItems(videoId, self.id())
+        return itemIds[0] if itemIds else ''
+    
+    def contains(self, video) :
+        return bool(self.service().index.playlistItems(video.id(), self.id()))
+    
+    def applyUpdate(self, video, include, result) :
+        if not self.executed() :
+            return
+        
+        order = list(self.details['order'])
+        items = dict(self.details['items'])
+        
+        if include :
+            position = result['snippet'].get('position', len(order)) if 'snippet' in result else len(order)
+            order.insert(min(position, len(order)), result['id'])
+            items[result['id']] = video
+        elif result in items :
+            order.remove(result)
             
-        return ''
+        self.setItems(order, items)
+    
+    def cached(self) :
+        return self.result()
     
     def id(self) :
         return self.details['id']
@@ -155,57 +285,166 @@ class YouTubeVideoPlaylist(VideoPlaylist) :
     def result(self) :
         return self.details['videos'] if self.executed() else []
     
-    def __getstate__(self) :
-        return self.details
-    
-    def __setstate__(self, state) :
-        self.details = state
-    
-class SubscriptionLoader(Thread) :
-    def __init__(self, parent, playlist) :
-        Thread.__init__(self)
-        self.parent = parent
-        self.playlist = playlist
-        
-    def run(self) :
-        videos = self.playlist.execute()
-        self.parent.videoLock.acquire(True)
-        self.parent.videos += videos
-        self.parent.threadCount -= 1
-        self.parent.videoLock.release()
-        
-        
 class YouTubeSubscriptionPlaylist(VideoPlaylist) :
     def __init__(self, parent, user=None) :
         VideoPlaylist.__init__(self, parent, {})
         self.parent = parent
         self.user = user
-        self.videoLock = Lock()
-        self.threadCount = 0
+        self.videos = []
         
     def execute(self) :
+        """Merge the channels' uploads into one feed."""
+        playlists = self.channelPlaylists()
+        merge = FeedMerge()
+        
+        #Channels that failed to load are left out
+        for playlist, channelVideos in self.executeChannels(playlists) :
+            if channelVideos is not None :
+                merge.add(channelVideos)
+            
+        self.videos = merge.take()
+        self.parent.storeFeed(self.feedId(), self.videos)
+        return self.videos
+    
+    def result(self) :
+        return self.videos
+    
+    def feedId(self) :
+        return 'feed:subscriptions:%s' % (self.user or 'mine')
+    
+    def cached(self) :
+        self.videos = self.parent.storedFeed(self.feedId())
+        return self.videos
+    
+    def channelPlaylists(self) :
         channelId = lambda sub : sub['snippet']['resourceId']['channelId']
         subscriptions = self.parent.subscriptions(self.user)
         channelIds = [channelId(sub) for sub in subscriptions]
         
-        self.parent.fetchChannelDetails(','.join(channelIds))
-        self.videos = []
+        self.parent.channels.resolve(channelIds)
         
         newCount = lambda sub : sub['contentDetails']['newItemCount']
-        for sub in subscriptions :
-            if  newCount(sub):
-                playlist = self.parent.channelUploads(channelId(sub), newCount(sub))
-                SubscriptionLoader(self, playlist).start()
-                self.threadCount += 1
-                
-        while self.threadCount :
-            time.sleep(0.1)
+        return [self.parent.channelUploads(channelId(sub), newCount(sub)) 
+                for sub in subscriptions if newCount(sub)]
+    
+    def executeChannels(self, playlists) :
+        """Yield each channel's uploads playlist and its videos, or None if it failed, as soon as they are loaded."""
+        #Each task loads a group of channels through shared batches
+        size = self.parent.settings.get('subscriptiongroupsize', 10)
+        groups = [playlists[offset:offset + size] for offset in range(0, len(playlists), size)]
+        futures = self.parent.workers.map(self.loadChannels, groups)
+        groupOf = dict(zip(futures, groups))
+        
+        for future in WorkerPool.asCompleted(futures) :
+            try :
+                results = future.result()
+            except Exception, e :
+                print 'Unable to load subscriptions: %s' % repr(e)
+                results = [(playlist, None) for playlist in groupOf[future]]
             
-                                            
-        self.videos = sorted(self.videos, lambda x,y: int((y.uploadTime() - 
-                                                 x.uploadTime()).total_seconds()))     
+            for playlist, videos in results :
+                yield playlist, videos
+        
+    def loadChannels(self, playlists) :
+        results = self.parent.executePlaylistRequests([playlist.request() for playlist in playlists])
+        return [(playlist, playlist.apply(result)) for playlist, result in zip(playlists, results)]
+    
+class YouTubeSubscriptionFeedPlaylist(YouTubeSubscriptionPlaylist) :
+    """Subscriptions built from each channel's public uploads feed, which costs no quota.
+
+    Only videos the catalog hasn't seen are looked up with the API, 50 to a call."""
+    FEED_URL = 'https://www.youtube.com/feeds/videos.xml?channel_id=%s'
+    channelIds = frozenset()
+    
+    def execute(self) :
+        if not self.channelIds :
+            return self.load()
+        
+        #Loading the feed again while it is already shown
+        with self.parent.background() :
+            return self.load()
+    
+    def load(self) :
+        channelIds = []
+        for subscription in self.parent.subscriptions(self.user) :
+            channelId = subscription['snippet']['resourceId']['channelId']
+            if not channelId in channelIds :
+                channelIds.append(channelId)
+                
+        self.parent.watchFeeds(self, [self.FEED_URL % channelId for channelId in channelIds])
+        
+        merge = FeedMerge()
+        futures = self.parent.feeds.fetchAll([self.FEED_URL % channelId for channelId in channelIds])
+        channelOf = dict(zip(futures, channelIds))
+        remaining = len(futures)
+        pending = []
+        
+        for future in WorkerPool.asCompleted(futures) :
+            remaining -= 1
+            try :
+                ids = future.result()
+            except Exception, e :
+                print 'Unable to load feed for %s: %s' % (channelOf[future], repr(e))
+                ids = None
+                
+            if ids != None :
+                unknown = len(ids) - len(self.parent.videos.fetch(ids))
+                if unknown :
+                    pending.append((channelOf[future], ids, unknown))
+                else :
+                    self.addChannels(merge, [(channelOf[future], ids, 0)])
+                    
+            #Channels with new videos wait until there are enough to fill a videos.list call
+            if pending and (not remaining or sum([unknown for channelId, ids, unknown in pending]) >= 50) :
+                self.addChannels(merge, pending)
+                pending = []
+                
+        self.videos = merge.take()
+        self.parent.storeFeed(self.feedId(), self.videos)
+        
+        #With push updates on, later uploads arrive through pushed() from here on
+        self.channelIds = set(channelIds)
         return self.videos
     
+    def addChannels(self, merge, channels) :
+        identity = lambda id : id
+        
+        try :
+            videos = self.parent.fetchVideos(sum([ids for channelId, ids, unknown in channels], []), 
+                                             identity, identity)
+        except Exception, e :
+            print 'Unable to load subscription videos: %s' % repr(e)
+            return
+        
+        newestFirst = lambda video : -video.uploadEpoch()
+        for channelId, ids, unknown in channels :
+            merge.add(sorted([videos[id] for id in ids if videos[id].available()], key=newestFirst))
+    
+    def feedId(self) :
+        return 'feed:channelfeeds:%s' % (self.user or 'mine')
+    
+    def pushed(self, videos, deleted) :
+        """Apply uploads and deletions the hub told us about."""
+        for video in videos :
+            if video.channelId() in self.channelIds and not video in self.videos :
+                self.updated(video, True, None)
+                
+        for video in [video for video in self.videos if video.id() in deleted] :
+            self.updated(video, False, None)
+            
+        self.parent.storeFeed(self.feedId(), self.videos)
+    
+    def applyUpdate(self, video, include, result) :
+        if not include :
+            self.videos.remove(video)
+            return
+        
+        #Keep the feed newest first
+        position = 0
+        while position < len(self.videos) and self.videos[position].uploadEpoch() > video.uploadEpoch() :
+            position += 1
+        self.videos.insert(position, video)
+    
 class YouTubeSubscriptionPlaylistV2(VideoPlaylist) :
     SUBSCRIPTIONS_URL = 'http://gdata.youtube.com/feeds/api/users/%s/newsubscriptionvideos'
     ENTRY_TAG = '{http://www.w3.org/2005/Atom}entry'
@@ -215,71 +454,162 @@ class YouTubeSubscriptionPlaylistV2(VideoPlaylist) :
         VideoPlaylist.__init__(self, parent,  {})
         self.parent = parent
         self.user = user if user != None else parent.userDetails['id']
+        self.videos = OrderedDict()
            
     def execute(self) :
         handle = urllib2.urlopen(self.SUBSCRIPTIONS_URL % self.user)
-        tree = ET.parse(handle)
-        ids = []
+        identity = lambda id : id
+        futures = []
+        
+        try :
+            #Look videos up 50 at a time while the rest of the feed is still downloading
+            for chunk in self.videoIds(handle, 50) :
+                futures.append((chunk, self.parent.workers.submit(self.parent.fetchVideos, chunk, 
+                                                                   identity, identity)))
+        finally :
+            handle.close()
         
-        videoId = lambda entry : entry.find(self.ID_TAG).text[-11:]
-        self.videos = self.parent.fetchVideos(tree.getroot().findall(self.ENTRY_TAG), 
-                                              videoId, videoId)
-        handle.close()
+        self.videos = OrderedDict()
+        for chunk, future in futures :
+            videos = future.result()
+            self.videos.update((id, videos[id]) for id in chunk if id in videos and videos[id].available())
+            
+        self.parent.storeFeed(self.feedId(), self.videos.values())
         return self.videos.values()
     
+    def feedId(self) :
+        return 'feed:newsubscriptionvideos:%s' % self.user
+    
+    def cached(self) :
+        self.videos = OrderedDict((video.id(), video) for video in self.parent.storedFeed(self.feedId()))
+        return self.videos.values()
+    
+    def videoIds(self, source, size) :
+        """Yields video ids from the feed in chunks, dropping each entry once it has been read."""
+        chunk = []
+        seen = set()
+        root = None
+        
+        for event, element in ET.iterparse(source, ('start', 'end')) :
+            if event == 'start' :
+                if root is None :
+                    root = element
+                continue
+            
+            if element.tag == self.ENTRY_TAG :
+                id = element.find(self.ID_TAG).text[-11:]
+                root.clear()
+                
+                if not id in seen :
+                    seen.add(id)
+                    chunk.append(id)
+                
+                if len(chunk) == size :
+                    yield chunk
+                    chunk = []
+                    
+        if chunk :
+            yield chunk
+    
     def result(self) :
         return self.videos.values()
         
 class YouTubeService(VideoService) :
-    CACHE_PATH = SETTINGS_DIR + 'youtube-cache.dat'
+    CATALOG_PATH = SETTINGS_DIR + 'youtube-catalog.db'
+    STATS_PATH = SETTINGS_DIR + 'youtube-api-stats.json'
+    DISCOVERY_PATH = SETTINGS_DIR + 'youtube-v3-discovery.json'
+    DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/youtube/v3/rest'
     CREDENTIALS_FILE = 'credentials.dat'
     SCOPE = 'https://www.googleapis.com/auth/youtube'
     REDIRECT_URLS = ['urn:ietf:wg:oauth:2.0:oob', 'http://localhost']
+    LEAN_VIDEO_FIELDS = ('etag, items(id, snippet(title, channelId, channelTitle, publishedAt, '
+                         'thumbnails/medium/url), contentDetails/duration)')
     
     def __init__(self, manager) :
         self.__manager = manager
         self.__authenticated = False
         
         self.videoDetails = dict()
-        self.channelDetails = dict()
         self.userDetails = None
         self.userPlaylists = None
         self.settings = Settings('youtube')
+        self.workers = WorkerPool(self.settings.get('workers', 4), self.settings.get('tasktimeout', 60))
         
-        try :
-            cache = open(self.CACHE_PATH, 'rb')
-            self.videos = cPickle.load(cache)
-            for video in self.videos.values() :
-                video.init(self)
-                
-            self.channels = cPickle.load(cache)
-            self.playlists = cPickle.load(cache)
-            for playlist in self.playlists.values() :
-                playlist.setService(self)
-                
-            cache.close()
-        except (IOError, EOFError, cPickle.PickleError) :
-            self.videos = dict()
-            self.channels = dict()
-            self.playlists = dict()
+        #Rows are only turned into objects when something asks for them
+        self.catalog = Catalog(self.CATALOG_PATH)
+        self.index = VideoIndex()
+        self.videos = CatalogMapping(self.catalog.videos, self.createVideo)
+        self.channels = ChannelResolver(self.catalog, self.requestChannels, self.settings.get('channelttl', 86400))
+        self.playlists = dict()
+        self.playlistLock = Lock()
+        self.stats = ApiStats()
+        self.inflight = SingleFlight()
+        self.feeds = FeedFetcher(self.settings.get('feedconnections', 8), self.catalog, 
+                                 self.settings.get('tasktimeout', 60))
+        self.push = None
+        self.feedPlaylists = WeakSet()
+        self.unhydrated = OrderedDict()
+        self.hydrating = False
+        self.hydrateCondition = Condition()
+        self.mutations = MutationQueue(self.catalog, self.executeMutation, self.mutationDone, self.isTransient)
+        self.responses = ResponseCache(self.settings.get('responsecachesize', 2000), self.catalog)
+        self.limiter = RateLimiter(self.settings.get('quotarate', 30), self.settings.get('quotaburst', 300),
+                                   self.settings.get('quotaperday', 10000), self.settings.get('quotareserve', 0.2),
+                                   self.settings.get('quotaused', 0), self.settings.get('quotaday', -1))
         
         self.storage = Storage(SETTINGS_DIR + self.CREDENTIALS_FILE)
-        self.credentials = self.storage.get()
+        self.discovery = DiscoveryCache(self.DISCOVERY_PATH, self.DISCOVERY_URL,
+                                        self.settings.get('discoverymaxage', 7) * 86400)
+        self.setCredentials(self.storage.get())
         
     def cleanup(self) :
-        cache = open(self.CACHE_PATH, 'wb')
-        cPickle.dump(self.videos, cache, -1)
-        cPickle.dump(self.channels, cache, -1)
-        cPickle.dump(self.playlists, cache, -1)
-        print "Writing cache file to " + self.CACHE_PATH
-        cache.close()
+        #Let a change that is being sent finish before the catalog goes away
+        self.mutations.stop(self.settings.get('mutationstoptimeout', 10))
+        
+        if self.push :
+            self.push.stop()
+        self.feeds.close()
+        self.catalog.close()
+        
+        #Carry today's quota use over to the next run
+        used, day = self.limiter.state()
+        self.settings.set('quotaused', used)
+        self.settings.set('quotaday', day)
+        
+        if self.settings.get('dumpapistats', True) :
+            self.stats.dump(self.STATS_PATH)
     
     def url(self) :
         return 'youtube.com'
     
     def postAuthentication(self) :
-        self.userDetails = self.fetchChannelDetails()[0]
-        self.userPlaylists = self.userDetails['contentDetails']['relatedPlaylists']
+        #Start from the details saved last time and check them in the background
+        stored = self.catalog.channels([self.settings.get('userchannel', '')])
+        
+        if stored :
+            self.setUserDetails(stored.values()[0][1])
+            self.workers.submit(self.refreshUserDetails)
+        else :
+            self.refreshUserDetails()
+            
+        self.mutations.start()
+        
+        #The hub has to reach the callback, so push is only used when one has been set up
+        if self.settings.get('pushupdates', False) and self.settings.get('pushcallback', '') :
+            self.push = WebSubReceiver(self.settings.get('pushhub', 'https://pubsubhubbub.appspot.com/subscribe'),
+                                       self.settings.get('pushcallback', ''), self.settings.get('pushport', 8765),
+                                       self.pushed, os.urandom(16).encode('hex'),
+                                       self.settings.get('pushlease', 5 * 86400), self.workers.submit)
+            self.push.start()
+        
+    def refreshUserDetails(self) :
+        with self.limiter.background() :
+            self.setUserDetails(self.fetchChannelDetails()[0])
+        
+    def setUserDetails(self, details) :
+        self.userDetails = details
+        self.userPlaylists = details['contentDetails']['relatedPlaylists']
+        self.settings.set('userchannel', details['id'])
                 
     def manager(self) :
         return self.__manager
@@ -287,7 +617,12 @@ class YouTubeService(VideoService) :
     def authenticate(self) :      
         flow = flow_from_clientsecrets('client_secrets.json', self.SCOPE, self.REDIRECT_URLS)
         flags = argparser.parse_args("")
-        self.credentials = run_flow(flow, self.storage, flags)
+        self.setCredentials(run_flow(flow, self.storage, flags))
+        
+    def setCredentials(self, credentials, clients=None) :
+        self.credentials = credentials
+        self.clients = clients or ClientPool(credentials, self.discovery)
+        self.batches = BatchExecutor(self.clients, self.responses, self.limiter)
                 
     def isAuthenticated(self) :
         return self.credentials and not self.credentials.invalid
@@ -298,109 +633,355 @@ class YouTubeService(VideoService) :
 
     def serviceInstance(self) :
         if self.isAuthenticated() :
-            http = httplib2.Http()
-            http.disable_ssl_certificate_validation = True
-            http = self.credentials.authorize(http)
-        
-            service = build('youtube', 'v3', http=http)
-            
-            return service
+            return self.clients.service()
         
         raise NotAuthenticatedError
 
-    def executePlaylistRequest(self, playlistId, maxResults) :
-        options = { 'part' : 'snippet, contentDetails',  'maxResults' : maxResults, 
-                   'playlistId' : playlistId,
-                   'fields' : 'items/id, items/snippet/resourceId/videoId'}
-        playlist = self._executeListRequest(self.serviceInstance().playlistItems(), 
-                                               options, maxResults == 50)
+    def connectionStats(self) :
+        return self.clients.stats()
+
+    def channelStats(self) :
+        return self.channels.stats()
+
+    def responseCacheStats(self) :
+        return self.responses.stats()
+    
+    def apiStats(self) :
+        return self.stats.snapshot()
+    
+    def quotaStats(self) :
+        return self.limiter.stats()
+    
+    def inflightStats(self) :
+        return self.inflight.stats()
+    
+    def feedStats(self) :
+        return self.feeds.stats()
+
+    def executePlaylistRequest(self, playlistId, maxResults, known=None, pageToken=None) :
+        return self.executePlaylistRequests([(playlistId, maxResults, known)], pageToken)[0]
+
+    def executePlaylistRequests(self, playlists, pageToken=None) :
+        calls = []
+        
+        for playlistId, maxResults, known in playlists :
+            options = { 'part' : 'snippet, contentDetails',  'maxResults' : maxResults, 
+                       'playlistId' : playlistId,
+                       'fields' : 'etag, nextPageToken, pageInfo/totalResults, items/id, items/snippet/resourceId/videoId'}
+            
+            if pageToken :
+                options['pageToken'] = pageToken
+            
+            if known is None :
+                #Only one page at a time, later pages are fetched as they are needed
+                call = ListCall(self.serviceInstance().playlistItems(), options, False)
+            else :
+                #Page only until we reach an item that is already cached
+                reachedKnown = lambda items, known=known : any(item['id'] in known for item in items)
+                call = ListCall(self.serviceInstance().playlistItems(), options, True, reachedKnown, 
+                                self.settings.get('syncmaxpages', 5))
+            calls.append(call)
+            
+        self._executeListRequests(calls)
         videoId = lambda val : val['snippet']['resourceId']['videoId']
         playlistId = lambda val : val['id']
         
-        return self.fetchVideos(playlist, videoId, playlistId)
+        #Look up the videos of every playlist in one go so they share batches
+        self.fetchVideos(sum([call.items for call in calls], []), videoId, playlistId)
+        return [YouTubePlaylistResult(call, self.fetchVideos(call.items, videoId, playlistId), request[2] != None) 
+                for call, request in zip(calls, playlists)]
         
-    def fetchVideos(self, playlist, videoId, playlistId) :
-        offset = 0
+    def playlistListing(self, playlistId) :
+        """Every (itemId, videoId) pair of a playlist in order, without any other details."""
+        options = { 'part' : 'snippet', 'maxResults' : 50, 'playlistId' : playlistId,
+                    'fields' : 'etag, nextPageToken, items(id, snippet/resourceId/videoId)' }
+        items = self._executeListRequest(self.serviceInstance().playlistItems(), options)
+        return [(item['id'], item['snippet']['resourceId']['videoId']) for item in items]
         
+    def fetchVideos(self, playlist, videoId, playlistId) :
         #Get video details that are not already cached
-        while offset < len(playlist) :
-            count = min(50, len(playlist) - offset) + offset
-            ids = [videoId(item) for item in playlist[offset:count]
-                    if not videoId(item) in self.videos.keys()]
-            
-            if len(ids) > 0 :
-                options = {'part' : 'snippet, contentDetails', 
-                           'maxResults' : 50, 'id' : ','.join(ids)}
-                videolist = self._executeListRequest(self.serviceInstance().videos(), options)
+        ids = []
+        for item in playlist :
+            if not videoId(item) in ids :
+                ids.append(videoId(item))
+        
+        known = self.videos.fetch(ids)
+        ids = [id for id in ids if not id in known]
+        
+        #Videos found missing recently aren't asked for again until their tombstone expires
+        tombstones = self.catalog.tombstones(ids)
+        expiry = clock.time() - self.settings.get('tombstonettl', 7 * 86400)
+        ids = [id for id in ids if tombstones.get(id, 0) < expiry]
+        
+        calls = []
+        for offset in range(0, len(ids), 50) :
+            options = {'part' : 'snippet, contentDetails', 
+                       'maxResults' : 50, 'id' : ','.join(ids[offset:offset + 50])}
+            
+            #Only fetch what the list views show, descriptions are hydrated later
+            if self.settings.get('leanmetadata', True) :
+                options['fields'] = self.LEAN_VIDEO_FIELDS
                 
-                #Cache the new items into self.videoDetails
-                for item in videolist :
-                    self.videos[item['id']] = YouTubeVideoHandler(self, item)
+            calls.append(ListCall(self.serviceInstance().videos(), options))
             
-            offset += 50
+        #Everything cached means no request at all, which also works offline
+        returned = set()
+        for call in self._executeListRequests(calls) if calls else [] :
+            #Cache the new items into self.videos
+            self.catalog.storeVideos(call.items)
+            self.videos.update(self.createVideos(call.items))
+            returned.update(item['id'] for item in call.items)
             
+        self.catalog.storeTombstones([id for id in ids if not id in returned])
+        self.catalog.removeTombstones([id for id in ids if id in returned and id in tombstones])
         
-        return {playlistId(item) : self.videos[videoId(item)] for item in playlist}
+        videos = self.videos.fetch([videoId(item) for item in playlist])
+        placeholders = dict()
+        for item in playlist :
+            if not videoId(item) in videos and not videoId(item) in placeholders :
+                placeholders[videoId(item)] = UnavailableVideoHandler(self, videoId(item))
+        videos.update(placeholders)
+        
+        return {playlistId(item) : videos[videoId(item)] for item in playlist}
+    
+    def createVideo(self, item) :
+        return self.createVideos([item])[item['id']]
+    
+    def createVideos(self, items) :
+        videos = YouTubeVideoHandler.ingest(self, items)
+        self.index.addVideos(videos.values())
+        return videos
+    
+    def hydrate(self, video) :
+        with self.hydrateCondition :
+            if video.hydrated() :
+                return
+            
+            #One request at a time, the rows asked for meanwhile go together in the next one
+            if self.hydrating :
+                self.unhydrated[video.id()] = video
+                while self.hydrating and not video.hydrated() :
+                    self.hydrateCondition.wait()
+                    
+                if video.hydrated() :
+                    return
+                
+            self.unhydrated.pop(video.id(), None)
+            pending = [video] + [self.unhydrated.popitem(False)[1] for i in range(min(49, len(self.unhydrated)))]
+            self.hydrating = True
+            
+        descriptions = None
+        try :
+            ids = [other.id() for other in pending]
+            options = { 'part' : 'snippet', 'maxResults' : 50, 'id' : ','.join(ids),
+                        'fields' : 'items(id, snippet/description)' }
+            descriptions = {item['id'] : item['snippet']['description'] for item in 
+                            self._executeListRequest(self.serviceInstance().videos(), options)}
+        finally :
+            #After a failure the videos still waiting ask again themselves
+            with self.hydrateCondition :
+                for other in pending if descriptions != None else [] :
+                    other.setDescription(descriptions.get(other.id(), ''))
+                    
+                self.hydrating = False
+                self.hydrateCondition.notify_all()
+            
+        items = self.catalog.videos(ids)
+        for id in items :
+            items[id]['snippet']['description'] = descriptions.get(id, '')
+            
+        self.catalog.storeVideos(items.values())
     
     def _executeListRequest(self, requestObj, options, multipage = True) : 
+        return self._executeListRequests([ListCall(requestObj, options, multipage)])[0].items
+    
+    def _executeListRequests(self, calls) :
         if not self.isAuthenticated() :
             raise NotAuthenticatedError
         
-        request = requestObj.list(**options)
-        items = []
+        #Identical calls already being made, here or on another thread, are waited for rather than repeated.
+        #Only calls of the same priority are shared so an interactive one never waits behind background quota
+        background = self.limiter.isBackground()
+        flights = [(call, call.key()) for call in calls]
+        flights = [(call, (key, background) if key else None) for call, key in flights]
+        flights = [(call, key) + (self.inflight.join(key) if key else (None, True)) for call, key in flights]
+        leaders = [call for call, key, future, leader in flights if leader]
+        
+        try :
+            self.batches.execute(leaders)
+        except Exception, e :
+            #Connection failures end every call still going and are counted like any other error
+            for call in leaders :
+                if not call.done() :
+                    call.fail(e)
                     
-        while request :
-            response = request.execute()
-            
-            if 'error' in response :
-                print response
-                break
-            
-            items += response['items']
-            
-            if multipage :
-                request = requestObj.list_next(request, response)
+        for call, key, future, leader in flights :
+            if key and leader :
+                self.inflight.finish(key, future, call)
+        
+        for call, key, future, leader in flights :
+            if leader :
+                self.stats.record(call.endpoint, call.pages, call.bytes, call.elapsed, self.errorName(call.error),
+                                  call.pages > 0 or call.elapsed > 0)
             else :
-                request = None
+                call.share(future.result())
+            
+        #A partial list would only turn into missing videos further up
+        errors = [call.error for call in calls if call.error]
+        if errors :
+            raise errors[0]
                 
-        return items
+        return calls
     
     def _executeInsertRequest(self, requestObj, options) :
-        request = requestObj.insert(**options)
-        return request.execute()
+        return self._executeRequest(requestObj.insert(**options))
     
     def _executeDeleteRequest(self, requestObj, options) :
-        request = requestObj.delete(**options)
-        return request.execute()
+        return self._executeRequest(requestObj.delete(**options))
+    
+    def _executeRequest(self, request) :
+        attempts = 0
+        
+        while True :
+            try :
+                self.limiter.acquire(ApiStats.cost(request.methodId))
+            except QuotaExceededError, e :
+                self.stats.record(request.methodId, 0, 0, 0.0, self.errorName(e), False)
+                raise
+            
+            try :
+                return self._sendRequest(request)
+            except Exception, e :
+                reason = throttled(e)
+                
+                if reason == 'rate' and attempts < self.limiter.MAX_RETRIES :
+                    attempts += 1
+                    self.limiter.backoff(attempts)
+                    continue
+                
+                if reason == 'quota' :
+                    self.limiter.exhaust()
+                    
+                raise
+    
+    def _sendRequest(self, request) :
+        started = clock.time()
+        received = self.clients.received()
+        error = None
+        
+        try :
+            return request.execute(http=self.clients.http())
+        except Exception, e :
+            error = e
+            raise
+        finally :
+            self.stats.record(request.methodId, 1, self.clients.received() - received, 
+                              clock.time() - started, self.errorName(error))
+        
+    @staticmethod
+    def errorName(error) :
+        if error is None :
+            return None
+        
+        if hasattr(error, 'resp') :
+            return str(error.resp.status)
+        
+        return type(error).__name__
    
  
     def fetchChannelDetails(self, id=None) :
-        options = { 'part' : 'snippet, contentDetails, id' }
-        
-        if id :
-            options['id'] =  id
-        else :
-            options['mine'] = True
+        if not id :
+            options = { 'part' : 'snippet, contentDetails, id', 'mine' : True }
+            result = self._executeListRequest(self.serviceInstance().channels(), options)
+            self.channels.store(result)
+            return result
             
-        result = self._executeListRequest(self.serviceInstance().channels(), options) 
-        
-        for item in result :
-            self.channelDetails[item['id']] = item
+        return self.channels.refresh(id.split(',')).values()
+    
+    def requestChannels(self, ids) :
+        #channels.list accepts at most 50 ids per call
+        calls = []
+        for offset in range(0, len(ids), 50) :
+            options = { 'part' : 'snippet, contentDetails, id', 'id' : ','.join(ids[offset:offset + 50]) }
+            calls.append(ListCall(self.serviceInstance().channels(), options))
             
-        return result
+        return sum([call.items for call in self._executeListRequests(calls)], [])
 
     def channelUploads(self, id, maxResults = 50) :
-        if not id in self.channelDetails :
-            self.fetchChannelDetails(id)
-            
-        details = self.channelDetails[id]
+        details = self.channels[id]
         print "Getting %d videos for %s" % (maxResults , details['snippet']['title'])
         
         return self.playlist(details['contentDetails']['relatedPlaylists']['uploads'], maxResults)
             
+    def storeFeed(self, id, videos) :
+        """Remember a generated feed's order so it can be shown straight away next time."""
+        ids = []
+        seen = set()
+        for video in videos :
+            if not video.id() in seen :
+                seen.add(video.id())
+                ids.append(video.id())
+                
+        self.catalog.storePlaylist(id, {}, [(videoId, videoId) for videoId in ids])
+        
+    def storedFeed(self, id) :
+        stored = self.catalog.playlist(id)
+        if not stored :
+            return []
+        
+        videos = self.videos.fetch([videoId for itemId, videoId in stored[1]])
+        return [videos[videoId] for itemId, videoId in stored[1] if videoId in videos]
+    
+    def watchFeeds(self, playlist, topics) :
+        self.feedPlaylists.add(playlist)
+        
+        if self.push :
+            self.workers.map(self.subscribeFeed, [topic for topic in topics if not self.push.subscribed(topic)])
+            
+    def subscribeFeed(self, topic) :
+        try :
+            self.push.subscribe(topic)
+        except WebSubError, e :
+            #Polling still picks the channel up
+            print e
+            
+    def pushed(self, videos, deleted) :
+        """Store what the hub sent and pass it on to the subscription feeds being shown."""
+        if deleted :
+            #Forget them so no other feed or restored playlist shows them as available
+            self.catalog.removeVideos(deleted)
+            self.catalog.storeTombstones(deleted)
+            self.videos.discard(deleted)
+            for videoId in deleted :
+                self.index.remove(videoId)
+            
+        identity = lambda id : id
+        with self.limiter.background() :
+            loaded = self.fetchVideos([videoId for videoId, channelId in videos], identity, identity)
+        loaded = [loaded[videoId] for videoId, channelId in videos if loaded[videoId].available()]
+        
+        for playlist in list(self.feedPlaylists) :
+            playlist.pushed(loaded, set(deleted))
+            
+    def pushStats(self) :
+        return self.push.stats() if self.push else {}
+        
+    def lastPosition(self, video) :
+        return self.catalog.position(video.id())
+    
+    def storeLastPosition(self, video, position) :
+        self.catalog.storePosition(video.id(), position)
+        
+    def background(self) :
+        return self.limiter.background()
+        
+    def channelVideos(self, id, count=None, before=None) :
+        """Already loaded uploads of a channel, newest first, without asking the API."""
+        return self.index.channel(id, count, before)
+    
     def subscriptions(self, user=None) :
         request = None
-        options = { 'part' : 'snippet, contentDetails' }
+        options = { 'part' : 'snippet, contentDetails', 'maxResults' : 50 }
         
         if user :
             options['channelId'] = user            
@@ -410,22 +991,35 @@ class YouTubeService(VideoService) :
         return self._executeListRequest(self.serviceInstance().subscriptions(), options)
     
     def subscriptionPlaylist(self, user=None) :
-        if self.settings.get('quicksubscriptions', True) :
+        if self.settings.get('channelfeeds', True) :
+            return YouTubeSubscriptionFeedPlaylist(self, user)
+        elif self.settings.get('quicksubscriptions', True) :
             return  YouTubeSubscriptionPlaylistV2(self, user)
         else :
             return YouTubeSubscriptionPlaylist(self, user)
     
-    def playlist(self, id, maxResults = 50) :
-        if not id in self.playlists.keys() :
-            self.playlists[id] = YouTubeVideoPlaylist(self, id, maxResults)
-            
-        return self.playlists[id]
+    def playlist(self, id, maxResults = 50, paged = True) :
+        with self.playlistLock :
+            if not id in self.playlists :
+                playlist = YouTubeVideoPlaylist(self, id, maxResults, paged)
+                stored = self.catalog.playlist(id)
+                
+                if stored :
+                    playlist.restore(*stored)
+                    
+                self.playlists[id] = playlist
+                
+            if not paged :
+                self.playlists[id].setPaged(False)
+                
+            return self.playlists[id]
         
     def userPlaylistNames(self) :
         return ['favorites', 'watchLater', 'watchHistory', 'likes']
 
     def userPlaylist(self, name) :
-        return self.playlist(self.userPlaylists[name])
+        #Favourite and watch later toggles ask about any video, so these are loaded in full
+        return self.playlist(self.userPlaylists[name], paged=False)
     
 
     def addToPlaylist(self, video, playlist) :
@@ -433,11 +1027,55 @@ class YouTubeService(VideoService) :
         playlistId = playlist if not hasattr(playlist, 'id') else playlist.id()
         snippet = { 'playlistId' : playlistId, 'resourceId' : { 'videoId' : videoid, 'kind' : 'youtube#video' } }
         options = { 'part' : 'snippet', 'body' : { 'snippet' : snippet } }
-        self._executeInsertRequest(self.serviceInstance().playlistItems(), options)
+        return self._executeInsertRequest(self.serviceInstance().playlistItems(), options)
                
+    def updatePlaylist(self, playlist, video, include) :
+        #Returns at once, the change is applied to the playlist when the API accepts it
+        self.mutations.add(playlist.id(), video.id(), include)
+        
+    def executeMutation(self, mutation) :
+        with self.limiter.background() :
+            if mutation.include :
+                return self.addToPlaylist(mutation.videoId, mutation.playlistId)
+            
+            playlist = self.playlist(mutation.playlistId)
+            if not playlist.playlistId(mutation.videoId) :
+                #The item may be on a page that hasn't been loaded yet
+                playlist.loadAll()
+                
+            if not playlist.playlistId(mutation.videoId) :
+                raise PlaylistItemNotFoundError('%s is not in playlist %s' % (mutation.videoId, mutation.playlistId))
+            
+            return self.removeFromPlaylist(mutation.videoId, playlist)
+    
+    def mutationDone(self, mutation, result, error) :
+        video = self.videos.get(mutation.videoId)
+        if error :
+            print 'Unable to update playlist %s: %s' % (mutation.playlistId, repr(error))
+            if video :
+                #Undo what the view showed when the change was made
+                self.manager().rejected(video, self.playlist(mutation.playlistId), mutation.include)
+            return
+        
+        if video and result :
+            self.playlist(mutation.playlistId).updated(video, mutation.include, result)
+            
+    @staticmethod
+    def isTransient(error) :
+        if isinstance(error, (httplib2.HttpLib2Error, socket.error)) :
+            #No response at all, the connection failed
+            return True
+        
+        if not isinstance(error, HttpError) :
+            return False
+        
+        #Quota and authentication failures won't clear up by trying again
+        return error.resp.status == 429 or error.resp.status >= 500
+        
     def removeFromPlaylist(self, video, playlist) :
         videoid = video if not hasattr(video, 'id') else video.id()
         playlistId = playlist.playlistId(videoid)
         options = { 'id' : playlistId }
         self._executeDeleteRequest(self.serviceInstance().playlistItems(), options)
+        return playlistId
         
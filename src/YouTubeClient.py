@@ -0,0 +1,386 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import httplib2
+import json
+import os
+import re
+import time
+from threading import Lock, local
+
+from apiclient.discovery import build_from_document
+from apiclient.errors import HttpError
+from apiclient.http import BatchHttpRequest
+
+from ApiStats import ApiStats
+from RateLimiter import QuotaExceededError
+
+class DiscoveryError(Exception) :
+    pass
+
+def throttled(error) :
+    """'rate' for a response worth retrying after a pause, 'quota' once the day's quota is spent, otherwise None."""
+    resp = getattr(error, 'resp', None)
+    if resp is None :
+        return None
+
+    if resp.status == 429 :
+        return 'rate'
+
+    if resp.status != 403 :
+        return None
+
+    try :
+        reasons = [detail.get('reason') for detail in json.loads(error.content)['error']['errors']]
+    except (ValueError, KeyError, TypeError, AttributeError) :
+        return None
+
+    if 'rateLimitExceeded' in reasons or 'userRateLimitExceeded' in reasons :
+        return 'rate'
+
+    if 'quotaExceeded' in reasons or 'dailyLimitExceeded' in reasons :
+        return 'quota'
+
+    return None
+
+class ConnectionStats :
+    def __init__(self) :
+        self.lock = Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def record(self, reused) :
+        with self.lock :
+            if reused :
+                self.reused += 1
+            else :
+                self.opened += 1
+
+    def values(self) :
+        with self.lock :
+            return { 'opened' : self.opened, 'reused' : self.reused }
+
+class PooledHttp(httplib2.Http) :
+    """Keep-alive Http that counts how often a pooled connection is reused."""
+
+    def __init__(self, stats) :
+        httplib2.Http.__init__(self)
+        self.disable_ssl_certificate_validation = True
+        self.stats = stats
+        self.received = 0
+
+    def _conn_request(self, conn, request_uri, method, body, headers) :
+        self.stats.record(getattr(conn, 'sock', None) is not None)
+        response, content = httplib2.Http._conn_request(self, conn, request_uri, method, body, headers)
+        self.received += len(content or '')
+        return response, content
+
+class DiscoveryCache :
+    """On-disk copy of an API discovery document so clients can be built offline."""
+    FORMAT_VERSION = 1
+
+    def __init__(self, path, url, maxAge) :
+        self.path = path
+        self.url = url
+        self.maxAge = maxAge
+        self.lock = Lock()
+        self.__document = None
+
+    def load(self) :
+        try :
+            cache = open(self.path, 'rb')
+            state = json.load(cache)
+            cache.close()
+        except (IOError, ValueError) :
+            return None
+
+        if state.get('format') != self.FORMAT_VERSION or state.get('url') != self.url :
+            return None
+
+        return state
+
+    def store(self, document) :
+        state = { 'format' : self.FORMAT_VERSION, 'url' : self.url,
+                  'fetched' : int(time.time()), 'document' : document }
+        tmppath = self.path + '.tmp'
+        cache = open(tmppath, 'wb')
+        json.dump(state, cache)
+        cache.close()
+        os.rename(tmppath, self.path)
+
+    def fetch(self, http) :
+        response, content = http.request(self.url)
+
+        if response.status >= 400 :
+            raise DiscoveryError('Unable to fetch %s (status %d)' % (self.url, response.status))
+
+        return json.loads(content)
+
+    def document(self, http) :
+        with self.lock :
+            if self.__document :
+                return self.__document
+
+            state = self.load()
+
+            if not state or time.time() - state['fetched'] > self.maxAge :
+                try :
+                    self.store(self.fetch(http))
+                    state = self.load()
+                except (DiscoveryError, httplib2.HttpLib2Error, IOError) :
+                    # A stale document is still better than no client at all
+                    if not state :
+                        raise
+
+            self.__document = state['document']
+            return self.__document
+
+class ClientLease :
+    """One thread's client, handed back to its pool when the thread ends."""
+
+    def __init__(self, idle, http, authorized, service=None) :
+        self.idle = idle
+        self.http = http
+        self.authorized = authorized
+        self.service = service
+
+    def __del__(self) :
+        #Thread locals are dropped when their thread exits
+        self.idle.append((self.http, self.authorized, self.service))
+
+class ClientPool :
+    """Builds long-lived API clients that each belong to one thread at a time, sharing the discovery document.
+
+    A client left behind by a thread that has finished is taken up by the next new thread, so
+    short-lived threads like the GUI loaders don't build a client and open connections every time."""
+
+    def __init__(self, credentials, discovery) :
+        self.credentials = credentials
+        self.discovery = discovery
+        self.connectionStats = ConnectionStats()
+        self.local = local()
+        self.lock = Lock()
+        self.idle = []
+        self.clientCount = 0
+
+    def lease(self) :
+        if not hasattr(self.local, 'lease') :
+            try :
+                self.local.lease = ClientLease(self.idle, *self.idle.pop())
+            except IndexError :
+                http = PooledHttp(self.connectionStats)
+                self.local.lease = ClientLease(self.idle, http, self.credentials.authorize(http))
+
+        return self.local.lease
+
+    def http(self) :
+        return self.lease().authorized
+
+    def service(self) :
+        lease = self.lease()
+
+        if not lease.service :
+            document = self.discovery.document(lease.http)
+            lease.service = build_from_document(document, http=self.http())
+
+            with self.lock :
+                self.clientCount += 1
+
+        return lease.service
+
+    def received(self) :
+        return self.lease().http.received
+
+    def batchUri(self) :
+        document = self.discovery.document(self.http())
+        return document.get('rootUrl', 'https://www.googleapis.com/') + document.get('batchPath', 'batch')
+
+    def stats(self) :
+        stats = self.connectionStats.values()
+        stats['clients'] = self.clientCount
+        return stats
+
+class ListCall :
+    """One logical list request, possibly spanning several pages."""
+
+    def __init__(self, requestObj, options, multipage=True, until=None, maxPages=None) :
+        self.requestObj = requestObj
+        self.options = options
+        self.multipage = multipage
+        self.until = until
+        self.maxPages = maxPages
+        self.request = requestObj.list(**options)
+        self.endpoint = getattr(self.request, 'methodId', None) or 'unknown.list'
+        self.items = []
+        self.pages = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self.total = None
+        self.pageToken = None
+        self.error = None
+        self.attempts = 0
+
+    def done(self) :
+        return self.request is None
+
+    def key(self) :
+        """Identifies calls that would fetch the same thing, or None if this one can't be shared."""
+        if self.until :
+            return None
+
+        options = []
+        for name, value in sorted(self.options.items()) :
+            if isinstance(value, basestring) :
+                value = re.sub(r'\s*,\s*', ',', value.strip())
+                if name == 'part' :
+                    value = ','.join(sorted(value.split(',')))
+            options.append((name, value))
+
+        return (self.endpoint, tuple(options), self.multipage, self.maxPages)
+
+    def share(self, other) :
+        """Take the results of an identical call made by someone else."""
+        self.items = list(other.items)
+        self.pages = other.pages
+        self.total = other.total
+        self.pageToken = other.pageToken
+        self.error = other.error
+        self.request = None
+
+    def handle(self, response) :
+        items = response.get('items', [])
+        self.items += items
+        self.pages += 1
+        self.attempts = 0
+        self.total = response.get('pageInfo', {}).get('totalResults', self.total)
+        self.pageToken = response.get('nextPageToken')
+
+        if not self.multipage or (self.until and self.until(items)) or self.pages == self.maxPages :
+            self.request = None
+        else :
+            self.request = self.requestObj.list_next(self.request, response)
+
+    def fail(self, error) :
+        self.error = error
+        self.request = None
+
+class BatchExecutor :
+    """Runs list calls page by page, packing each round of pages into multipart batches.
+
+    With a limiter each round waits for its quota first, and throttled pages are sent again
+    in a later round once the limiter's backoff has passed."""
+    MAX_BATCH_SIZE = 50
+    NOT_MODIFIED = 304
+
+    def __init__(self, clients, cache=None, limiter=None) :
+        self.clients = clients
+        self.cache = cache
+        self.limiter = limiter
+
+    def execute(self, calls) :
+        pending = [call for call in calls if not call.done()]
+
+        while pending :
+            for offset in range(0, len(pending), self.MAX_BATCH_SIZE) :
+                self.executeRound(pending[offset:offset + self.MAX_BATCH_SIZE])
+
+            pending = [call for call in pending if not call.done()]
+
+        return calls
+
+    def executeRound(self, calls) :
+        if self.limiter :
+            try :
+                self.limiter.acquire(sum([ApiStats.cost(call.endpoint) for call in calls]))
+            except QuotaExceededError, e :
+                for call in calls :
+                    call.fail(e)
+                return
+
+        started = time.time()
+        received = self.clients.received()
+
+        try :
+            self.sendRound(calls)
+        finally :
+            #Calls sharing a batch share its cost
+            elapsed = time.time() - started
+            size = (self.clients.received() - received) / len(calls)
+            for call in calls :
+                call.elapsed += elapsed
+                call.bytes += size
+
+    def sendRound(self, calls) :
+        for call in calls :
+            self.prepare(call)
+
+        if len(calls) == 1 :
+            call = calls[0]
+            try :
+                self.complete(call, call.request.execute(http=self.clients.http()), None)
+            except HttpError, e :
+                self.complete(call, None, e)
+            return
+
+        batch = BatchHttpRequest(batch_uri=self.clients.batchUri())
+
+        for index, call in enumerate(calls) :
+            batch.add(call.request, callback=self.callback(call), request_id=str(index))
+
+        batch.execute(http=self.clients.http())
+
+    def prepare(self, call) :
+        etag = self.cache.etag(call.request.uri) if self.cache else None
+
+        if etag :
+            call.request.headers['If-None-Match'] = etag
+
+    def complete(self, call, response, exception) :
+        signature = call.request.uri
+
+        if exception :
+            reason = throttled(exception) if self.limiter else None
+
+            if self.cache and getattr(exception, 'resp', None) and exception.resp.status == self.NOT_MODIFIED :
+                body = self.cache.hit(signature)
+                if body is None :
+                    #Evicted while the request was out, so ask again for the whole page next round
+                    call.request.headers.pop('If-None-Match', None)
+                else :
+                    call.handle(body)
+            elif reason == 'rate' and call.attempts < self.limiter.MAX_RETRIES :
+                #Leaving the request in place sends the same page again next round
+                call.attempts += 1
+                self.limiter.backoff(call.attempts)
+            elif reason == 'quota' :
+                self.limiter.exhaust()
+                call.fail(QuotaExceededError(str(exception)))
+            else :
+                call.fail(exception)
+            return
+
+        if self.cache :
+            self.cache.store(signature, response)
+
+        call.handle(response)
+
+    def callback(self, call) :
+        def handle(requestId, response, exception) :
+            self.complete(call, response, exception)
+
+        return handle
@@ -0,0 +1,89 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# ISO 8601 durations and timestamps as used by the YouTube Data API
+
+import re
+import calendar
+
+DURATION_REGEX = re.compile('P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+(?:\.\d*)?)S)?)?$')
+DURATION_UNITS = (7 * 86400, 86400, 3600, 60)
+TIMESTAMP_REGEX = re.compile('(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?(Z|[-+]\d\d:?\d\d)?$')
+
+#Most videos share a handful of durations and upload days so both are memoised
+durations = dict()
+days = dict()
+
+def parseDuration(text) :
+    """Seconds in a duration such as PT1H2M3S or P1DT4H."""
+    seconds = durations.get(text)
+
+    if seconds is None :
+        match = DURATION_REGEX.match(text)
+
+        if not match or text == 'P' or text.endswith('T') :
+            raise ValueError('Invalid ISO 8601 duration: %s' % text)
+
+        values = match.groups()
+        seconds = sum([int(value) * unit for value, unit in zip(values, DURATION_UNITS) if value])
+
+        if values[4] :
+            seconds += int(float(values[4]))
+
+        durations[text] = seconds
+
+    return seconds
+
+def parseTimestamp(text) :
+    """Seconds since the epoch of a timestamp such as 2013-12-01T10:00:00.000Z, UTC if no offset is given."""
+
+    #Fast path for the fixed width form the API always returns
+    if len(text) == 24 and text[19] == '.' and text[23] == 'Z' and text[10] == 'T' :
+        day = text[:10]
+        try :
+            return dayStart(day) + int(text[11:13]) * 3600 + int(text[14:16]) * 60 + int(text[17:19])
+        except ValueError :
+            pass
+
+    match = TIMESTAMP_REGEX.match(text)
+
+    if not match :
+        raise ValueError('Invalid ISO 8601 timestamp: %s' % text)
+
+    values = match.groups()
+    seconds = dayStart('-'.join(values[:3])) + int(values[3]) * 3600 + int(values[4]) * 60 + int(values[5])
+    offset = values[6]
+
+    if offset and offset != 'Z' :
+        minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+        seconds -= minutes * 60 if offset[0] == '+' else -minutes * 60
+
+    return seconds
+
+def dayStart(day) :
+    seconds = days.get(day)
+
+    if seconds is None :
+        year, month, date = int(day[:4]), int(day[5:7]), int(day[8:10])
+
+        if not 1 <= month <= 12 or not 1 <= date <= calendar.monthrange(year, month)[1] :
+            raise ValueError('Invalid date: %s' % day)
+
+        seconds = days[day] = calendar.timegm((year, month, date, 0, 0, 0))
+
+    return seconds
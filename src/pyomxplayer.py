@@ -62,9 +62,9 @@ class OMXPlayer(QThread) :
         self.videoHandler = videoHandler
         self.args = self._OMXPLAYER_ARGS % ('', videoHandler.filename())
         
-        if 'lastPosition' in videoHandler.details :
-            self.args += ' --pos %d' % videoHandler.details['lastPosition']
-            self.__position = videoHandler.details['lastPosition']
+        if videoHandler.lastPosition != None :
+            self.args += ' --pos %d' % videoHandler.lastPosition
+            self.__position = videoHandler.lastPosition
         else :
             self.__position = 0
         
@@ -178,7 +178,7 @@ class OMXPlayer(QThread) :
             
             if position >= 1 and position < 10**6 :
                 print "Position: " + str(position)
-                self.videoHandler.details['lastPosition'] = position
+                self.videoHandler.lastPosition = position
                 __position = position
                         
         except IOError :
@@ -190,7 +190,7 @@ class OMXPlayer(QThread) :
         #self.controls.disconnect()
          
     def aborted(self) :
-        self.videoHandler.details['lastPosition'] = 0
+        self.videoHandler.lastPosition = 0
         print "video finished"
     
     def position(self) :
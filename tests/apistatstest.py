@@ -0,0 +1,55 @@
+from ApiStats import ApiStats, Histogram
+import unittest
+import json
+import tempfile
+import os
+
+class ApiStatsTest(unittest.TestCase) :
+    def setUp(self) :
+        self.stats = ApiStats()
+
+    def test_record(self) :
+        self.stats.record('youtube.videos.list', 2, 1000, 0.1)
+        self.stats.record('youtube.videos.list', 1, 500, 0.3, '403')
+        self.stats.record('youtube.playlistItems.insert', 1, 200, 0.2)
+        snapshot = self.stats.snapshot()
+
+        videos = snapshot['youtube.videos.list']
+        self.assertEqual(videos['calls'], 2)
+        self.assertEqual(videos['pages'], 3)
+        self.assertEqual(videos['bytes'], 1500)
+        self.assertEqual(videos['quota'], 3)
+        self.assertEqual(videos['errors'], { '403' : 1 })
+        self.assertEqual(snapshot['youtube.playlistItems.insert']['quota'], 50)
+        self.assertEqual(self.stats.quotaUsed(), 53)
+
+    def test_refused(self) :
+        self.stats.record('youtube.videos.list', 0, 0, 0.0, 'QuotaExceededError', False)
+        videos = self.stats.snapshot()['youtube.videos.list']
+
+        self.assertEqual(videos['calls'], 1)
+        self.assertEqual(videos['errors'], { 'QuotaExceededError' : 1 })
+        self.assertEqual(videos['quota'], 0)
+        self.assertEqual(videos['latency']['count'], 0)
+
+    def test_histogram(self) :
+        histogram = Histogram()
+        for value in [1, 3, 3, 100, 70000] :
+            histogram.add(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 5)
+        self.assertEqual(snapshot['p50'], 4)
+        self.assertEqual(snapshot['buckets'], { '<=1' : 1, '<=4' : 2, '<=128' : 1, '>65536' : 1 })
+
+    def test_dump(self) :
+        self.stats.record('youtube.channels.list', 1, 10, 0.01)
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.stats.dump(path)
+
+        self.assertEqual(json.load(open(path))['youtube.channels.list']['calls'], 1)
+        os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from YouTubeClient import BatchExecutor, ListCall
+from ResponseCache import ResponseCache
+import unittest
+
+class FakeResponse :
+    def __init__(self, status) :
+        self.status = status
+
+class FakeError(Exception) :
+    def __init__(self, status) :
+        Exception.__init__(self, status)
+        self.resp = FakeResponse(status)
+
+class FakeRequest :
+    methodId = 'youtube.videos.list'
+
+    def __init__(self, uri) :
+        self.uri = uri
+        self.headers = dict()
+
+class FakeRequests :
+    def list(self, **options) :
+        return FakeRequest('/videos?id=%s' % options['id'])
+
+    def list_next(self, request, response) :
+        return None
+
+class BatchExecutorTest(unittest.TestCase) :
+    def setUp(self) :
+        self.cache = ResponseCache(10)
+        self.executor = BatchExecutor(None, self.cache)
+
+    def call(self, id='a') :
+        return ListCall(FakeRequests(), { 'id' : id }, False)
+
+    def test_store(self) :
+        call = self.call()
+        self.executor.prepare(call)
+        self.assertFalse('If-None-Match' in call.request.headers)
+
+        self.executor.complete(call, { 'etag' : 'e1', 'items' : [1] }, None)
+        self.assertEqual(call.items, [1])
+        self.assertEqual(self.cache.etag('/videos?id=a'), 'e1')
+
+    def test_notModified(self) :
+        self.executor.complete(self.call(), { 'etag' : 'e1', 'items' : [1] }, None)
+
+        call = self.call()
+        self.executor.prepare(call)
+        self.assertEqual(call.request.headers['If-None-Match'], 'e1')
+
+        self.executor.complete(call, None, FakeError(304))
+        self.assertEqual(call.items, [1])
+        self.assertEqual(call.error, None)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_notModifiedEvicted(self) :
+        self.executor.complete(self.call(), { 'etag' : 'e1', 'items' : [1] }, None)
+        call = self.call()
+        self.executor.prepare(call)
+        self.cache.entries.clear()
+
+        #Nothing left to answer the 304 with, so the page is asked for again in full
+        self.executor.complete(call, None, FakeError(304))
+        self.assertFalse(call.done())
+        self.assertFalse('If-None-Match' in call.request.headers)
+
+        self.executor.complete(call, { 'etag' : 'e2', 'items' : [2] }, None)
+        self.assertEqual(call.items, [2])
+
+    def test_error(self) :
+        call = self.call()
+        error = FakeError(500)
+        self.executor.complete(call, None, error)
+
+        self.assertTrue(call.error is error)
+        self.assertTrue(call.done())
+
+if __name__ == '__main__':
+    unittest.main()
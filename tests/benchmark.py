@@ -0,0 +1,214 @@
+#!/usr/bin/python
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Times the YouTube service layer against the local fake API.
+#
+#   benchmark.py [--latency SECONDS] [--replay FILE] [--json FILE]
+#   benchmark.py --record FILE
+#
+# --record runs the same scenarios against the real API with the stored
+# credentials and saves every exchange so --replay can serve them offline.
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import constants
+from Settings import Settings
+from fakeyoutube import FakeYouTubeServer, SyntheticFixtures, RecordedFixtures, RecordingHttp, saveRecords
+
+def residentMemory() :
+    statm = open('/proc/self/statm')
+    pages = int(statm.read().split()[1])
+    statm.close()
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+class FakeCredentials :
+    invalid = False
+
+    def authorize(self, http) :
+        return http
+
+class Benchmark :
+    def __init__(self, server=None, records=None) :
+        self.server = server
+        self.records = records
+        self.directory = tempfile.mkdtemp()
+        self.results = []
+
+    def createService(self) :
+        from VideoManager import VideoManager
+        from YouTube import YouTubeService
+        from YouTubeClient import ClientPool
+
+        if not os.path.exists(constants.DATA_DIR) :
+            os.mkdir(constants.DATA_DIR)
+
+        Settings.load(os.path.join(self.directory, 'options.xml'))
+        YouTubeService.CATALOG_PATH = os.path.join(self.directory, 'catalog.db')
+        YouTubeService.STATS_PATH = os.path.join(self.directory, 'stats.json')
+
+        if self.server :
+            YouTubeService.DISCOVERY_PATH = os.path.join(self.directory, 'discovery.json')
+            YouTubeService.DISCOVERY_URL = self.server.discoveryUrl()
+
+        service = YouTubeService(VideoManager())
+
+        if self.server :
+            service.setCredentials(FakeCredentials())
+        else :
+            records = self.records
+
+            class RecordingClientPool(ClientPool) :
+                def http(self) :
+                    if not hasattr(self.local, 'recording') :
+                        self.local.recording = RecordingHttp(ClientPool.http(self), records)
+                    return self.local.recording
+
+            service.setCredentials(service.credentials,
+                                   RecordingClientPool(service.credentials, service.discovery))
+            # Single requests can be replayed through batches, but not the other way round
+            service.batches.MAX_BATCH_SIZE = 1
+
+        return service
+
+    def measure(self, name, function) :
+        if self.server :
+            self.server.resetCount()
+
+        started = time.time()
+        result = function()
+        elapsed = time.time() - started
+        requests = self.server.requests if self.server else None
+
+        self.results.append({ 'name' : name, 'seconds' : elapsed, 'requests' : requests })
+        print '%-40s %8.3fs %8s requests' % (name, elapsed, requests if requests != None else '-')
+        return result
+
+    def run(self) :
+        service = self.createService()
+        self.measure('authentication', service.postAuthentication)
+
+        history = service.userPlaylist('watchHistory')
+        self.measure('watch history first page', history.execute)
+        self.measure('watch history refresh', history.execute)
+        self.measure('watch history next page', history.fetchMore)
+
+        itemId = lambda video : video
+        ids = [video.id() for video in history.result()]
+        service.videos.cache.clear()
+        self.measure('fetchVideos %d cached ids' % len(ids), lambda : service.fetchVideos(ids, itemId, itemId))
+
+        from YouTube import YouTubeSubscriptionPlaylist
+        subscriptions = YouTubeSubscriptionPlaylist(service)
+        self.measure('subscriptions cold', subscriptions.execute)
+        self.measure('subscriptions warm', subscriptions.execute)
+
+        if self.server :
+            from YouTube import YouTubeSubscriptionFeedPlaylist
+            YouTubeSubscriptionFeedPlaylist.FEED_URL = self.server.feedUrl()
+            feeds = YouTubeSubscriptionFeedPlaylist(service)
+            self.measure('subscription feeds cold', feeds.execute)
+            self.measure('subscription feeds warm', feeds.execute)
+
+        if self.server :
+            uncached = sorted(self.server.fixtures.videos.keys())[-200:]
+            self.measure('fetchVideos %d catalogue ids' % len(uncached),
+                         lambda : service.fetchVideos(uncached, itemId, itemId))
+
+        self.measureIngest(service)
+        self.measureMemory(service)
+        self.stats = { 'api' : service.apiStats(), 'connections' : service.connectionStats(),
+                       'responses' : service.responseCacheStats(), 'channels' : service.channelStats(),
+                       'quota' : service.quotaStats(), 'inflight' : service.inflightStats(),
+                       'feeds' : service.feedStats(), 'push' : service.pushStats() }
+        service.cleanup()
+        return self.results
+
+    def measureIngest(self, service, count=20000) :
+        from YouTube import YouTubeVideoHandler
+
+        items = SyntheticFixtures(channels=20, videosPerChannel=count / 20, historyLength=0).videos.values()
+        started = time.time()
+        for offset in range(0, len(items), 50) :
+            YouTubeVideoHandler.ingest(service, items[offset:offset + 50])
+        perThousand = (time.time() - started) * 1000.0 / len(items)
+
+        self.results.append({ 'name' : 'ingest per 1000 items', 'seconds' : perThousand, 'records' : len(items) })
+        print '%-40s %8.3fs' % ('ingest per 1000 items', perThousand)
+
+    def measureMemory(self, service, count=50000) :
+        """Resident memory added per video record, with lean metadata as the list views load it."""
+        from YouTube import YouTubeVideoHandler
+
+        fixtures = SyntheticFixtures(channels=50, videosPerChannel=count / 50, historyLength=0)
+        items = fixtures.videos.values()
+        for item in items :
+            del item['snippet']['description']
+
+        gc.collect()
+        before = residentMemory()
+        records = [YouTubeVideoHandler(service, item) for item in items]
+        gc.collect()
+        perRecord = float(residentMemory() - before) / len(records)
+
+        self.results.append({ 'name' : 'memory per record', 'bytes' : perRecord, 'records' : len(records) })
+        print '%-40s %8d bytes (%d records)' % ('memory per record', perRecord, len(records))
+
+    def cleanup(self) :
+        shutil.rmtree(self.directory)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the YouTube service layer')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to each fake request')
+    parser.add_argument('--record', help='record the real API into this file')
+    parser.add_argument('--replay', help='serve responses recorded with --record')
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    server = None
+    records = []
+    if not args.record :
+        fixtures = RecordedFixtures(args.replay) if args.replay else SyntheticFixtures()
+        server = FakeYouTubeServer(fixtures, args.latency).start()
+
+    benchmark = Benchmark(server, records)
+    try :
+        results = benchmark.run()
+    finally :
+        benchmark.cleanup()
+        if server :
+            server.stop()
+
+    print json.dumps(benchmark.stats, indent=2, sort_keys=True)
+
+    if args.record :
+        saveRecords(records, args.record)
+
+    if args.json :
+        resultFile = open(args.json, 'w')
+        json.dump({ 'results' : results, 'stats' : benchmark.stats }, resultFile, indent=2)
+        resultFile.close()
@@ -0,0 +1,139 @@
+from Catalog import Catalog, CatalogMapping
+import Catalog as catalogModule
+import unittest
+import tempfile
+import shutil
+import os.path
+
+class FakeClock :
+    def __init__(self) :
+        self.now = 1000
+
+    def time(self) :
+        return self.now
+
+def videoItem(id, channelId='channel', publishedAt='2013-12-01T10:00:00.000Z') :
+    return { 'id' : id, 'snippet' : { 'channelId' : channelId, 'publishedAt' : publishedAt } }
+
+class CatalogTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'catalog.db')
+        self.catalog = Catalog(self.path)
+        self.time = catalogModule.time
+
+    def tearDown(self) :
+        catalogModule.time = self.time
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def test_videos(self) :
+        self.catalog.storeVideos([videoItem('a'), videoItem('b')])
+        videos = self.catalog.videos(['a', 'c'])
+
+        self.assertEqual(videos.keys(), ['a'])
+        self.assertEqual(videos['a']['snippet']['channelId'], 'channel')
+        self.assertEqual(self.catalog.videoCount(), 2)
+
+    def test_persistence(self) :
+        self.catalog.storeVideos([videoItem('a')])
+        self.catalog.close()
+        self.catalog = Catalog(self.path)
+
+        self.assertEqual(self.catalog.videos(['a'])['a']['id'], 'a')
+
+    def test_positions(self) :
+        self.catalog.storePosition('a', 12.5)
+        self.assertEqual(self.catalog.position('a'), 12.5)
+        self.assertEqual(self.catalog.position('b'), None)
+
+        self.catalog.storePosition('a', None)
+        self.assertEqual(self.catalog.position('a'), None)
+
+    def test_tombstones(self) :
+        self.catalog.storeTombstones(['a', 'b'])
+        tombstones = self.catalog.tombstones(['a', 'c'])
+
+        self.assertEqual(tombstones.keys(), ['a'])
+        self.assertTrue(tombstones['a'] > 0)
+
+        self.catalog.removeTombstones(['a'])
+        self.assertEqual(self.catalog.tombstones(['a', 'b']).keys(), ['b'])
+
+    def test_playlistPrepend(self) :
+        first = [('i2', 'b'), ('i1', 'a')]
+        self.catalog.storePlaylist('p', { 'complete' : True }, first)
+        second = [('i3', 'c')] + first
+        self.catalog.storePlaylist('p', { 'complete' : True }, second)
+
+        details, items = self.catalog.playlist('p')
+        self.assertEqual(details, { 'complete' : True })
+        self.assertEqual(items, second)
+
+    def test_playlistPrependRemove(self) :
+        first = [('i2', 'b'), ('i1', 'a')]
+        self.catalog.storePlaylist('p', {}, first)
+        second = [('i3', 'c'), ('i2', 'b')]
+        self.catalog.storePlaylist('p', {}, second)
+
+        self.assertEqual(self.catalog.playlist('p')[1], second)
+
+    def test_playlistStoredAgain(self) :
+        first = [('i2', 'b'), ('i1', 'a')]
+        self.catalog.storePlaylist('p', {}, first)
+        second = [('i3', 'c')] + first
+        self.catalog.storePlaylist('p', {}, second)
+        self.catalog.storePlaylist('p', {}, second)
+
+        self.assertEqual(self.catalog.playlist('p')[1], second)
+
+    def test_playlistAppend(self) :
+        first = [('i2', 'b'), ('i1', 'a')]
+        self.catalog.storePlaylist('p', { 'pageToken' : 'next' }, first)
+        second = first + [('i0', 'c')]
+        self.catalog.storePlaylist('p', { 'pageToken' : None }, second)
+
+        details, items = self.catalog.playlist('p')
+        self.assertEqual(details, { 'pageToken' : None })
+        self.assertEqual(items, second)
+
+    def test_playlistReplace(self) :
+        first = [('i2', 'b'), ('i1', 'a')]
+        self.catalog.storePlaylist('p', {}, first)
+        second = [('i1', 'a'), ('i3', 'c')]
+        self.catalog.storePlaylist('p', {}, second)
+
+        self.assertEqual(self.catalog.playlist('p')[1], second)
+
+    def test_trimResponses(self) :
+        catalogModule.time = FakeClock()
+        self.catalog.storeResponse('a', 'ea', {})
+        catalogModule.time.now += 1
+        self.catalog.storeResponse('b', 'eb', {})
+        self.catalog.storeFeedResponse('http://feed', 'ef', { 'ids' : [] })
+        catalogModule.time.now += 1
+        self.catalog.touchResponse('a')
+        self.catalog.trimResponses(1)
+
+        #b was written later but a was used last, and feeds aren't trimmed at all
+        self.assertEqual(self.catalog.response('a'), ('ea', {}))
+        self.assertEqual(self.catalog.response('b'), None)
+        self.assertEqual(self.catalog.feedResponse('http://feed'), ('ef', { 'ids' : [] }))
+
+    def test_mapping(self) :
+        self.catalog.storeVideos([videoItem('a'), videoItem('b')])
+        created = []
+        mapping = CatalogMapping(self.catalog.videos, lambda item : created.append(item['id']) or item['id'])
+
+        self.assertTrue('a' in mapping)
+        self.assertFalse('c' in mapping)
+        self.assertEqual(mapping.fetch(['a', 'b']), { 'a' : 'a', 'b' : 'b' })
+        self.assertEqual(created, ['a', 'b'])
+
+        self.catalog.removeVideos(['a'])
+        mapping.discard(['a'])
+        self.assertFalse('a' in mapping)
+        self.assertTrue('b' in mapping)
+
+if __name__ == '__main__':
+    unittest.main()
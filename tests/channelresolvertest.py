@@ -0,0 +1,51 @@
+from ChannelResolver import ChannelResolver
+from Catalog import Catalog
+import unittest
+import tempfile
+import shutil
+import os.path
+
+class ChannelResolverTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'catalog.db')
+        self.catalog = Catalog(self.path)
+        self.requests = []
+
+    def tearDown(self) :
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def fetch(self, ids) :
+        self.requests.append(list(ids))
+        return [{ 'id' : id, 'snippet' : { 'title' : 'Channel ' + id } } for id in ids if id != 'gone']
+
+    def test_batches(self) :
+        resolver = ChannelResolver(self.catalog, self.fetch, 60)
+        result = resolver.resolve(['a', 'b', 'gone', 'a'])
+
+        self.assertEqual(sorted(result.keys()), ['a', 'b'])
+        self.assertEqual(self.requests, [['a', 'b', 'gone']])
+
+        resolver.resolve(['a', 'c'])
+        self.assertEqual(self.requests[1:], [['c']])
+        self.assertEqual(resolver['b']['snippet']['title'], 'Channel b')
+        self.assertFalse('gone' in resolver)
+
+    def test_disk(self) :
+        ChannelResolver(self.catalog, self.fetch, 60).resolve(['a'])
+        resolver = ChannelResolver(self.catalog, self.fetch, 60)
+
+        self.assertEqual(resolver.get('a')['id'], 'a')
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(resolver.stats()['disk'], 1)
+
+    def test_expiry(self) :
+        ChannelResolver(self.catalog, self.fetch, 60).resolve(['a'])
+        resolver = ChannelResolver(self.catalog, self.fetch, -1)
+
+        resolver.get('a')
+        self.assertEqual(self.requests, [['a'], ['a']])
+
+if __name__ == '__main__':
+    unittest.main()
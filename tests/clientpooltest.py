@@ -0,0 +1,109 @@
+from YouTubeClient import ClientPool, DiscoveryCache, DiscoveryError
+import YouTubeClient
+import httplib2
+import unittest
+import tempfile
+import shutil
+import json
+import time
+import os.path
+from threading import Thread
+
+class FakeResponse :
+    def __init__(self, status) :
+        self.status = status
+
+class FakeHttp :
+    def __init__(self, document=None, status=200) :
+        self.document = document
+        self.status = status
+        self.requests = 0
+
+    def request(self, url) :
+        self.requests += 1
+        if self.document is None :
+            raise httplib2.ServerNotFoundError('offline')
+        return FakeResponse(self.status), json.dumps(self.document)
+
+class FakeCredentials :
+    def authorize(self, http) :
+        return http
+
+class FakeDiscovery :
+    def document(self, http) :
+        return { 'rootUrl' : 'http://localhost/' }
+
+class DiscoveryCacheTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'discovery.json')
+
+    def tearDown(self) :
+        shutil.rmtree(self.dir)
+
+    def cache(self, url='http://api/rest', maxAge=3600) :
+        return DiscoveryCache(self.path, url, maxAge)
+
+    def test_stored(self) :
+        self.assertEqual(self.cache().document(FakeHttp({ 'v' : 1 })), { 'v' : 1 })
+
+        #Read back from disk without asking again
+        http = FakeHttp({ 'v' : 2 })
+        self.assertEqual(self.cache().document(http), { 'v' : 1 })
+        self.assertEqual(http.requests, 0)
+
+    def test_changed(self) :
+        self.cache().document(FakeHttp({ 'v' : 1 }))
+        self.assertEqual(self.cache('http://other/rest').document(FakeHttp({ 'v' : 2 })), { 'v' : 2 })
+
+        state = json.load(open(self.path))
+        state['format'] = DiscoveryCache.FORMAT_VERSION + 1
+        json.dump(state, open(self.path, 'w'))
+        self.assertEqual(self.cache('http://other/rest').document(FakeHttp({ 'v' : 3 })), { 'v' : 3 })
+
+    def test_staleOffline(self) :
+        self.cache().document(FakeHttp({ 'v' : 1 }))
+        state = json.load(open(self.path))
+        state['fetched'] = int(time.time()) - 7200
+        json.dump(state, open(self.path, 'w'))
+
+        #Too old, but still used when the fetch fails
+        http = FakeHttp()
+        self.assertEqual(self.cache().document(http), { 'v' : 1 })
+        self.assertEqual(http.requests, 1)
+        self.assertRaises(DiscoveryError, self.cache('http://other/rest').document, FakeHttp({}, 404))
+
+class ClientPoolTest(unittest.TestCase) :
+    def setUp(self) :
+        self.build = YouTubeClient.build_from_document
+        YouTubeClient.build_from_document = lambda document, http : object()
+        self.pool = ClientPool(FakeCredentials(), FakeDiscovery())
+
+    def tearDown(self) :
+        YouTubeClient.build_from_document = self.build
+
+    def inThread(self) :
+        services = []
+        thread = Thread(target=lambda : services.append(self.pool.service()))
+        thread.start()
+        thread.join()
+        return services[0]
+
+    def test_perThread(self) :
+        service = self.pool.service()
+        self.assertTrue(self.pool.service() is service)
+        self.assertTrue(self.pool.http() is self.pool.http())
+
+        #Another thread gets its own while this one holds on to it
+        self.assertFalse(self.inThread() is service)
+        self.assertEqual(self.pool.stats()['clients'], 2)
+
+    def test_finishedThread(self) :
+        first = self.inThread()
+
+        #A client left by a thread that has ended is taken up by the next one
+        self.assertTrue(self.inThread() is first)
+        self.assertEqual(self.pool.stats()['clients'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local stand-in for a WebSub hub. It takes subscription requests, checks them with
+# the subscriber's callback like a real hub would, and publishes signed content to
+# whoever is subscribed to a topic.
+
+import hashlib
+import hmac
+import os
+import urllib
+import urllib2
+import urlparse
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from threading import Condition, Thread
+
+class HubHandler(BaseHTTPRequestHandler) :
+    def do_POST(self) :
+        body = self.rfile.read(int(self.headers.getheader('Content-Length') or 0))
+        form = dict(urlparse.parse_qsl(body))
+
+        if not form.get('hub.topic') or not form.get('hub.callback') :
+            self.reply(400)
+            return
+
+        self.reply(202)
+        Thread(target=self.server.hub.verify, args=(form,)).start()
+
+    def reply(self, status) :
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args) :
+        pass
+
+class HubServer(ThreadingMixIn, HTTPServer) :
+    daemon_threads = True
+
+class FakeHub :
+    def __init__(self) :
+        self.condition = Condition()
+        self.subscriptions = dict()
+        self.server = HubServer(('127.0.0.1', 0), HubHandler)
+        self.server.hub = self
+        Thread(target=self.server.serve_forever).start()
+
+    def url(self) :
+        return 'http://127.0.0.1:%d/subscribe' % self.server.server_address[1]
+
+    def close(self) :
+        self.server.shutdown()
+        self.server.server_close()
+
+    def verify(self, form) :
+        challenge = os.urandom(8).encode('hex')
+        query = urllib.urlencode({ 'hub.mode' : form['hub.mode'], 'hub.topic' : form['hub.topic'],
+                                   'hub.challenge' : challenge,
+                                   'hub.lease_seconds' : form.get('hub.lease_seconds', 86400) })
+        try :
+            response = urllib2.urlopen(form['hub.callback'] + '?' + query)
+            confirmed = response.read() == challenge
+        except urllib2.URLError :
+            confirmed = False
+
+        with self.condition :
+            if confirmed and form['hub.mode'] == 'subscribe' :
+                self.subscriptions[form['hub.topic']] = (form['hub.callback'], form.get('hub.secret', ''))
+            elif confirmed :
+                self.subscriptions.pop(form['hub.topic'], None)
+            self.condition.notify_all()
+
+    def waitFor(self, topic, subscribed=True, timeout=5) :
+        with self.condition :
+            if (topic in self.subscriptions) != subscribed :
+                self.condition.wait(timeout)
+            return (topic in self.subscriptions) == subscribed
+
+    def publish(self, topic, body, secret=None) :
+        """Push body to the topic's subscriber, signed with its secret unless another is given."""
+        callback, subscriberSecret = self.subscriptions[topic]
+        signature = hmac.new(secret if secret != None else subscriberSecret, body, hashlib.sha1).hexdigest()
+        request = urllib2.Request(callback, body, { 'Content-Type' : 'application/atom+xml',
+                                                   'X-Hub-Signature' : 'sha1=' + signature })
+        response = urllib2.urlopen(request)
+        response.read()
+        return response.getcode()
@@ -0,0 +1,468 @@
+#
+#    Copyright 2013 Josh Andrews
+#
+#    This file is part of PiTube
+#
+#    PiTube is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    PiTube is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Local stand-in for the parts of the YouTube Data API used by PiTube. It serves
+# either synthetic data or responses recorded from the real API, with optional
+# latency and injected errors, so the service layer can be measured offline.
+
+import email
+import hashlib
+import json
+import random
+import time
+import urlparse
+from datetime import datetime, timedelta
+from threading import Lock, Thread
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+API_PATH = '/youtube/v3/'
+DISCOVERY_PATH = '/discovery/v1/apis/youtube/v3/rest'
+BATCH_PATH = '/batch'
+FEED_PATH = '/feeds/videos.xml'
+FEED = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">%s</feed>')
+FEED_ENTRY = '<entry><id>yt:video:%s</id><yt:videoId>%s</yt:videoId></entry>'
+
+def discoveryDocument(rootUrl) :
+    """Minimal discovery document describing the methods PiTube calls."""
+    listParameters = {}
+    for name, kind in [('part', 'string'), ('id', 'string'), ('maxResults', 'integer'),
+                       ('pageToken', 'string'), ('playlistId', 'string'), ('mine', 'boolean'),
+                       ('channelId', 'string')] :
+        listParameters[name] = { 'type' : kind, 'location' : 'query' }
+    listParameters['part']['required'] = True
+
+    def listMethod(resource) :
+        return { 'id' : 'youtube.%s.list' % resource, 'path' : resource, 'httpMethod' : 'GET',
+                 'parameters' : listParameters, 'parameterOrder' : ['part'],
+                 'response' : { '$ref' : 'ListResponse' } }
+
+    resources = dict((resource, { 'methods' : { 'list' : listMethod(resource) } })
+                     for resource in ['videos', 'channels', 'subscriptions', 'playlistItems'])
+    resources['playlistItems']['methods']['insert'] = {
+        'id' : 'youtube.playlistItems.insert', 'path' : 'playlistItems', 'httpMethod' : 'POST',
+        'parameters' : { 'part' : { 'type' : 'string', 'location' : 'query', 'required' : True } },
+        'parameterOrder' : ['part'], 'request' : { '$ref' : 'Resource' },
+        'response' : { '$ref' : 'Resource' } }
+    resources['playlistItems']['methods']['delete'] = {
+        'id' : 'youtube.playlistItems.delete', 'path' : 'playlistItems', 'httpMethod' : 'DELETE',
+        'parameters' : { 'id' : { 'type' : 'string', 'location' : 'query', 'required' : True } },
+        'parameterOrder' : ['id'] }
+
+    return { 'kind' : 'discovery#restDescription', 'discoveryVersion' : 'v1', 'id' : 'youtube:v3',
+             'name' : 'youtube', 'version' : 'v3', 'protocol' : 'rest',
+             'rootUrl' : rootUrl, 'servicePath' : API_PATH[1:], 'baseUrl' : rootUrl + API_PATH[1:],
+             'batchPath' : BATCH_PATH[1:],
+             'parameters' : { 'fields' : { 'type' : 'string', 'location' : 'query' },
+                              'alt' : { 'type' : 'string', 'location' : 'query', 'default' : 'json' } },
+             'schemas' : { 'ListResponse' : { 'id' : 'ListResponse', 'type' : 'object',
+                                              'properties' : { 'nextPageToken' : { 'type' : 'string' },
+                                                               'items' : { 'type' : 'array',
+                                                                           'items' : { '$ref' : 'Resource' } } } },
+                           'Resource' : { 'id' : 'Resource', 'type' : 'object' } },
+             'resources' : resources }
+
+def parseFields(text, position=0) :
+    """Parse a partial response field mask such as 'etag, items(id, snippet/title)' into a tree."""
+    tree = dict()
+
+    while position < len(text) :
+        end = position
+        while end < len(text) and not text[end] in ',()' :
+            end += 1
+
+        node = tree
+        for name in text[position:end].strip().split('/') :
+            node = node.setdefault(name, dict())
+
+        position = end
+        if position < len(text) and text[position] == '(' :
+            selection, position = parseFields(text, position + 1)
+            node.update(selection)
+            position += 1
+
+        if position < len(text) and text[position] == ')' :
+            return tree, position
+
+        position += 1
+
+    return tree, position
+
+def applyFields(value, tree) :
+    if not tree :
+        return value
+
+    if isinstance(value, list) :
+        return [applyFields(item, tree) for item in value]
+
+    if isinstance(value, dict) :
+        return dict((name, applyFields(value[name], selection)) for name, selection in tree.items()
+                    if name in value)
+
+    return value
+
+def errorBody(status, reason) :
+    return { 'error' : { 'code' : status, 'message' : reason,
+                         'errors' : [{ 'domain' : 'youtube', 'reason' : reason }] } }
+
+class SyntheticFixtures :
+    """Generated channels, uploads, user playlists and subscriptions."""
+    USER = 'UCmine'
+
+    def __init__(self, channels=20, videosPerChannel=100, historyLength=500, seed=0) :
+        self.lock = Lock()
+        self.random = random.Random(seed)
+        self.videos = dict()
+        self.channels = dict()
+        self.playlists = dict()
+        self.subscriptions = []
+        self.itemCount = 0
+        now = datetime(2013, 12, 1)
+
+        for channel in range(channels) :
+            channelId = 'UC%020d' % channel
+            self.addChannel(channelId, 'Channel %d' % channel)
+
+            for upload in range(videosPerChannel) :
+                videoId = 'v%05d%05d' % (channel, upload)
+                published = now - timedelta(hours=upload * 7 + channel)
+                self.addVideo(videoId, channelId, published)
+                self.playlists['UU' + channelId[2:]].append((self.nextItemId(), videoId))
+
+            self.subscriptions.append({ 'snippet' : { 'title' : 'Channel %d' % channel,
+                                                      'resourceId' : { 'channelId' : channelId } },
+                                        'contentDetails' : { 'newItemCount' : self.random.randint(0, 5),
+                                                             'totalItemCount' : videosPerChannel } })
+
+        self.addChannel(self.USER, 'PiTube user')
+        allVideos = sorted(self.videos.keys())
+        for name in ['favorites', 'watchLater', 'likes'] :
+            playlist = self.playlists[self.related(self.USER)[name]]
+            for videoId in self.random.sample(allVideos, min(len(allVideos), 60)) :
+                playlist.append((self.nextItemId(), videoId))
+
+        history = self.playlists[self.related(self.USER)['watchHistory']]
+        for index in range(historyLength) :
+            history.append((self.nextItemId(), self.random.choice(allVideos)))
+
+    def nextItemId(self) :
+        self.itemCount += 1
+        return 'PI%012d' % self.itemCount
+
+    @staticmethod
+    def related(channelId) :
+        suffix = channelId[2:]
+        return { 'uploads' : 'UU' + suffix, 'favorites' : 'FL' + suffix, 'likes' : 'LL' + suffix,
+                 'watchLater' : 'WL' + suffix, 'watchHistory' : 'HL' + suffix }
+
+    def feed(self, channelId) :
+        """Ids of a channel's 15 newest uploads, as its public Atom feed lists them."""
+        with self.lock :
+            uploads = self.playlists.get('UU' + channelId[2:])
+            return [videoId for itemId, videoId in uploads[:15]] if uploads != None else None
+
+    def addChannel(self, channelId, title) :
+        related = self.related(channelId)
+        self.channels[channelId] = { 'id' : channelId,
+                                     'snippet' : { 'title' : title, 'description' : '' },
+                                     'contentDetails' : { 'relatedPlaylists' : related } }
+        for playlistId in related.values() :
+            self.playlists[playlistId] = []
+
+    def addVideo(self, videoId, channelId, published) :
+        minutes, seconds = divmod(self.random.randint(30, 4000), 60)
+        thumbnail = lambda name : { 'url' : 'https://i.ytimg.com/vi/%s/%s.jpg' % (videoId, name) }
+        sizes = [('default', 'default'), ('medium', 'mqdefault'), ('high', 'hqdefault')]
+        self.videos[videoId] = {
+            'id' : videoId,
+            'snippet' : { 'title' : 'Video %s' % videoId, 'channelId' : channelId,
+                          'channelTitle' : self.channels[channelId]['snippet']['title'],
+                          'description' : ('Description of %s. ' % videoId) * 20,
+                          'publishedAt' : published.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                          'thumbnails' : dict((size, thumbnail(name)) for size, name in sizes) },
+            'contentDetails' : { 'duration' : 'PT%dM%dS' % (minutes, seconds) } }
+
+    @staticmethod
+    def page(items, query, defaultSize=5) :
+        size = int(query.get('maxResults', defaultSize))
+        start = int(query.get('pageToken', 0))
+        response = { 'items' : items[start:start + size],
+                     'pageInfo' : { 'totalResults' : len(items), 'resultsPerPage' : size } }
+
+        if start + size < len(items) :
+            response['nextPageToken'] = str(start + size)
+
+        return response
+
+    def respond(self, method, resource, query, body) :
+        with self.lock :
+            return self.__respond(method, resource, query, body)
+
+    def __respond(self, method, resource, query, body) :
+        ids = query['id'].split(',') if 'id' in query else []
+
+        if resource == 'videos' and method == 'GET' :
+            return 200, { 'items' : [self.videos[id] for id in ids if id in self.videos] }
+
+        if resource == 'channels' and method == 'GET' :
+            if query.get('mine') == 'true' :
+                ids = [self.USER]
+            return 200, { 'items' : [self.channels[id] for id in ids if id in self.channels] }
+
+        if resource == 'subscriptions' and method == 'GET' :
+            return 200, self.page(self.subscriptions, query)
+
+        if resource == 'playlistItems' :
+            if method == 'GET' :
+                if not query.get('playlistId') in self.playlists :
+                    return 404, errorBody(404, 'playlistNotFound')
+
+                items = [{ 'id' : itemId, 'snippet' : { 'resourceId' : { 'kind' : 'youtube#video',
+                                                                         'videoId' : videoId } } }
+                         for itemId, videoId in self.playlists[query['playlistId']]]
+                return 200, self.page(items, query)
+
+            if method == 'POST' :
+                snippet = json.loads(body)['snippet']
+                item = (self.nextItemId(), snippet['resourceId']['videoId'])
+                self.playlists[snippet['playlistId']].insert(0, item)
+                return 200, { 'id' : item[0], 'snippet' : snippet }
+
+            if method == 'DELETE' :
+                for playlist in self.playlists.values() :
+                    for item in playlist :
+                        if item[0] == query.get('id') :
+                            playlist.remove(item)
+                            return 204, None
+
+                return 404, errorBody(404, 'playlistItemNotFound')
+
+        return 404, errorBody(404, 'notFound')
+
+class RecordedFixtures :
+    """Responses captured from the real API by RecordingHttp, replayed by request."""
+
+    def __init__(self, path) :
+        self.responses = dict()
+        for record in json.load(open(path)) :
+            self.responses[(record['method'], normalise(record['uri']))] = record
+
+    def respond(self, method, resource, query, body) :
+        uri = API_PATH + resource + '?' + '&'.join('%s=%s' % pair for pair in sorted(query.items()))
+        record = self.responses.get((method, normalise(uri)))
+
+        if not record :
+            return 404, errorBody(404, 'notRecorded')
+
+        return record['status'], json.loads(record['body']) if record['body'] else None
+
+def normalise(uri) :
+    parsed = urlparse.urlparse(uri)
+    query = sorted((name, value) for name, value in urlparse.parse_qsl(parsed.query)
+                   if not name in ('key', 'alt', 'fields', 'prettyPrint'))
+    return parsed.path + '?' + '&'.join('%s=%s' % pair for pair in query)
+
+class RecordingHttp :
+    """Wraps an httplib2.Http, adding every exchange to a list shared between threads."""
+
+    def __init__(self, http, records) :
+        self.http = http
+        self.records = records
+
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs) :
+        response, content = self.http.request(uri, method, body, headers, *args, **kwargs)
+        self.records.append({ 'method' : method, 'uri' : uri, 'status' : response.status,
+                              'body' : content })
+        return response, content
+
+def saveRecords(records, path) :
+    recordFile = open(path, 'w')
+    json.dump(records, recordFile, indent=1)
+    recordFile.close()
+
+class FakeYouTubeHandler(BaseHTTPRequestHandler) :
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args) :
+        pass
+
+    def do_GET(self) :
+        self.dispatch('GET')
+
+    def do_POST(self) :
+        self.dispatch('POST')
+
+    def do_DELETE(self) :
+        self.dispatch('DELETE')
+
+    def dispatch(self, method) :
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else ''
+        self.server.owner.countRequest()
+
+        if self.server.owner.latency :
+            time.sleep(self.server.owner.latency)
+
+        if self.path.startswith(BATCH_PATH) :
+            return self.sendBatch(body)
+
+        status, headers, content = self.server.owner.handle(method, self.path, dict(self.headers), body)
+        self.send(status, headers, content)
+
+    def send(self, status, headers, content) :
+        self.send_response(status)
+        for name, value in headers.items() :
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def sendBatch(self, body) :
+        message = email.message_from_string('Content-Type: %s\r\n\r\n%s' %
+                                            (self.headers['Content-Type'], body))
+        boundary = 'batch_%d' % random.randint(0, 1 << 30)
+        parts = []
+
+        for part in message.get_payload() :
+            request = part.get_payload().replace('\r\n', '\n')
+            head, partBody = (request.split('\n\n', 1) + [''])[:2]
+            lines = head.split('\n')
+            method, path = lines[0].split(' ')[:2]
+            headers = dict(line.split(': ', 1) for line in lines[1:] if ': ' in line)
+
+            status, responseHeaders, content = self.server.owner.handle(method, path, headers, partBody.strip())
+            responseHead = ''.join('%s: %s\r\n' % header for header in responseHeaders.items())
+            parts.append('--%s\r\nContent-Type: application/http\r\nContent-ID: <response-%s>\r\n\r\n'
+                         'HTTP/1.1 %d %s\r\n%sContent-Length: %d\r\n\r\n%s\r\n' %
+                         (boundary, part['Content-ID'][1:-1], status, self.responses[status][0],
+                          responseHead, len(content), content))
+
+        self.send(200, { 'Content-Type' : 'multipart/mixed; boundary=%s' % boundary },
+                  ''.join(parts) + '--%s--\r\n' % boundary)
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer) :
+    daemon_threads = True
+
+class FakeYouTubeServer :
+    """Serves fixtures over HTTP on localhost, counting requests and injecting faults."""
+
+    def __init__(self, fixtures=None, latency=0.0, port=0) :
+        self.fixtures = fixtures or SyntheticFixtures()
+        self.latency = latency
+        self.failures = []
+        self.lock = Lock()
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), FakeYouTubeHandler)
+        self.server.owner = self
+        self.thread = None
+
+    def url(self) :
+        return 'http://127.0.0.1:%d/' % self.server.server_address[1]
+
+    def discoveryUrl(self) :
+        return self.url()[:-1] + DISCOVERY_PATH
+
+    def feedUrl(self) :
+        return self.url()[:-1] + FEED_PATH + '?channel_id=%s'
+
+    def start(self) :
+        self.thread = Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self) :
+        self.server.shutdown()
+        self.server.server_close()
+
+    def countRequest(self) :
+        with self.lock :
+            self.requests += 1
+
+    def resetCount(self) :
+        with self.lock :
+            self.requests = 0
+
+    def fail(self, match, status, reason, count=1) :
+        """Make the next count requests whose path contains match fail."""
+        with self.lock :
+            self.failures.append([match, status, reason, count])
+
+    def injectedFailure(self, path) :
+        with self.lock :
+            for failure in self.failures :
+                if failure[0] in path and failure[3] > 0 :
+                    failure[3] -= 1
+                    return failure[1], failure[2]
+
+        return None
+
+    def handle(self, method, path, headers, body) :
+        parsed = urlparse.urlparse(path)
+        jsonHeaders = { 'Content-Type' : 'application/json; charset=UTF-8' }
+
+        if parsed.path == DISCOVERY_PATH :
+            return 200, jsonHeaders, json.dumps(discoveryDocument(self.url()))
+
+        failure = self.injectedFailure(parsed.path)
+        if failure :
+            return failure[0], jsonHeaders, json.dumps(errorBody(*failure))
+
+        if parsed.path == FEED_PATH :
+            return self.feed(dict(urlparse.parse_qsl(parsed.query)).get('channel_id'), headers)
+
+        if not parsed.path.startswith(API_PATH) :
+            return 404, jsonHeaders, json.dumps(errorBody(404, 'notFound'))
+
+        query = dict(urlparse.parse_qsl(parsed.query))
+        status, content = self.fixtures.respond(method, parsed.path[len(API_PATH):], query, body)
+
+        if content is None :
+            return status, {}, ''
+
+        if status == 200 and method == 'GET' :
+            if 'fields' in query :
+                content = applyFields(content, parseFields(query['fields'])[0])
+
+            content['etag'] = '"%s"' % hashlib.md5(json.dumps(content, sort_keys=True)).hexdigest()
+            jsonHeaders['ETag'] = content['etag']
+
+            if headers.get('If-None-Match', headers.get('if-none-match')) == content['etag'] :
+                return 304, { 'ETag' : content['etag'] }, ''
+
+        return status, jsonHeaders, json.dumps(content)
+
+    def feed(self, channelId, headers) :
+        ids = self.fixtures.feed(channelId) if hasattr(self.fixtures, 'feed') else None
+        if ids is None :
+            return 404, {}, ''
+
+        content = FEED % ''.join([FEED_ENTRY % (id, id) for id in ids])
+        etag = '"%s"' % hashlib.md5(content).hexdigest()
+
+        if headers.get('If-None-Match', headers.get('if-none-match')) == etag :
+            return 304, { 'ETag' : etag }, ''
+
+        return 200, { 'Content-Type' : 'application/atom+xml; charset=UTF-8', 'ETag' : etag }, content
+
+if __name__ == '__main__':
+    import sys
+    server = FakeYouTubeServer(latency=float(sys.argv[1]) if len(sys.argv) > 1 else 0.0, port=8088)
+    print 'Serving fake YouTube API at ' + server.url()
+    server.server.serve_forever()
@@ -0,0 +1,99 @@
+from fakeyoutube import FakeYouTubeServer, SyntheticFixtures
+import unittest
+import urllib2
+import json
+
+class FakeYouTubeTest(unittest.TestCase) :
+    @classmethod
+    def setUpClass(self) :
+        self.server = FakeYouTubeServer(SyntheticFixtures(channels=3, videosPerChannel=12)).start()
+
+    @classmethod
+    def tearDownClass(self) :
+        self.server.stop()
+
+    def get(self, path, headers={}) :
+        request = urllib2.Request(self.server.url() + path, headers=headers)
+        return json.load(urllib2.urlopen(request))
+
+    def test_discovery(self) :
+        document = json.load(urllib2.urlopen(self.server.discoveryUrl()))
+        self.assertEqual(document['rootUrl'], self.server.url())
+        self.assertTrue('list' in document['resources']['videos']['methods'])
+
+    def test_client(self) :
+        #A client built from the document the way YouTubeClient does it has to work too
+        from apiclient.discovery import build_from_document
+        import httplib2
+
+        document = urllib2.urlopen(self.server.discoveryUrl()).read()
+        client = build_from_document(document, http=httplib2.Http())
+        response = client.videos().list(part='snippet', id='v0000000000').execute()
+
+        self.assertEqual(response['items'][0]['id'], 'v0000000000')
+
+    def test_pagination(self) :
+        path = 'youtube/v3/playlistItems?part=snippet&playlistId=UU%020d&maxResults=5' % 1
+        first = self.get(path)
+        second = self.get(path + '&pageToken=' + first['nextPageToken'])
+
+        self.assertEqual(first['pageInfo']['totalResults'], 12)
+        self.assertEqual(len(first['items']), 5)
+        self.assertNotEqual(first['items'][0]['id'], second['items'][0]['id'])
+
+    def test_feed(self) :
+        #The uploads feed the subscription feed playlist polls, read the way FeedFetcher reads it
+        from FeedFetcher import FeedFetcher
+
+        fetcher = FeedFetcher(1)
+        try :
+            ids = fetcher.fetch(self.server.feedUrl() % ('UC%020d' % 1))
+        finally :
+            fetcher.close()
+
+        self.assertEqual(ids, ['v%05d%05d' % (1, upload) for upload in range(12)])
+
+    def test_fields(self) :
+        video = self.get('youtube/v3/videos?part=snippet&id=v0000000000&fields=items(id,snippet/title)')['items'][0]
+        self.assertEqual(video, { 'id' : 'v0000000000', 'snippet' : { 'title' : 'Video v0000000000' } })
+
+    def test_notModified(self) :
+        path = 'youtube/v3/channels?part=snippet&mine=true'
+        etag = self.get(path)['etag']
+
+        try :
+            self.get(path, { 'If-None-Match' : etag })
+            self.fail('Expected 304')
+        except urllib2.HTTPError, e :
+            self.assertEqual(e.code, 304)
+
+    def test_injectedFailure(self) :
+        self.server.fail('subscriptions', 403, 'quotaExceeded')
+
+        try :
+            self.get('youtube/v3/subscriptions?part=snippet&mine=true')
+            self.fail('Expected 403')
+        except urllib2.HTTPError, e :
+            self.assertEqual(e.code, 403)
+            self.assertEqual(json.load(e)['error']['errors'][0]['reason'], 'quotaExceeded')
+
+        self.assertEqual(len(self.get('youtube/v3/subscriptions?part=snippet&mine=true')['items']), 3)
+
+    def test_batch(self) :
+        parts = ''
+        for index, videoId in enumerate(['v0000000000', 'v0000100000']) :
+            parts += ('--BOUNDARY\nContent-Type: application/http\nContent-ID: <base+%d>\n\n'
+                      'GET /youtube/v3/videos?part=snippet&id=%s HTTP/1.1\nHost: localhost\n\n' % (index, videoId))
+        parts += '--BOUNDARY--'
+
+        request = urllib2.Request(self.server.url() + 'batch', parts,
+                                  { 'Content-Type' : 'multipart/mixed; boundary="BOUNDARY"' })
+        self.server.resetCount()
+        content = urllib2.urlopen(request).read()
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertTrue('Content-ID: <response-base+0>' in content)
+        self.assertTrue('"v0000100000"' in content)
+
+if __name__ == '__main__':
+    unittest.main()
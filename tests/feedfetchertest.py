@@ -0,0 +1,102 @@
+from FeedFetcher import FeedFetcher, FeedError
+from Catalog import Catalog
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from threading import Thread
+import unittest
+import tempfile
+import shutil
+import os.path
+
+FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+  <title>Channel</title>
+  %s
+</feed>'''
+ENTRY = '<entry><id>yt:video:%s</id><yt:videoId>%s</yt:videoId><title>Video</title></entry>'
+
+class FeedHandler(BaseHTTPRequestHandler) :
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) :
+        server = self.server
+        server.requests.append(self.path)
+        channel = self.path.split('=')[-1]
+
+        if not channel in server.feeds :
+            self.reply(404, '')
+        elif self.headers.getheader('If-None-Match') == '"%s"' % channel :
+            self.reply(304, None)
+        else :
+            entries = ''.join([ENTRY % (id, id) for id in server.feeds[channel]])
+            self.reply(200, FEED % entries, { 'ETag' : '"%s"' % channel })
+
+    def reply(self, status, body, headers={}) :
+        self.send_response(status)
+        for name, value in headers.items() :
+            self.send_header(name, value)
+        if body != None :
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body :
+            self.wfile.write(body)
+
+    def log_message(self, format, *args) :
+        pass
+
+class FeedServer(ThreadingMixIn, HTTPServer) :
+    daemon_threads = True
+
+class FeedFetcherTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.dir, 'catalog.db'))
+        self.server = FeedServer(('127.0.0.1', 0), FeedHandler)
+        self.server.requests = []
+        self.server.feeds = { 'a' : ['v1', 'v2'], 'b' : ['v3'] }
+        Thread(target=self.server.serve_forever).start()
+        self.fetcher = FeedFetcher(2, self.catalog, 5)
+
+    def tearDown(self) :
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def url(self, channel) :
+        return 'http://127.0.0.1:%d/feeds/videos.xml?channel_id=%s' % (self.server.server_address[1], channel)
+
+    def test_fetch(self) :
+        futures = self.fetcher.fetchAll([self.url('a'), self.url('b')])
+        self.assertEqual([future.result() for future in futures], [['v1', 'v2'], ['v3']])
+        self.assertEqual(self.fetcher.stats()['fetched'], 2)
+
+    def test_notModified(self) :
+        self.assertEqual(self.fetcher.fetch(self.url('a')), ['v1', 'v2'])
+        self.assertEqual(self.fetcher.fetch(self.url('a')), ['v1', 'v2'])
+
+        stats = self.fetcher.stats()
+        self.assertEqual(stats['fetched'], 1)
+        self.assertEqual(stats['notModified'], 1)
+        #Both requests went over the same kept alive connection
+        self.assertEqual(stats['connections'], 1)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_close(self) :
+        self.fetcher.fetch(self.url('a'))
+        connection = self.fetcher.local.connections.values()[0]
+        self.fetcher.close()
+
+        self.assertTrue(connection.sock is None)
+        self.assertEqual(self.fetcher.open, set())
+
+    def test_missing(self) :
+        self.assertRaises(FeedError, self.fetcher.fetch, self.url('c'))
+        self.assertEqual(self.fetcher.stats()['failed'], 1)
+
+    def test_invalid(self) :
+        self.assertRaises(FeedError, self.fetcher.parse, '<feed')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+from FeedMerge import FeedMerge
+import unittest
+
+class FeedMergeTest(unittest.TestCase) :
+    def setUp(self) :
+        self.merge = FeedMerge(lambda time : time)
+
+    def test_merge(self) :
+        self.merge.add([90, 50])
+        self.merge.add([80, 70])
+        self.merge.add([])
+        self.merge.add([60])
+        self.assertEqual(self.merge.take(), [90, 80, 70, 60, 50])
+
+    def test_equalTimes(self) :
+        first, second, third = object(), object(), object()
+        merge = FeedMerge(lambda video : 50)
+        merge.add([first, second])
+        merge.add([third])
+        self.assertEqual(merge.take(), [first, second, third])
+
+if __name__ == '__main__':
+    unittest.main()
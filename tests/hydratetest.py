@@ -0,0 +1,96 @@
+from YouTube import YouTubeService
+from Catalog import Catalog
+from collections import OrderedDict
+from threading import Condition, Event, Thread
+import unittest
+import tempfile
+import shutil
+import time
+import os.path
+
+class FakeVideo :
+    def __init__(self, id) :
+        self.values = [id, None]
+
+    def id(self) :
+        return self.values[0]
+
+    def hydrated(self) :
+        return self.values[1] != None
+
+    def setDescription(self, description) :
+        self.values[1] = description
+
+class FakeClient :
+    def videos(self) :
+        return None
+
+class BareService(YouTubeService) :
+    #Only what hydrate() uses, the rest of the service needs credentials
+    def __init__(self) :
+        pass
+
+class HydrateTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.requests = []
+        self.release = Event()
+
+        self.service = BareService()
+        self.service.catalog = Catalog(os.path.join(self.dir, 'catalog.db'))
+        self.service.unhydrated = OrderedDict()
+        self.service.hydrating = False
+        self.service.hydrateCondition = Condition()
+        self.service.serviceInstance = lambda : FakeClient()
+        self.service._executeListRequest = self.execute
+
+    def tearDown(self) :
+        self.release.set()
+        self.service.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def execute(self, resource, options) :
+        ids = options['id'].split(',')
+        self.requests.append(ids)
+        self.release.wait(5)
+        return [{ 'id' : id, 'snippet' : { 'description' : 'About ' + id } } for id in ids]
+
+    def waitFor(self, condition) :
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline :
+            time.sleep(0.01)
+
+    def test_requestedOnly(self) :
+        self.release.set()
+        video = FakeVideo('a')
+        FakeVideo('b')
+
+        self.service.hydrate(video)
+
+        self.assertEqual(self.requests, [['a']])
+        self.assertEqual(video.values[1], 'About a')
+
+    def test_batchesWhileWaiting(self) :
+        videos = [FakeVideo(id) for id in 'abc']
+        threads = [Thread(target=self.service.hydrate, args=(video,)) for video in videos]
+        threads[0].start()
+        self.waitFor(lambda : self.requests)
+
+        #The lock isn't held during the request
+        self.assertTrue(self.service.hydrateCondition.acquire(False))
+        self.service.hydrateCondition.release()
+
+        for thread in threads[1:] :
+            thread.start()
+        self.waitFor(lambda : len(self.service.unhydrated) == 2)
+        self.release.set()
+
+        for thread in threads :
+            thread.join(5)
+
+        self.assertEqual(self.requests[0], ['a'])
+        self.assertEqual(sorted(self.requests[1]), ['b', 'c'])
+        self.assertEqual([video.values[1] for video in videos], ['About a', 'About b', 'About c'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import isotime
+from calendar import timegm
+import unittest
+
+class IsoTimeTest(unittest.TestCase) :
+    def test_duration(self) :
+        self.assertEqual(isotime.parseDuration('PT4M13S'), 253)
+        self.assertEqual(isotime.parseDuration('PT1H'), 3600)
+        self.assertEqual(isotime.parseDuration('PT0S'), 0)
+        self.assertEqual(isotime.parseDuration('PT2.5S'), 2)
+
+    def test_longDuration(self) :
+        self.assertEqual(isotime.parseDuration('PT25H1M'), 90060)
+        self.assertEqual(isotime.parseDuration('P1DT2H'), 93600)
+        self.assertEqual(isotime.parseDuration('P1W'), 604800)
+
+    def test_invalidDuration(self) :
+        for text in ['', 'P', 'PT', '4M13S', 'PT4X'] :
+            self.assertRaises(ValueError, isotime.parseDuration, text)
+
+    def test_timestamp(self) :
+        expected = timegm((2013, 12, 1, 10, 0, 5))
+        self.assertEqual(isotime.parseTimestamp('2013-12-01T10:00:05.000Z'), expected)
+        self.assertEqual(isotime.parseTimestamp('2013-12-01T10:00:05Z'), expected)
+        self.assertEqual(isotime.parseTimestamp('2013-12-01T10:00:05'), expected)
+
+    def test_offset(self) :
+        self.assertEqual(isotime.parseTimestamp('2008-07-05T19:56:35.000-07:00'),
+                         timegm((2008, 7, 6, 2, 56, 35)))
+        self.assertEqual(isotime.parseTimestamp('2008-07-05T19:56:35+0130'),
+                         timegm((2008, 7, 5, 18, 26, 35)))
+
+    def test_invalidTimestamp(self) :
+        for text in ['2013-13-01T10:00:05.000Z', '2013-02-30T10:00:05.000Z', '2013-12-01', 'yesterday'] :
+            self.assertRaises(ValueError, isotime.parseTimestamp, text)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+from MutationQueue import MutationQueue
+from Catalog import Catalog
+import unittest
+import tempfile
+import shutil
+import os.path
+
+class TransientError(Exception) :
+    pass
+
+class MutationQueueTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'catalog.db')
+        self.catalog = Catalog(self.path)
+        self.executed = []
+        self.done = []
+        self.failures = 0
+
+    def tearDown(self) :
+        self.queue.stop(5)
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def execute(self, mutation) :
+        if self.failures :
+            self.failures -= 1
+            raise TransientError()
+
+        self.executed.append((mutation.playlistId, mutation.videoId, mutation.include))
+        return mutation.videoId
+
+    def createQueue(self) :
+        self.queue = MutationQueue(self.catalog, self.execute,
+                                   lambda mutation, result, error : self.done.append((result, error)),
+                                   lambda error : isinstance(error, TransientError))
+        self.queue.BACKOFF = 0.01
+        return self.queue
+
+    def test_applies(self) :
+        queue = self.createQueue()
+        queue.add('p', 'a', True)
+        queue.add('p', 'b', False)
+        queue.start()
+
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(self.executed, [('p', 'a', True), ('p', 'b', False)])
+        self.assertEqual(self.done, [('a', None), ('b', None)])
+        self.assertEqual(self.catalog.mutations(), [])
+
+    def test_coalesces(self) :
+        queue = self.createQueue()
+        queue.add('p', 'a', True)
+        queue.add('p', 'a', True)
+        self.assertEqual(queue.add('p', 'a', False), None)
+        queue.add('q', 'a', True)
+        queue.start()
+
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(self.executed, [('q', 'a', True)])
+        self.assertEqual(queue.stats()['cancelled'], 2)
+
+    def test_retries(self) :
+        self.failures = 2
+        queue = self.createQueue()
+        queue.add('p', 'a', True)
+        queue.start()
+
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(self.executed, [('p', 'a', True)])
+        self.assertEqual(queue.stats()['retried'], 2)
+
+    def test_permanentFailure(self) :
+        queue = self.createQueue()
+        self.execute = lambda mutation : 1 / 0
+        queue.execute = self.execute
+        queue.add('p', 'a', True)
+        queue.start()
+
+        self.assertTrue(queue.flush(5))
+        self.assertTrue(isinstance(self.done[0][1], ZeroDivisionError))
+        self.assertEqual(queue.stats()['failed'], 1)
+
+    def test_stopWaits(self) :
+        queue = self.createQueue()
+        queue.start()
+        thread = queue.thread
+
+        queue.stop(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_survivesRestart(self) :
+        self.createQueue().add('p', 'a', True)
+        self.catalog.close()
+        self.catalog = Catalog(self.path)
+
+        queue = self.createQueue()
+        self.assertEqual(queue.size(), 1)
+        queue.start()
+
+        self.assertTrue(queue.flush(5))
+        self.assertEqual(self.executed, [('p', 'a', True)])
+
+if __name__ == '__main__':
+    unittest.main()
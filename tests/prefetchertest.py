@@ -0,0 +1,154 @@
+from VideoManager import Prefetcher
+from Settings import Settings
+import unittest
+import tempfile
+import shutil
+import os.path
+
+class FakeVideo :
+    def __init__(self, url, channelId='c', duration=60) :
+        self.values = (url, channelId, duration)
+        self.downloading = False
+        self.finished = False
+        self.removed = False
+        self.rateLimit = None
+        self.unavailable = False
+
+    def url(self) :
+        return self.values[0]
+
+    def channelId(self) :
+        return self.values[1]
+
+    def duration(self) :
+        return self.values[2]
+
+    def available(self) :
+        return not self.unavailable
+
+    def filename(self) :
+        return '/nonexistent/' + self.url()
+
+    def startDownload(self, rateLimit=None) :
+        self.downloading = True
+        self.rateLimit = rateLimit
+
+    def stopDownload(self) :
+        self.downloading = False
+
+    def removeFile(self) :
+        self.removed = True
+
+    def startedDownload(self) :
+        return self.downloading
+
+    def finishedDownload(self) :
+        return self.finished
+
+    def downloadInfo(self) :
+        return { 'percent' : 100.0 if self.finished else 0.0 }
+
+class FakePlaylist :
+    def __init__(self, videos) :
+        self.videos = videos
+
+    def result(self) :
+        return self.videos
+
+class FakeService :
+    def __init__(self) :
+        self.playlists = { 'watchLater' : FakePlaylist([]), 'watchHistory' : FakePlaylist([]) }
+        self.uploads = dict()
+
+    def userPlaylist(self, name) :
+        return self.playlists[name]
+
+    def channelVideos(self, id, count=None) :
+        return self.uploads.get(id, [])[:count]
+
+class FakeManager :
+    def __init__(self, directory) :
+        self.directory = directory
+        self.services = { 'fake' : FakeService() }
+
+    def videoDir(self) :
+        return self.directory
+
+class PrefetcherTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        Settings.load(os.path.join(self.dir, 'settings.xml'))
+        self.manager = FakeManager(self.dir)
+        self.service = self.manager.services['fake']
+        self.prefetcher = Prefetcher(self.manager)
+
+    def tearDown(self) :
+        shutil.rmtree(self.dir)
+
+    def test_ranking(self) :
+        a, b, c, d = [FakeVideo(url) for url in 'abcd']
+        self.service.playlists['watchLater'].videos = [a, b]
+        self.service.playlists['watchHistory'].videos = [FakeVideo('old', 'fav')] * 3
+        self.service.uploads['fav'] = [c]
+        self.prefetcher.played(d, FakePlaylist([d, b]))
+
+        self.assertEqual(self.prefetcher.candidates(), [b, a, c])
+
+        b.unavailable = True
+        self.assertEqual(self.prefetcher.candidates(), [a, c])
+
+    def test_budgets(self) :
+        videos = [FakeVideo(url, duration=100) for url in 'abc']
+        self.service.playlists['watchLater'].videos = videos
+        settings = Settings('prefetch')
+        settings.set('concurrency', 2)
+        settings.set('bandwidthkb', 100)
+        settings.set('bytespersecond', 1024 * 1024)
+        settings.set('diskmb', 150)
+
+        self.prefetcher.update()
+
+        #Only one 100MB video fits in 150MB
+        self.assertEqual([video.downloading for video in videos], [True, False, False])
+        self.assertEqual(videos[0].rateLimit, 50 * 1024)
+
+    def test_cancel(self) :
+        a, b = FakeVideo('a'), FakeVideo('b')
+        self.service.playlists['watchLater'].videos = [a]
+        self.prefetcher.update()
+
+        self.service.playlists['watchLater'].videos = [b]
+        self.prefetcher.update()
+
+        self.assertTrue(a.removed)
+        self.assertTrue(b.downloading)
+        self.assertEqual(self.prefetcher.stats()['cancelled'], 1)
+
+    def test_claim(self) :
+        a = FakeVideo('a')
+        self.service.playlists['watchLater'].videos = [a]
+        self.prefetcher.update()
+        self.prefetcher.claim(a)
+
+        #The user kept it so dropping out of the ranking leaves it alone
+        self.service.playlists['watchLater'].videos = []
+        self.prefetcher.update()
+
+        self.assertTrue(a.downloading)
+        self.assertFalse(a.removed)
+
+    def test_hitRate(self) :
+        a, b = FakeVideo('a'), FakeVideo('b')
+        self.service.playlists['watchLater'].videos = [a]
+        self.prefetcher.update()
+        a.finished = True
+
+        self.prefetcher.played(a)
+        self.prefetcher.played(b)
+
+        stats = self.prefetcher.stats()
+        self.assertEqual((stats['plays'], stats['hits'], stats['partialHits']), (2, 1, 0))
+        self.assertEqual(stats['hitRate'], 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from RateLimiter import RateLimiter, QuotaExceededError
+from threading import Thread
+import unittest
+import time
+
+class RateLimiterTest(unittest.TestCase) :
+    def test_burst(self) :
+        limiter = RateLimiter(100, 10, 1000, 0)
+        started = time.time()
+        limiter.acquire(10)
+        self.assertTrue(time.time() - started < 0.05)
+
+        #The bucket is empty so the next five units take 50ms to come back
+        limiter.acquire(5)
+        self.assertTrue(time.time() - started >= 0.04)
+        self.assertEqual(limiter.stats()['waited'], 1)
+        self.assertEqual(limiter.stats()['used'], 15)
+
+    def test_dailyQuota(self) :
+        limiter = RateLimiter(1000, 100, 60)
+        limiter.acquire(50)
+        self.assertRaises(QuotaExceededError, limiter.acquire, 50)
+        self.assertEqual(limiter.stats()['refused'], 1)
+
+    def test_backgroundReserve(self) :
+        limiter = RateLimiter(1000, 100, 100, 0.2)
+        limiter.acquire(70)
+
+        with limiter.background() :
+            self.assertTrue(limiter.isBackground())
+            self.assertRaises(QuotaExceededError, limiter.acquire, 20)
+
+        self.assertFalse(limiter.isBackground())
+        limiter.acquire(20)
+        self.assertEqual(limiter.stats()['remaining'], 10)
+
+    def test_interactiveFirst(self) :
+        limiter = RateLimiter(100, 10, 1000, 0)
+        limiter.acquire(10)
+        order = []
+
+        def background() :
+            with limiter.background() :
+                limiter.acquire(5)
+            order.append('background')
+
+        def interactive() :
+            limiter.acquire(5)
+            order.append('interactive')
+
+        threads = [Thread(target=background), Thread(target=interactive)]
+        threads[0].start()
+        time.sleep(0.01)
+        threads[1].start()
+        for thread in threads :
+            thread.join()
+
+        self.assertEqual(order, ['interactive', 'background'])
+
+    def test_backoff(self) :
+        limiter = RateLimiter(1000, 100, 1000)
+        limiter.BACKOFF = 0.05
+        delay = limiter.backoff(2)
+        self.assertTrue(0.05 <= delay <= 0.1)
+
+        started = time.time()
+        limiter.acquire(1)
+        self.assertTrue(time.time() - started >= delay - 0.01)
+        self.assertEqual(limiter.stats()['backoffs'], 1)
+
+    def test_exhaust(self) :
+        limiter = RateLimiter(1000, 100, 1000)
+        limiter.exhaust()
+        self.assertRaises(QuotaExceededError, limiter.acquire, 1)
+
+    def test_restore(self) :
+        limiter = RateLimiter(1000, 100, 1000, 0.2, 400, RateLimiter(1, 1, 1).today())
+        self.assertEqual(limiter.stats()['used'], 400)
+
+        #Use from an earlier day doesn't count
+        limiter = RateLimiter(1000, 100, 1000, 0.2, 400, 0)
+        self.assertEqual(limiter.stats()['used'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+from ResponseCache import ResponseCache
+from Catalog import Catalog
+import unittest
+import tempfile
+import shutil
+import os.path
+
+class ResponseCacheTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.dir, 'catalog.db'))
+
+    def tearDown(self) :
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def test_hit(self) :
+        cache = ResponseCache(10)
+        cache.store('uri', { 'etag' : 'e1', 'items' : [1] })
+
+        self.assertEqual(cache.etag('uri'), 'e1')
+        self.assertEqual(cache.hit('uri'), { 'etag' : 'e1', 'items' : [1] })
+        self.assertEqual(cache.stats(), { 'hits' : 1, 'misses' : 1, 'entries' : 1 })
+
+    def test_noEtag(self) :
+        cache = ResponseCache(10)
+        cache.store('uri', { 'etag' : 'e1' })
+        cache.store('uri', { 'items' : [] })
+
+        #A body without an etag can't be revalidated so replaces nothing
+        self.assertEqual(cache.etag('uri'), None)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_reload(self) :
+        ResponseCache(10, self.catalog).store('uri', { 'etag' : 'e1', 'items' : [1] })
+        cache = ResponseCache(10, self.catalog)
+
+        self.assertEqual(cache.etag('uri'), 'e1')
+        self.assertEqual(cache.hit('uri')['items'], [1])
+        self.assertEqual(cache.etag('other'), None)
+
+    def test_hitEvicted(self) :
+        cache = ResponseCache(1, self.catalog)
+        cache.store('a', { 'etag' : 'a', 'items' : [1] })
+        self.assertEqual(cache.etag('a'), 'a')
+        cache.store('b', { 'etag' : 'b' })
+
+        #Pushed out of memory between the request and its 304, the catalog still has it
+        self.assertEqual(cache.hit('a'), { 'etag' : 'a', 'items' : [1] })
+        self.assertEqual(ResponseCache(1).hit('a'), None)
+
+    def test_eviction(self) :
+        cache = ResponseCache(2)
+        cache.store('a', { 'etag' : 'a' })
+        cache.store('b', { 'etag' : 'b' })
+        cache.hit('a')
+        cache.store('c', { 'etag' : 'c' })
+
+        #b was used least recently
+        self.assertEqual([cache.etag(uri) for uri in 'abc'], ['a', None, 'c'])
+
+if __name__ == '__main__':
+    unittest.main()
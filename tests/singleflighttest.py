@@ -0,0 +1,60 @@
+from SingleFlight import SingleFlight
+from threading import Thread, Event
+import unittest
+
+class SingleFlightTest(unittest.TestCase) :
+    def setUp(self) :
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.release = Event()
+
+    def fetch(self, key, value) :
+        #The way YouTubeService uses it, leading or following
+        future, leader = self.flight.join(key)
+
+        if leader :
+            self.calls += 1
+            self.release.wait(5)
+            self.flight.finish(key, future, value)
+
+        return future.result()
+
+    def test_shared(self) :
+        results = []
+        run = lambda : results.append(self.fetch('key', 'value'))
+        threads = [Thread(target=run) for count in range(4)]
+        for thread in threads :
+            thread.start()
+
+        #Let every thread join before the leader finishes
+        while self.flight.stats()['shared'] < 3 :
+            self.release.wait(0.01)
+        self.release.set()
+
+        for thread in threads :
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['value'] * 4)
+        self.assertEqual(self.flight.stats(), { 'led' : 1, 'shared' : 3, 'inflight' : 0 })
+
+    def test_sequential(self) :
+        self.release.set()
+        self.assertEqual(self.fetch('key', 1), 1)
+        self.assertEqual(self.fetch('key', 2), 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_error(self) :
+        future, leader = self.flight.join('key')
+        follower, following = self.flight.join('key')
+
+        self.assertTrue(leader)
+        self.assertFalse(following)
+        self.assertTrue(follower is future)
+
+        self.flight.finish('key', future, error=ValueError())
+        self.assertRaises(ValueError, follower.result)
+        self.assertEqual(self.flight.stats()['inflight'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+from VideoManager import VideoHandler, compactTime
+from datetime import datetime
+from weakref import WeakValueDictionary
+import unittest
+import tempfile
+import shutil
+import time
+import os
+
+#Writes far more progress than a pipe holds before finishing, like youtube-dl --newline
+DOWNLOADER = '''#!/bin/sh
+i=0
+while [ $i -lt 5000 ] ; do
+    echo "[download]  12.5% of 10.00MiB at  1.00MiB/s ETA 00:08"
+    i=$((i + 1))
+done
+'''
+
+class FakeManager :
+    def __init__(self) :
+        self.videos = WeakValueDictionary()
+        self.directory = tempfile.mkdtemp()
+
+    def videoDir(self) :
+        return self.directory + '/'
+
+    def addVideo(self, video) :
+        self.videos[video.url()] = video
+
+class FakeService :
+    def __init__(self) :
+        self.fakeManager = FakeManager()
+        self.positions = dict()
+        self.writes = 0
+
+    def manager(self) :
+        return self.fakeManager
+
+    def lastPosition(self, video) :
+        return self.positions.get(video.url())
+
+    def storeLastPosition(self, video, position) :
+        self.positions[video.url()] = position
+        self.writes += 1
+
+class VideoHandlerTest(unittest.TestCase) :
+    def setUp(self) :
+        self.service = FakeService()
+
+    def tearDown(self) :
+        shutil.rmtree(self.service.manager().directory)
+
+    def createVideo(self, url, channel=u'Channel') :
+        return VideoHandler(self.service, url, u'Title', None, 3725, 1385892000,
+                            channel, u'UC' + channel, 'thumbnail.jpg')
+
+    def test_accessors(self) :
+        video = self.createVideo('a')
+
+        self.assertEqual(video.title(), u'Title')
+        self.assertEqual(video.duration(), 3725)
+        self.assertEqual(video.durationText(), '1:02:05')
+        self.assertEqual(video.uploadTime(), datetime(2013, 12, 1, 10, 0))
+        self.assertEqual(video.uploadEpoch(), 1385892000)
+        self.assertEqual(video.channelId(), u'UCChannel')
+
+    def test_lastPosition(self) :
+        self.service.positions['a'] = 42.0
+        video = self.createVideo('a')
+        self.assertEqual(video.lastPosition, 42.0)
+
+        video.lastPosition = 60.2
+        video.lastPosition = 60.7
+        self.assertEqual(video.lastPosition, 60.7)
+
+        #Only whole second changes are written
+        self.assertEqual(self.service.positions['a'], 60.2)
+        self.assertEqual(self.service.writes, 1)
+
+    def test_compact(self) :
+        first = self.createVideo('a', u''.join(['Chan', 'nel']))
+        second = self.createVideo('b', u''.join(['Chann', 'el']))
+
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertTrue(first.channel() is second.channel())
+
+    def test_compactTime(self) :
+        self.assertEqual(compactTime(65), '1:05')
+        self.assertEqual(compactTime(90000), '25:00:00')
+
+    def test_weakIndex(self) :
+        video = self.createVideo('a')
+        self.assertTrue(self.service.manager().videos['a'] is video)
+
+        del video
+        self.assertFalse('a' in self.service.manager().videos)
+
+    def test_download(self) :
+        directory = self.service.manager().directory
+        path = os.path.join(directory, 'youtube-dl')
+        with open(path, 'w') as script :
+            script.write(DOWNLOADER)
+        os.chmod(path, 0755)
+
+        class ScriptedVideo(VideoHandler) :
+            YOUTUBE_DL_CMD = path
+
+        video = ScriptedVideo(self.service, 'a', u'Title', None, 60, 0, u'Channel', u'UCChannel', None)
+        video.startDownload()
+
+        deadline = time.time() + 10
+        while not video.finishedDownload() and time.time() < deadline :
+            time.sleep(0.05)
+
+        self.assertTrue(video.finishedDownload())
+
+    def test_downloadInfo(self) :
+        video = self.createVideo('a')
+        video.lastPosition = 10
+
+        self.assertEqual(video.downloadInfo(), { 'percent' : 0.0 })
+        self.assertEqual(VideoHandler.DEFAULT_DL_INFO, { 'percent' : 0.0 })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from VideoIndex import VideoIndex
+import unittest
+
+class FakeVideo :
+    def __init__(self, id, channelId, uploaded) :
+        self.values = (id, channelId, uploaded)
+
+    def id(self) :
+        return self.values[0]
+
+    def channelId(self) :
+        return self.values[1]
+
+    def uploadEpoch(self) :
+        return self.values[2]
+
+def ids(videos) :
+    return [video.id() for video in videos]
+
+class VideoIndexTest(unittest.TestCase) :
+    def setUp(self) :
+        self.index = VideoIndex()
+        self.index.addVideos([FakeVideo('a', 'x', 100), FakeVideo('b', 'y', 300),
+                              FakeVideo('c', 'x', 200), FakeVideo('d', 'x', 400)])
+
+    def test_newest(self) :
+        self.assertEqual(ids(self.index.newest()), ['d', 'b', 'c', 'a'])
+        self.assertEqual(ids(self.index.newest(2)), ['d', 'b'])
+
+    def test_between(self) :
+        self.assertEqual(ids(self.index.between(200, 400)), ['b', 'c'])
+        self.assertEqual(ids(self.index.between(200, 400, 1)), ['b'])
+        self.assertEqual(ids(self.index.between(500, 600)), [])
+
+    def test_channel(self) :
+        self.assertEqual(ids(self.index.channel('x')), ['d', 'c', 'a'])
+        self.assertEqual(ids(self.index.channel('x', 2, before=400)), ['c', 'a'])
+        self.assertEqual(ids(self.index.channel('z')), [])
+
+    def test_replace(self) :
+        self.index.add(FakeVideo('a', 'y', 500))
+
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(ids(self.index.newest(1)), ['a'])
+        self.assertEqual(ids(self.index.channel('x')), ['d', 'c'])
+        self.assertEqual(ids(self.index.channel('y')), ['a', 'b'])
+
+    def test_playlists(self) :
+        self.index.setPlaylist('p', [('i1', 'a'), ('i2', 'b'), ('i3', 'a')])
+        self.index.setPlaylist('q', [('i4', 'a')])
+
+        self.assertEqual(self.index.playlistItems('a', 'p'), ['i1', 'i3'])
+        self.assertEqual(self.index.playlistItems('a'), { 'p' : ['i1', 'i3'], 'q' : ['i4'] })
+
+        self.index.setPlaylist('p', [('i2', 'b')])
+        self.assertEqual(self.index.playlistItems('a'), { 'q' : ['i4'] })
+        self.assertEqual(self.index.playlistItems('c', 'p'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+from PySide.QtGui import QApplication
+from contextlib import contextmanager
+import PiTube
+import unittest
+
+app = QApplication.instance() or QApplication([])
+
+class FakeFrame :
+    created = []
+
+    def __init__(self, parent, row, video) :
+        self.video = video
+        self.visible = True
+        self.created.append(video)
+
+    def videoHandler(self) :
+        return self.video
+
+    def setVisible(self, visible) :
+        self.visible = visible
+
+class FakePlaylist :
+    def __init__(self, stored, fresh) :
+        self.stored = stored
+        self.fresh = fresh
+        self.videos = []
+
+    def setUpdateListener(self, listener) :
+        pass
+
+    def cached(self) :
+        self.videos = list(self.stored)
+        return self.videos
+
+    def execute(self) :
+        self.videos = list(self.fresh)
+        return self.videos
+
+    def result(self) :
+        return self.videos
+
+    def hasMore(self) :
+        return False
+
+    @contextmanager
+    def background(self) :
+        yield
+
+class VideoListFrameTest(unittest.TestCase) :
+    def setUp(self) :
+        self.videoFrame = PiTube.VideoFrame
+        PiTube.VideoFrame = FakeFrame
+        FakeFrame.created = []
+
+    def tearDown(self) :
+        PiTube.VideoFrame = self.videoFrame
+
+    def test_staleThenFresh(self) :
+        stale = []
+        frame = PiTube.VideoListFrame(None, FakePlaylist(['a', 'b'], ['a', 'c']), None)
+        frame.staleChanged.connect(stale.append)
+        frame.loader.wait()
+        app.processEvents()
+
+        #The saved rows were drawn first and only the ones after the first change were replaced
+        self.assertEqual(FakeFrame.created, ['a', 'b', 'c'])
+        self.assertEqual([row.videoHandler() for row in frame.frames], ['a', 'c'])
+        self.assertEqual(stale, [True, False])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+from VideoManager import VideoPlaylist, CompositeVideoPlaylist, VideoService
+import unittest
+
+class FakeService(VideoService) :
+    def __init__(self) :
+        self.calls = []
+
+    def addToPlaylist(self, video, playlist) :
+        self.calls.append(('add', video))
+        return 'item-' + video
+
+    def removeFromPlaylist(self, video, playlist) :
+        self.calls.append(('remove', video))
+        return 'item-' + video
+
+class ListPlaylist(VideoPlaylist) :
+    def __init__(self, service, videos) :
+        VideoPlaylist.__init__(self, service, {})
+        self.videos = list(videos)
+
+    def result(self) :
+        return self.videos
+
+    def applyUpdate(self, video, include, result) :
+        if include :
+            self.videos.append(video)
+        else :
+            self.videos.remove(video)
+
+class VideoPlaylistTest(unittest.TestCase) :
+    def setUp(self) :
+        self.service = FakeService()
+        self.updates = []
+
+    def test_update(self) :
+        playlist = ListPlaylist(self.service, ['a'])
+        playlist.setUpdateListener(lambda video, include : self.updates.append((video, include)))
+
+        playlist.update('b', True)
+        playlist.update('a', False)
+
+        self.assertEqual(self.service.calls, [('add', 'b'), ('remove', 'a')])
+        self.assertEqual(playlist.result(), ['b'])
+        self.assertEqual(self.updates, [('b', True), ('a', False)])
+
+    def test_noListener(self) :
+        playlist = ListPlaylist(self.service, [])
+        playlist.update('a', True)
+        self.assertTrue(playlist.contains('a'))
+
+    def test_composite(self) :
+        first = ListPlaylist(self.service, ['a'])
+        second = ListPlaylist(self.service, ['b'])
+        composite = CompositeVideoPlaylist()
+        composite.addPlaylist(first)
+        composite.addPlaylist(second)
+        composite.videos = ['a', 'b']
+        composite.setUpdateListener(lambda video, include : self.updates.append(list(composite.result())))
+
+        second.update('c', True)
+
+        self.assertEqual(self.updates, [['a', 'b', 'c']])
+        self.assertTrue(composite.contains('c'))
+        self.assertFalse(composite.contains('d'))
+
+    def test_compositeCached(self) :
+        first = ListPlaylist(self.service, ['a'])
+        first.cached = lambda : ['x']
+        composite = CompositeVideoPlaylist()
+        composite.addPlaylist(first)
+        composite.addPlaylist(ListPlaylist(self.service, ['b']))
+
+        self.assertEqual(composite.cached(), ['x'])
+        self.assertEqual(composite.result(), ['x'])
+
+    def test_compositeBackground(self) :
+        entered = []
+        other = FakeService()
+        self.service.background = lambda : Marker(entered, 'first')
+        other.background = lambda : Marker(entered, 'second')
+        composite = CompositeVideoPlaylist()
+        composite.addPlaylist(ListPlaylist(self.service, []))
+        composite.addPlaylist(ListPlaylist(other, []))
+
+        with composite.background() :
+            self.assertEqual(entered, ['first', 'second'])
+
+        self.assertEqual(entered, [])
+
+class Marker :
+    def __init__(self, entered, name) :
+        self.entered = entered
+        self.name = name
+
+    def __enter__(self) :
+        self.entered.append(self.name)
+
+    def __exit__(self, *error) :
+        self.entered.remove(self.name)
+
+if __name__ == '__main__':
+    unittest.main()
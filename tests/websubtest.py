@@ -0,0 +1,75 @@
+from WebSub import WebSubReceiver
+from fakehub import FakeHub
+from Queue import Queue
+import unittest
+import urllib2
+
+NOTIFICATION = '''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom"
+      xmlns:at="http://purl.org/atompub/tombstones/1.0">
+  %s
+</feed>'''
+ENTRY = '<entry><yt:videoId>%s</yt:videoId><yt:channelId>%s</yt:channelId></entry>'
+DELETED = '<at:deleted-entry ref="yt:video:%s" when="2015-03-09T19:05:24.552394234+00:00"/>'
+TOPIC = 'https://www.youtube.com/feeds/videos.xml?channel_id=c1'
+
+class WebSubTest(unittest.TestCase) :
+    def setUp(self) :
+        self.hub = FakeHub()
+        self.notifications = []
+        self.submitted = Queue()
+        listener = lambda videos, deleted : self.notifications.append((videos, deleted))
+        submit = lambda function, *args : self.submitted.put((function, args))
+        self.receiver = WebSubReceiver(self.hub.url(), None, 0, listener, 'secret', 3600 * 24, submit)
+        self.receiver.callbackUrl = 'http://127.0.0.1:%d/callback' % self.receiver.port()
+        self.receiver.start()
+
+    def tearDown(self) :
+        self.receiver.stop()
+        self.hub.close()
+
+    def subscribe(self) :
+        self.receiver.subscribe(TOPIC)
+        self.assertTrue(self.hub.waitFor(TOPIC))
+
+    def test_subscribe(self) :
+        self.subscribe()
+
+        self.assertTrue(self.receiver.subscribed(TOPIC))
+        stats = self.receiver.stats()
+        self.assertEqual(stats['verified'], 1)
+        self.assertEqual(stats['active'], 1)
+
+    def test_unsubscribe(self) :
+        self.subscribe()
+        self.receiver.unsubscribe(TOPIC)
+
+        self.assertTrue(self.hub.waitFor(TOPIC, False))
+        self.assertFalse(self.receiver.subscribed(TOPIC))
+
+    def test_notify(self) :
+        self.subscribe()
+        status = self.hub.publish(TOPIC, NOTIFICATION % (ENTRY % ('v1', 'c1') + DELETED % 'v2'))
+
+        #The hub is answered before the notification is looked at
+        self.assertEqual(status, 204)
+        self.assertEqual(self.notifications, [])
+
+        function, args = self.submitted.get(timeout=5)
+        function(*args)
+        self.assertEqual(self.notifications, [([('v1', 'c1')], ['v2'])])
+
+    def test_badSignature(self) :
+        self.subscribe()
+        self.hub.publish(TOPIC, NOTIFICATION % (ENTRY % ('v1', 'c1')), 'wrong')
+
+        self.assertTrue(self.submitted.empty())
+        self.assertEqual(self.receiver.stats()['rejected'], 1)
+
+    def test_unrequested(self) :
+        url = self.receiver.callbackUrl + '?hub.mode=subscribe&hub.topic=other&hub.challenge=x'
+        self.assertRaises(urllib2.HTTPError, urllib2.urlopen, url)
+        self.assertFalse(self.receiver.subscribed('other'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+from WorkerPool import WorkerPool, TaskTimeoutError
+import unittest
+import time
+
+class WorkerPoolTest(unittest.TestCase) :
+    def setUp(self) :
+        self.pool = WorkerPool(2, 0.5)
+
+    def tearDown(self) :
+        self.pool.shutdown()
+
+    def test_result(self) :
+        future = self.pool.submit(lambda x, y : x + y, 2, 3)
+        self.assertEqual(future.result(1), 5)
+
+    def test_errorIsolation(self) :
+        failed = self.pool.submit(lambda : 1 / 0)
+        passed = self.pool.submit(lambda : 'ok')
+
+        self.assertRaises(ZeroDivisionError, failed.result, 1)
+        self.assertEqual(passed.result(1), 'ok')
+
+    def test_taskTimeout(self) :
+        future = self.pool.submit(time.sleep, 2)
+        self.assertRaises(TaskTimeoutError, future.result, 1)
+
+    def test_asCompleted(self) :
+        futures = self.pool.map(lambda delay : time.sleep(delay) or delay, [0.3, 0.0, 0.1])
+        order = [future.result() for future in WorkerPool.asCompleted(futures)]
+
+        self.assertEqual(sorted(order), [0.0, 0.1, 0.3])
+        self.assertEqual(order[0], 0.0)
+
+    def test_boundedConcurrency(self) :
+        running = []
+        peak = []
+
+        def task(value) :
+            running.append(value)
+            peak.append(len(running))
+            time.sleep(0.05)
+            running.remove(value)
+
+        for future in WorkerPool.asCompleted(self.pool.map(task, range(8))) :
+            future.result()
+
+        self.assertTrue(max(peak) <= 2)
+
+if __name__ == '__main__':
+    unittest.main()
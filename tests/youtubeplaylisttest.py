@@ -0,0 +1,330 @@
+from YouTube import YouTubeService, YouTubeVideoPlaylist, YouTubePlaylistResult, PlaylistItemNotFoundError
+from YouTube import YouTubeSubscriptionPlaylistV2
+import YouTube
+from MutationQueue import Mutation
+from contextlib import contextmanager
+from Catalog import Catalog
+from VideoIndex import VideoIndex
+import unittest
+import tempfile
+import shutil
+import os.path
+
+class FakeVideo :
+    def __init__(self, id) :
+        self.values = (id,)
+
+    def id(self) :
+        return self.values[0]
+
+    def channelId(self) :
+        return 'channel'
+
+    def uploadEpoch(self) :
+        return 0
+
+    def available(self) :
+        return True
+
+class FakeCall :
+    def __init__(self, itemIds, total, pageToken=None) :
+        self.items = [{ 'id' : itemId } for itemId in itemIds]
+        self.total = total
+        self.pageToken = pageToken
+
+class FakeSettings :
+    def get(self, name, default) :
+        return default
+
+class FakeVideos :
+    def __init__(self) :
+        self.stored = dict()
+
+    def fetch(self, ids) :
+        return dict((id, self.stored[id]) for id in ids if id in self.stored)
+
+class FakeManager :
+    def __init__(self) :
+        self.rejections = []
+
+    def addVideo(self, video) :
+        pass
+
+    def rejected(self, video, playlist, include) :
+        self.rejections.append((video.id(), playlist.id(), include))
+
+class FakeLimiter :
+    @contextmanager
+    def background(self) :
+        yield
+
+class FakeService :
+    """Serves a playlist whose item i<n> holds video v<n>."""
+    def __init__(self, catalog) :
+        self.catalog = catalog
+        self.index = VideoIndex()
+        self.videos = FakeVideos()
+        self.settings = FakeSettings()
+        self.remote = []
+        self.listings = 0
+
+    def result(self, itemIds, incremental, pageToken=None) :
+        items = dict((itemId, FakeVideo('v' + itemId[1:])) for itemId in itemIds)
+        return YouTubePlaylistResult(FakeCall(itemIds, len(self.remote), pageToken), items, incremental)
+
+    def executePlaylistRequest(self, playlistId, maxResults, known=None, pageToken=None) :
+        if known is None :
+            #Page tokens are just the offset of the page
+            offset = int(pageToken or 0)
+            end = offset + maxResults
+            return self.result(self.remote[offset:end], False, str(end) if len(self.remote) > end else None)
+
+        #Page until an item we already have, like the real incremental sync
+        itemIds = []
+        for itemId in self.remote :
+            itemIds.append(itemId)
+            if itemId in known :
+                break
+        return self.result(itemIds, True)
+
+    def manager(self) :
+        return FakeManager()
+
+    def playlistListing(self, playlistId) :
+        self.listings += 1
+        return [(itemId, 'v' + itemId[1:]) for itemId in self.remote]
+
+    def fetchVideos(self, playlist, videoId, playlistId) :
+        return dict((playlistId(item), FakeVideo(videoId(item))) for item in playlist)
+
+class YouTubeVideoPlaylistTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.dir, 'catalog.db'))
+        self.service = FakeService(self.catalog)
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 50)
+
+    def tearDown(self) :
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def order(self) :
+        return [video.id() for video in self.playlist.result()]
+
+    def sync(self, remote) :
+        self.service.remote = remote
+        self.playlist.execute()
+        self.assertEqual(self.catalog.playlist('p')[1], self.playlist.pairs())
+
+    def test_prepend(self) :
+        self.sync(['i2', 'i1'])
+        self.sync(['i4', 'i3', 'i2', 'i1'])
+
+        self.assertEqual(self.order(), ['v4', 'v3', 'v2', 'v1'])
+        self.assertEqual(self.service.listings, 0)
+
+    def test_append(self) :
+        self.service.remote = ['i%d' % count for count in range(3)]
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 2)
+        self.playlist.execute()
+        self.assertTrue(self.playlist.hasMore())
+
+        self.service.executePlaylistRequest = lambda *args : self.service.result(['i2'], False)
+        self.playlist.fetchMore()
+
+        self.assertEqual(self.order(), ['v0', 'v1', 'v2'])
+        self.assertTrue(self.playlist.complete())
+
+    def test_resume(self) :
+        self.service.remote = ['i%d' % count for count in range(3)]
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 2)
+        self.playlist.execute()
+        self.service.videos.stored = dict((video.id(), video) for video in self.playlist.result())
+
+        #Opened again later, the rest carries on from the saved page token
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 2)
+        self.playlist.restore(*self.catalog.playlist('p'))
+        self.assertTrue(self.playlist.hasMore())
+
+        self.assertEqual([video.id() for video in self.playlist.fetchMore()], ['v2'])
+        self.assertEqual(self.order(), ['v0', 'v1', 'v2'])
+        self.assertTrue(self.playlist.complete())
+        self.assertEqual(self.catalog.playlist('p')[0], { 'pageToken' : None })
+
+    def test_unpaged(self) :
+        self.service.remote = ['i%d' % count for count in range(5)]
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 2, False)
+        self.playlist.execute()
+
+        #Membership is known for every item, not just the first page
+        self.assertEqual(self.order(), ['v0', 'v1', 'v2', 'v3', 'v4'])
+        self.assertTrue(self.playlist.contains(FakeVideo('v4')))
+        self.assertEqual(self.playlist.playlistId('v4'), 'i4')
+
+    def test_removal(self) :
+        self.sync(['i3', 'i2', 'i1'])
+        self.sync(['i4', 'i3', 'i1'])
+
+        #Only the removed item goes, the rest of what was loaded stays
+        self.assertEqual(self.order(), ['v4', 'v3', 'v1'])
+        self.assertEqual(self.service.listings, 1)
+
+    def test_partialRemoval(self) :
+        self.service.remote = ['i%d' % count for count in range(5)]
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 2)
+        self.playlist.execute()
+        self.playlist.fetchMore()
+
+        #Loaded up to i3 with a token at offset 4, then i1 goes
+        self.sync(['i0', 'i2', 'i3', 'i4'])
+        self.assertEqual(self.order(), ['v0', 'v2'])
+
+        self.playlist.loadAll()
+        self.assertEqual(self.order(), ['v0', 'v2', 'v3', 'v4'])
+
+    def test_partialUnchanged(self) :
+        self.service.remote = ['i%d' % count for count in range(5)]
+        self.playlist = YouTubeVideoPlaylist(self.service, 'p', 2)
+        self.playlist.execute()
+        self.playlist.fetchMore()
+
+        #The first page is the same, so the pages after it are kept
+        self.sync(list(self.service.remote))
+        self.assertEqual(self.order(), ['v0', 'v1', 'v2', 'v3'])
+        self.assertEqual(self.catalog.playlist('p')[0], { 'pageToken' : '4' })
+
+    def test_restoreMissing(self) :
+        self.service.videos.stored['v2'] = FakeVideo('v2')
+        self.playlist.restore({}, [('i2', 'v2'), ('i1', 'v1')])
+
+        #The gone video keeps its place so the next sync still lines up
+        self.assertEqual(self.order(), ['v2', 'v1'])
+        self.assertFalse(self.playlist.result()[1].available())
+
+FEED = '<feed xmlns="http://www.w3.org/2005/Atom">%s</feed>'
+ENTRY = '<entry><id>http://gdata.youtube.com/feeds/api/videos/%s</id><title>Video</title></entry>'
+
+class SlowFeed :
+    """A feed response that arrives a little at a time."""
+    def __init__(self, ids) :
+        self.data = FEED % ''.join([ENTRY % id for id in ids])
+        self.position = 0
+        self.closed = False
+
+    def read(self, size=-1) :
+        end = self.position + min(size if size > 0 else len(self.data), 256)
+        data = self.data[self.position:end]
+        self.position += len(data)
+        return data
+
+    def close(self) :
+        self.closed = True
+
+class FakeFuture :
+    def __init__(self, value) :
+        self.value = value
+
+    def result(self) :
+        return self.value
+
+class FeedService :
+    def __init__(self, feed, failAt=None) :
+        self.feed = feed
+        self.failAt = failAt
+        self.workers = self
+        self.submitted = []
+        self.stored = None
+
+    def submit(self, function, ids, videoId, playlistId) :
+        #How much of the feed had arrived when the lookup went out
+        self.submitted.append((list(ids), self.feed.position))
+        if len(self.submitted) == self.failAt :
+            raise IOError('lookup failed')
+        return FakeFuture(function(ids, videoId, playlistId))
+
+    def fetchVideos(self, ids, videoId, playlistId) :
+        return dict((id, FakeVideo(id)) for id in ids)
+
+    def storeFeed(self, id, videos) :
+        self.stored = [video.id() for video in videos]
+
+class SubscriptionFeedV2Test(unittest.TestCase) :
+    def setUp(self) :
+        self.urlopen = YouTube.urllib2.urlopen
+
+    def tearDown(self) :
+        YouTube.urllib2.urlopen = self.urlopen
+
+    def execute(self, ids, failAt=None) :
+        feed = SlowFeed(ids)
+        YouTube.urllib2.urlopen = lambda url : feed
+        service = FeedService(feed, failAt)
+        playlist = YouTubeSubscriptionPlaylistV2(service, 'user')
+        return playlist, service, feed
+
+    def test_streaming(self) :
+        ids = ['%011d' % count for count in range(120)]
+        playlist, service, feed = self.execute(ids + ids[:5])
+        playlist.execute()
+
+        #Repeats dropped, 50 to a lookup and the first sent well before the feed was read
+        self.assertEqual([len(chunk) for chunk, position in service.submitted], [50, 50, 20])
+        self.assertTrue(service.submitted[0][1] < len(feed.data) / 2)
+        self.assertEqual([video.id() for video in playlist.result()], ids)
+        self.assertEqual(service.stored, ids)
+        self.assertTrue(feed.closed)
+
+    def test_earlyTermination(self) :
+        playlist, service, feed = self.execute(['%011d' % count for count in range(200)], 2)
+
+        #A failed lookup stops reading, and the response is still closed
+        self.assertRaises(IOError, playlist.execute)
+        self.assertEqual(len(service.submitted), 2)
+        self.assertTrue(feed.position < len(feed.data))
+        self.assertTrue(feed.closed)
+        self.assertEqual(service.stored, None)
+
+    def test_chunks(self) :
+        feed = SlowFeed(['%011d' % count for count in range(3)])
+        playlist = YouTubeSubscriptionPlaylistV2(None, 'user')
+        self.assertEqual(list(playlist.videoIds(feed, 2)), [['00000000000', '00000000001'], ['00000000002']])
+
+class MutationService(YouTubeService) :
+    #Only what the mutation callbacks use, the rest of the service needs credentials
+    def __init__(self, playlist) :
+        self.limiter = FakeLimiter()
+        self.videos = { 'v1' : FakeVideo('v1') }
+        self.rejections = FakeManager()
+        self.playlists = { playlist.id() : playlist }
+
+    def manager(self) :
+        return self.rejections
+
+    def playlist(self, id) :
+        return self.playlists[id]
+
+class MutationTest(unittest.TestCase) :
+    def setUp(self) :
+        self.dir = tempfile.mkdtemp()
+        self.catalog = Catalog(os.path.join(self.dir, 'catalog.db'))
+        fake = FakeService(self.catalog)
+        fake.remote = ['i2']
+        self.playlist = YouTubeVideoPlaylist(fake, 'p', 50)
+        self.service = MutationService(self.playlist)
+
+    def tearDown(self) :
+        self.catalog.close()
+        shutil.rmtree(self.dir)
+
+    def test_missingItem(self) :
+        #Nothing to remove is a failure, not a change that went through
+        mutation = Mutation(1, 'p', 'v1', False)
+        self.assertRaises(PlaylistItemNotFoundError, self.service.executeMutation, mutation)
+        self.assertFalse(YouTubeService.isTransient(PlaylistItemNotFoundError()))
+
+    def test_rejected(self) :
+        self.service.mutationDone(Mutation(1, 'p', 'v1', True), None, PlaylistItemNotFoundError())
+        self.assertEqual(self.service.rejections.rejections, [('v1', 'p', True)])
+
+if __name__ == '__main__':
+    unittest.main()